@@ -0,0 +1,225 @@
+# Python Modules
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+# Project Modules
+from acquisition_scheduler import AcquisitionScheduler
+from message_handler import MessageType
+from shm_ring_buffer import SharedRingBuffer
+from state_block import StateBlock
+
+def runAcquisition(ringName, sensorSpecs, numWorkers, stateBlockName, cpus, realtimeProfile, latencyReportPeriod,
+                   stopEvent):
+    """
+    Entry point of the acquisition process. Runs every sensor from an acquisition
+    scheduler, publishing their messages into the shared ring buffer.
+
+    @param ringName:       The name of the shared ring buffer
+    @param sensorSpecs:    List of (sensor class, keyword arguments) tuples
+    @param numWorkers:     The number of worker threads that perform sensor reads
+    @param stateBlockName: The name of the shared memory state block, or None
+    @param cpus:           The CPUs to pin the process to, or None to leave it unpinned
+    @param realtimeProfile: The scheduling options applied to the acquisition threads, or None
+    @param latencyReportPeriod: The time between printed read latency reports (seconds), or None
+    @param stopEvent:      The event set by the network process to stop acquisition
+
+    @return None
+    """
+
+    # The network process handles interrupts and stops acquisition through the stop event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+
+    ringBuffer = SharedRingBuffer(ringName)
+
+    stateBlock = None
+
+    if stateBlockName is not None:
+        stateBlock = StateBlock(stateBlockName)
+
+    # The shared ring buffer stands in for the ring buffer of each sensor
+    acquisitionScheduler = AcquisitionScheduler(numWorkers=numWorkers, stateBlock=stateBlock,
+                                                realtimeProfile=realtimeProfile,
+                                                latencyReportPeriod=latencyReportPeriod)
+
+    for sensorClass, sensorArgs in sensorSpecs:
+        acquisitionScheduler.addSensor(sensorClass(ringBuffer, **sensorArgs))
+
+    # Report the initial state of each sensor so the network process knows about every sensor
+    for sensorStatus in acquisitionScheduler.getSensorStatuses():
+        ringBuffer.put(json.dumps(sensorStatus), MessageType.STATUS_MESSAGE)
+
+    acquisitionScheduler.start()
+
+    stopEvent.wait()
+
+    acquisitionScheduler.shutdownEvent.set()
+    acquisitionScheduler.join()
+
+    if stateBlock is not None:
+        stateBlock.close()
+
+    ringBuffer.close()
+
+class AcquisitionProcess(threading.Thread):
+    """
+    Runs sensor acquisition in a separate process, so sensor reads never compete with the
+    network code for the interpreter. The acquisition process publishes messages into a
+    shared memory ring buffer, which this thread drains onto an in process ring buffer.
+    """
+
+    # Time between ring buffer reads (seconds)
+    _pollPeriod = 0.005
+
+    # Time to wait before restarting an acquisition process that exited unexpectedly
+    _restartPeriod = 5
+
+    # Time to wait for the acquisition process to stop before terminating it
+    _stopTimeout = 5
+
+    def __init__(self, ringBuffer, sensorSpecs, numWorkers=0, stateBlockName=None, cpus=None,
+                 realtimeProfile=None, latencyReportPeriod=None, ringName='rpi_acquisition', ringCapacity=1024):
+        """
+        Constructor
+
+        @param ringBuffer:     The ring buffer to place sensor messages on
+        @param sensorSpecs:    List of (sensor class, keyword arguments) tuples used to create
+                               the sensors in the acquisition process (the shared ring buffer
+                               is passed as the first argument)
+        @param numWorkers:     The number of worker threads that perform sensor reads
+        @param stateBlockName: The name of the shared memory state block sensors write to, or None
+        @param cpus:           The CPUs to pin the acquisition process to, or None to leave it unpinned
+        @param realtimeProfile: The scheduling options applied to the acquisition threads, or None
+        @param latencyReportPeriod: The time between printed read latency reports (seconds), or None
+        @param ringName:       The name of the shared ring buffer
+        @param ringCapacity:   The number of messages the ring buffer holds
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        self.shutdownEvent = threading.Event()
+
+        self._ringBuffer = ringBuffer
+        self._sensorSpecs = sensorSpecs
+        self._numWorkers = numWorkers
+        self._stateBlockName = stateBlockName
+        self._cpus = cpus
+        self._realtimeProfile = realtimeProfile
+        self._latencyReportPeriod = latencyReportPeriod
+        self._ringName = ringName
+
+        self._sharedRingBuffer = SharedRingBuffer(ringName, capacity=ringCapacity, create=True)
+
+        # Start the acquisition process from a fresh interpreter rather than forking the threads of this one
+        self._context = multiprocessing.get_context('spawn')
+        self._stopEvent = self._context.Event()
+        self._process = None
+
+        # Latest status of each sensor, taken from the status messages of the acquisition process
+        self._sensorStatuses = {}
+
+    def getSensorStatuses(self):
+        """
+        Retrieves the status of every sensor
+
+        @param None
+
+        @return List of sensor statuses (dictionaries)
+        """
+
+        return list(self._sensorStatuses.values())
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        self.__startProcess()
+
+        while not self.shutdownEvent.is_set():
+            self.__drain()
+
+            if not self._process.is_alive():
+                print('Acquisition process exited with code %s. Restarting it in %d seconds.' %
+                      (self._process.exitcode, AcquisitionProcess._restartPeriod))
+
+                if self.shutdownEvent.wait(AcquisitionProcess._restartPeriod):
+                    break
+
+                self.__startProcess()
+
+            time.sleep(AcquisitionProcess._pollPeriod)
+
+        # Cleanup
+        self.__shutdown()
+
+    def __startProcess(self):
+        """
+        Starts the acquisition process
+
+        @param None
+
+        @return None
+        """
+
+        self._process = self._context.Process(target=runAcquisition,
+                                              args=(self._ringName, self._sensorSpecs, self._numWorkers,
+                                                    self._stateBlockName, self._cpus, self._realtimeProfile,
+                                                    self._latencyReportPeriod, self._stopEvent),
+                                              daemon=True)
+        self._process.start()
+
+    def __drain(self):
+        """
+        Moves every message in the shared ring buffer onto the in process ring buffer
+
+        @param None
+
+        @return None
+        """
+
+        for msgData, msgType, timestamp in self._sharedRingBuffer.read():
+            if msgType == MessageType.STATUS_MESSAGE:
+                sensorStatus = json.loads(msgData)
+
+                self._sensorStatuses[sensorStatus['sensor']] = sensorStatus
+
+            self._ringBuffer.put(msgData, msgType, timestamp)
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        self._stopEvent.set()
+
+        self._process.join(AcquisitionProcess._stopTimeout)
+
+        if self._process.is_alive():
+            print('Acquisition process did not stop. Terminating it.')
+
+            self._process.terminate()
+            self._process.join()
+
+        self.__drain()
+
+        if self._sharedRingBuffer.numDropped:
+            print('Acquisition ring buffer dropped %d messages' % self._sharedRingBuffer.numDropped)
+
+        self._sharedRingBuffer.close()
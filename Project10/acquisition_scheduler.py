@@ -0,0 +1,559 @@
+# Python Modules
+import array
+import heapq
+import itertools
+import json
+import math
+import select
+import socket
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Project Modules
+from message_handler import MessageType
+
+class SensorState(object):
+    """
+    Enum class that holds the different sensor states reported to clients
+    """
+
+    INITIALIZING = 'initializing'
+    READY = 'ready'
+    DOWN = 'down'
+    FAILED = 'failed'
+
+class Sensor(object):
+    """
+    Base class for sensors run by the acquisition scheduler
+    """
+
+    def __init__(self, ringBuffer, name, readPeriod, priority=0):
+        """
+        Constructor
+
+        @param ringBuffer The ring buffer to place sensor messages on (the sensor is its only producer)
+        @param name       The sensor name
+        @param readPeriod The time between reads (seconds)
+        @param priority   The sensor priority (lower values run first when reads are due together)
+
+        @return None
+        """
+
+        self.name = name
+        self.readPeriod = readPeriod
+        self.priority = priority
+        self.state = SensorState.INITIALIZING
+
+        # Shared memory block local consumers read the latest state from (set by the scheduler)
+        self.stateBlock = None
+
+        self._ringBuffer = ringBuffer
+
+    def open(self):
+        """
+        Initializes the sensor. Called in the background, so it may block. Raising
+        an exception marks the sensor as failed and the open is retried later.
+
+        @param None
+
+        @return None
+        """
+
+        pass
+
+    def poll(self):
+        """
+        Performs one read of the sensor. Must not block for longer than the read period.
+
+        @param None
+
+        @return The delay until the next read (seconds), or None to use the read period
+        """
+
+        raise NotImplementedError
+
+    def fileno(self):
+        """
+        Retrieves a file descriptor that becomes readable when the sensor has data, so the
+        scheduler reads the sensor as soon as data arrives instead of at the next read period
+
+        @param None
+
+        @return The file descriptor, or None to only read the sensor every read period
+        """
+
+        return None
+
+    def close(self):
+        """
+        Performs shutdown procedures for the sensor
+
+        @param None
+
+        @return None
+        """
+
+        pass
+
+    def publish(self, msgData, msgType):
+        """
+        Places a message on the ring buffer
+
+        @param msgData: The message data (dictionary or string)
+        @param msgType: The type of message
+
+        @return None
+        """
+
+        now = time.monotonic()
+
+        if isinstance(msgData, dict):
+            if self.stateBlock is not None:
+                self.stateBlock.update(msgType, msgData, now)
+
+            msgData = json.dumps(msgData)
+
+        self._ringBuffer.put(msgData, msgType, now)
+
+    def setState(self, state):
+        """
+        Sets the sensor state, reporting it to clients if it changed
+
+        @param state: The sensor state
+
+        @return None
+        """
+
+        if state != self.state:
+            self.state = state
+
+            self.publish(self.getStatus(), MessageType.STATUS_MESSAGE)
+
+    def getStatus(self):
+        """
+        Retrieves the sensor status reported to clients
+
+        @param None
+
+        @return The sensor status (dictionary)
+        """
+
+        return {'sensor': self.name, 'state': self.state}
+
+class LatencyStats(object):
+    """
+    Collects how late sensor reads start compared to when they were due, in bounded memory
+    since nothing may ask for a summary
+    """
+
+    # Number of most recent latencies the 99th percentile is taken from
+    _recentSize = 4096
+
+    def __init__(self):
+        """
+        Constructor
+
+        @param None
+
+        @return None
+        """
+
+        self.__reset()
+
+    def add(self, latency):
+        """
+        Records the latency of a read
+
+        @param latency: The time between the read being due and starting (seconds)
+
+        @return None
+        """
+
+        # Running mean and sum of squared differences from it (Welford)
+        self._count += 1
+        delta = latency - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (latency - self._mean)
+        self._max = max(self._max, latency)
+
+        if len(self._recent) < LatencyStats._recentSize:
+            self._recent.append(latency)
+        else:
+            self._recent[self._recentIndex] = latency
+            self._recentIndex = (self._recentIndex + 1) % LatencyStats._recentSize
+
+    def getSummary(self):
+        """
+        Summarizes the latencies recorded since the last summary and starts collecting anew
+
+        @param None
+
+        @return Dictionary of the number of reads and the mean, 99th percentile (of the most
+                recent reads), maximum and standard deviation (jitter) of their latencies
+                (milliseconds), or None if no reads were recorded
+        """
+
+        if self._count == 0:
+            return None
+
+        recent = sorted(self._recent)
+
+        summary = {
+            'reads': self._count,
+            'mean': self._mean * 1000,
+            'p99': recent[min(int(len(recent) * 0.99), len(recent) - 1)] * 1000,
+            'max': self._max * 1000,
+            'jitter': math.sqrt(self._m2 / self._count) * 1000,
+        }
+
+        self.__reset()
+
+        return summary
+
+    def __reset(self):
+        """
+        Discards the recorded latencies
+
+        @param None
+
+        @return None
+        """
+
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._max = float('-inf')
+
+        # Ring of the most recent latencies, overwritten oldest first once full
+        self._recent = array.array('d')
+        self._recentIndex = 0
+
+class AcquisitionScheduler(threading.Thread):
+    """
+    Runs the reads of every sensor from a single timer queue
+    """
+
+    _maxSleep = 0.5
+
+    # Time to wait before retrying a sensor that failed to open
+    _openRetryPeriod = 5
+
+    def __init__(self, numWorkers=0, stateBlock=None, realtimeProfile=None, latencyReportPeriod=None):
+        """
+        Constructor
+
+        @param numWorkers:          The number of worker threads that perform sensor reads
+                                    (0 performs the reads on the scheduler thread)
+        @param stateBlock:          The shared memory block sensors write their latest state to, or None
+        @param realtimeProfile:     The scheduling options applied to the scheduler and worker threads,
+                                    or None for the default scheduling
+        @param latencyReportPeriod: The time between printed read latency reports (seconds),
+                                    or None to only collect them
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        self.shutdownEvent = threading.Event()
+
+        self._numWorkers = numWorkers
+        self._workerPool = None
+        self._stateBlock = stateBlock
+        self._realtimeProfile = realtimeProfile
+        self._latencyReportPeriod = latencyReportPeriod
+
+        # Read latency of each sensor (dictionary of sensor name to LatencyStats)
+        self._latencyStats = {}
+
+        # Timer queue entries are [deadline, priority, order, sensor, action]
+        self._timerQueue = []
+        self._timerQueueMutex = threading.Lock()
+        self._timerOrder = itertools.count()
+
+        # Timer queue entries of the reads waiting to run (dictionary of sensor to entry), so a
+        # sensor whose data arrives early can be read at once
+        self._pendingReads = {}
+
+        # Written to when a sensor is (re)scheduled, to wake the scheduler waiting on sensor data
+        self._wakeReceiver, self._wakeSender = socket.socketpair()
+        self._wakeReceiver.setblocking(False)
+        self._wakeSender.setblocking(False)
+
+        self._sensors = []
+        self._openThreads = []
+
+    def addSensor(self, sensor):
+        """
+        Adds a sensor to the scheduler. Every sensor is opened in the background in
+        parallel, then read as soon as it is ready and every read period after that.
+
+        @param sensor: The sensor
+
+        @return None
+        """
+
+        sensor.stateBlock = self._stateBlock
+
+        self._sensors.append(sensor)
+        self._latencyStats[sensor.name] = LatencyStats()
+
+        self.__schedule(sensor, time.monotonic(), self.__open)
+
+    def getSensorStatuses(self):
+        """
+        Retrieves the status of every sensor
+
+        @param None
+
+        @return List of sensor statuses (dictionaries)
+        """
+
+        return [sensor.getStatus() for sensor in self._sensors]
+
+    def getLatencySummaries(self):
+        """
+        Summarizes the read latency of every sensor since the last summary
+
+        @param None
+
+        @return Dictionary of sensor name to latency summary (see LatencyStats.getSummary)
+        """
+
+        return dict((name, stats.getSummary()) for name, stats in self._latencyStats.items())
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        initializer = None
+
+        if self._realtimeProfile is not None:
+            self._realtimeProfile.apply()
+
+            initializer = self._realtimeProfile.apply
+
+        if self._numWorkers > 0:
+            self._workerPool = ThreadPoolExecutor(max_workers=self._numWorkers, initializer=initializer)
+
+        nextReportTime = None
+
+        if self._latencyReportPeriod is not None:
+            nextReportTime = time.monotonic() + self._latencyReportPeriod
+
+        while not self.shutdownEvent.is_set():
+            if nextReportTime is not None and time.monotonic() >= nextReportTime:
+                self.__reportLatency()
+
+                nextReportTime += self._latencyReportPeriod
+
+            dueSensors = []
+
+            with self._timerQueueMutex:
+                now = time.monotonic()
+
+                # Pop every read that is due
+                while self._timerQueue and self._timerQueue[0][0] <= now:
+                    entry = heapq.heappop(self._timerQueue)
+
+                    if self._pendingReads.get(entry[3]) is entry:
+                        del self._pendingReads[entry[3]]
+
+                    dueSensors.append(entry)
+
+                nextDeadline = self._timerQueue[0][0] if self._timerQueue else None
+
+                # Sensors that signal when their data arrives, while their read is waiting
+                waitSensors = {}
+
+                if not dueSensors:
+                    for sensor in self._pendingReads:
+                        fileno = sensor.fileno()
+
+                        if fileno is not None and fileno >= 0:
+                            waitSensors[fileno] = sensor
+
+            # Sleep until the next read is due, a sensor is (re)scheduled or sensor data arrives
+            if not dueSensors:
+                sleepTime = AcquisitionScheduler._maxSleep
+
+                if nextDeadline is not None:
+                    sleepTime = min(nextDeadline - now, sleepTime)
+
+                if nextReportTime is not None:
+                    sleepTime = min(nextReportTime - now, sleepTime)
+
+                readable = select.select([self._wakeReceiver] + list(waitSensors), [], [], max(sleepTime, 0))[0]
+
+                if self._wakeReceiver in readable:
+                    self._wakeReceiver.recv(4096)
+
+                readSensors = [waitSensors[fileno] for fileno in readable if fileno in waitSensors]
+
+                # Read sensors with data now instead of at their next read period
+                if readSensors:
+                    with self._timerQueueMutex:
+                        now = time.monotonic()
+
+                        for sensor in readSensors:
+                            entry = self._pendingReads.get(sensor)
+
+                            if entry is not None and entry[0] > now:
+                                entry[0] = now
+
+                        heapq.heapify(self._timerQueue)
+
+                continue
+
+            # Reads that are due together run in priority order
+            dueSensors.sort(key=lambda entry: entry[1])
+
+            for deadline, priority, order, sensor, action in dueSensors:
+                if action == self.__open:
+                    # Opens may block, so each one runs on a short lived thread of its own
+                    openThread = threading.Thread(target=self.__open, args=(sensor, deadline))
+                    openThread.start()
+
+                    self._openThreads = [thread for thread in self._openThreads if thread.is_alive()]
+                    self._openThreads.append(openThread)
+                elif self._workerPool is not None:
+                    self._workerPool.submit(action, sensor, deadline)
+                else:
+                    action(sensor, deadline)
+
+        # Cleanup
+        self.__shutdown()
+
+    def __open(self, sensor, deadline):
+        """
+        Opens a sensor and schedules its first read
+
+        @param sensor:   The sensor
+        @param deadline: The time the open was due (monotonic seconds)
+
+        @return None
+        """
+
+        try:
+            sensor.open()
+        except Exception as e:
+            print('Exception while opening sensor %s: %s' % (sensor.name, e))
+
+            sensor.setState(SensorState.FAILED)
+
+            self.__schedule(sensor, time.monotonic() + AcquisitionScheduler._openRetryPeriod, self.__open)
+
+            return
+
+        # Sensors that know they are not ready yet set their own state
+        if sensor.state in (SensorState.INITIALIZING, SensorState.FAILED):
+            sensor.setState(SensorState.READY)
+
+        self.__schedule(sensor, time.monotonic(), self.__read)
+
+    def __read(self, sensor, deadline):
+        """
+        Reads a sensor and schedules its next read
+
+        @param sensor:   The sensor
+        @param deadline: The time the read was due (monotonic seconds)
+
+        @return None
+        """
+
+        self._latencyStats[sensor.name].add(time.monotonic() - deadline)
+
+        delay = None
+
+        try:
+            delay = sensor.poll()
+        except Exception as e:
+            print('Exception while reading sensor %s: %s' % (sensor.name, e))
+
+        now = time.monotonic()
+
+        # Keep a fixed rate unless the sensor asked for a specific delay or has fallen a full period behind
+        if delay is not None:
+            nextDeadline = now + delay
+        else:
+            nextDeadline = deadline + sensor.readPeriod
+
+            if nextDeadline < now:
+                nextDeadline = now + sensor.readPeriod
+
+        self.__schedule(sensor, nextDeadline, self.__read)
+
+    def __reportLatency(self):
+        """
+        Prints the read latency of every sensor since the last report
+
+        @param None
+
+        @return None
+        """
+
+        for name, summary in self.getLatencySummaries().items():
+            if summary is not None:
+                print('Sensor %s read latency over %d reads: mean %.2f ms, p99 %.2f ms, max %.2f ms, jitter %.2f ms' %
+                      (name, summary['reads'], summary['mean'], summary['p99'], summary['max'], summary['jitter']))
+
+    def __schedule(self, sensor, deadline, action):
+        """
+        Places a sensor open or read on the timer queue
+
+        @param sensor:   The sensor
+        @param deadline: The time the action is due (monotonic seconds)
+        @param action:   The action (open or read)
+
+        @return None
+        """
+
+        # A sensor that finishes opening after shutdown is closed but never read
+        if self.shutdownEvent.is_set():
+            return
+
+        entry = [deadline, sensor.priority, next(self._timerOrder), sensor, action]
+
+        with self._timerQueueMutex:
+            heapq.heappush(self._timerQueue, entry)
+
+            if action == self.__read:
+                self._pendingReads[sensor] = entry
+
+        try:
+            self._wakeSender.send(b'\0')
+        # A wake up is already waiting
+        except BlockingIOError:
+            pass
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        if self._workerPool is not None:
+            self._workerPool.shutdown(wait=True)
+
+        # Let any opens in progress finish so their sensors can be closed
+        for openThread in self._openThreads:
+            openThread.join()
+
+        for sensor in self._sensors:
+            try:
+                sensor.close()
+            except Exception as e:
+                print('Exception while closing sensor %s: %s' % (sensor.name, e))
+
+        self._wakeReceiver.close()
+        self._wakeSender.close()
@@ -0,0 +1,243 @@
+# Python Modules
+import collections
+
+# Project Modules
+from message_handler import BinaryPayload, FrameDecoder, MessageType
+
+# Optional Modules (only imported when a batch decoder is created)
+numpy = None
+
+# Consecutive binary messages of one type, decoded together. The samples are a NumPy structured
+# array with the fields of the binary payload (see BinaryPayload), preceded by the seq and sourceId
+# fields when the frames carry them.
+SampleBatch = collections.namedtuple('SampleBatch', ('msgType', 'samples'))
+
+class BatchDecoder(FrameDecoder):
+    """
+    Frame decoder that turns every run of consecutive binary frames of the same type into a
+    single SampleBatch. Frames of a run have the same length, so the whole run is read with
+    one numpy.frombuffer call over a strided view of the received data, without looping over
+    the frames in Python. Binary batch frames are read the same way, one SampleBatch per frame.
+    Other frames are decoded one at a time, as by FrameDecoder.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+
+        @param None
+
+        @return None
+        """
+
+        global numpy
+
+        import numpy
+
+        FrameDecoder.__init__(self)
+
+        # Frame layouts, by type word (message type and flags)
+        self._layouts = {}
+
+    def feed(self, data):
+        """
+        Adds received data and decodes every frame it completes
+
+        @param data: The received data (bytes)
+
+        @return List of SampleBatch records and (msgType, msg, seq, sourceId) tuples, oldest first
+        """
+
+        self._buf += data
+
+        msgs = []
+        offset = 0
+
+        while True:
+            batch = self.__decodeRun(offset)
+
+            if batch is not None:
+                sampleBatch, offset = batch
+                msgs.append(sampleBatch)
+
+                continue
+
+            frame = self._decodeFrame(offset)
+
+            if frame is None:
+                break
+
+            frameMsgs, offset = frame
+            msgs.extend(frameMsgs)
+
+        # Keep the start of the next frame
+        del self._buf[:offset]
+
+        return msgs
+
+    def __decodeRun(self, offset):
+        """
+        Decodes the run of binary frames starting at the specified offset of the buffer
+
+        @param offset: The offset of the first frame
+
+        @return Tuple (SampleBatch, offset of the next frame), or None if there is no complete
+                binary frame at the offset
+        """
+
+        if len(self._buf) - offset < FrameDecoder._headerFormat.size:
+            return None
+
+        msgSize, typeWord = FrameDecoder._headerFormat.unpack_from(self._buf, offset)
+
+        if not typeWord & MessageType.BINARY_FLAG:
+            return None
+
+        layout = self._layouts.get(typeWord)
+
+        if layout is None:
+            layout = self.__createLayout(typeWord)
+
+        # Types without a known binary layout are decoded one frame at a time
+        if layout is None:
+            return None
+
+        if typeWord & MessageType.BATCH_FLAG:
+            return self.__decodeBatchFrame(offset, msgSize, typeWord, layout)
+
+        headerDtype, sampleDtype, batchDtype, frameSize = layout
+
+        msgType = typeWord & ~(MessageType.SEQUENCED_FLAG | MessageType.SOURCE_FLAG | MessageType.BINARY_FLAG)
+
+        # Payloads of another length than the layout are decoded one frame at a time
+        numFrames = (len(self._buf) - offset) // frameSize
+
+        if numFrames == 0 or msgSize != BinaryPayload.formats[msgType].size:
+            return None
+
+        # The run ends at the first frame of another type or length
+        headers = numpy.frombuffer(self._buf, headerDtype, numFrames, offset)
+        mismatches = (headers['type'] != typeWord) | (headers['size'] != msgSize)
+
+        if mismatches.any():
+            numFrames = int(mismatches.argmax())
+
+        # Copy the run out of the receive buffer, which is about to be reused
+        samples = numpy.frombuffer(self._buf, sampleDtype, numFrames, offset).astype(batchDtype)
+
+        return SampleBatch(msgType, samples), offset + numFrames * frameSize
+
+    def __decodeBatchFrame(self, offset, msgSize, typeWord, layout):
+        """
+        Decodes the binary batch frame at the specified offset of the buffer
+
+        @param offset:   The offset of the frame
+        @param msgSize:  The size of the messages packed into the frame (bytes)
+        @param typeWord: The message type and flags of the frame
+        @param layout:   The layout of the frame (see __createLayout)
+
+        @return Tuple (SampleBatch, offset of the next frame), or None if the frame is not
+                complete yet or its size does not match the layout
+        """
+
+        headerDtype, sampleDtype, batchDtype, sampleSize = layout
+
+        start = offset + FrameDecoder._headerFormat.size
+        sourceId = None
+
+        if typeWord & MessageType.SOURCE_FLAG:
+            if len(self._buf) - start < FrameDecoder._sourceFormat.size:
+                return None
+
+            sourceId, = FrameDecoder._sourceFormat.unpack_from(self._buf, start)
+            start += FrameDecoder._sourceFormat.size
+
+        if len(self._buf) - start < msgSize or msgSize % sampleSize:
+            return None
+
+        # The source id is only sent once for the whole batch
+        entries = numpy.frombuffer(self._buf, sampleDtype, msgSize // sampleSize, start)
+        samples = numpy.empty(len(entries), batchDtype)
+
+        for name in sampleDtype.names:
+            samples[name] = entries[name]
+
+        if sourceId is not None:
+            samples['sourceId'] = sourceId
+
+        msgType = typeWord & ~(MessageType.SEQUENCED_FLAG | MessageType.SOURCE_FLAG | MessageType.BINARY_FLAG |
+                               MessageType.BATCH_FLAG)
+
+        return SampleBatch(msgType, samples), start + msgSize
+
+    def __createLayout(self, typeWord):
+        """
+        Creates the NumPy types describing the frames with the specified type word
+
+        @param typeWord: The message type and flags of the frames
+
+        @return Tuple (header type, sample type, batch type, frame size), or None if the
+                message type has no binary layout. For batch frames the header type is None,
+                and the sample type and size describe one message of the batch.
+        """
+
+        msgType = typeWord & ~(MessageType.SEQUENCED_FLAG | MessageType.SOURCE_FLAG | MessageType.BINARY_FLAG |
+                               MessageType.BATCH_FLAG)
+
+        if msgType not in BinaryPayload.fields:
+            return None
+
+        batchFrame = typeWord & MessageType.BATCH_FLAG
+
+        # Header fields are big endian, payload fields little endian
+        names = []
+        formats = []
+        offsets = []
+        offset = 0 if batchFrame else FrameDecoder._headerFormat.size
+
+        # Samples of a batch frame carry their sequence number, but share the frame's source id
+        if typeWord & MessageType.SEQUENCED_FLAG:
+            names.append('seq')
+            formats.append('>u8')
+            offsets.append(offset)
+
+            offset += FrameDecoder._seqFormat.size
+
+        if typeWord & MessageType.SOURCE_FLAG and not batchFrame:
+            names.append('sourceId')
+            formats.append('>u2')
+            offsets.append(offset)
+
+            offset += FrameDecoder._sourceFormat.size
+
+        for name in BinaryPayload.fields[msgType]:
+            names.append(name)
+            formats.append('<f8')
+            offsets.append(offset)
+
+            offset += 8
+
+        frameSize = offset
+
+        # Views of the frames in the receive buffer, one element per frame
+        headerDtype = None
+
+        if not batchFrame:
+            headerDtype = numpy.dtype({'names': ['size', 'type'], 'formats': ['>u4', '>u4'], 'offsets': [0, 4],
+                                       'itemsize': frameSize})
+
+        sampleDtype = numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': frameSize})
+
+        # Packed, native byte order copy handed to the client
+        batchFields = [(name, fmt.replace('>', '=').replace('<', '=')) for name, fmt in zip(names, formats)]
+
+        if typeWord & MessageType.SOURCE_FLAG and batchFrame:
+            batchFields.insert(1 if typeWord & MessageType.SEQUENCED_FLAG else 0, ('sourceId', '=u2'))
+
+        batchDtype = numpy.dtype(batchFields)
+
+        layout = (headerDtype, sampleDtype, batchDtype, frameSize)
+
+        self._layouts[typeWord] = layout
+
+        return layout
@@ -0,0 +1,402 @@
+# Python Modules
+import array
+import time
+
+# Project Modules
+from message_handler import MessageType
+
+class Transport(object):
+    """
+    Enum class that holds the different transports clients can connect over
+    """
+
+    WIFI = 'wifi'
+    BLUETOOTH = 'bluetooth'
+    LOCAL = 'local'
+
+class SendPolicy(object):
+    """
+    Class that holds how often each message type is sent over a transport
+    """
+
+    def __init__(self, maxRates=None, minRates=None):
+        """
+        Constructor
+
+        @param maxRates: The maximum send rate of each message type (dictionary of Hz,
+                         0 never sends the type, missing types are sent at their full rate)
+        @param minRates: The rate each message type may be lowered to when a client's link
+                         is congested (dictionary of Hz, missing types are never lowered)
+
+        @return None
+        """
+
+        self.maxRates = dict(maxRates or {})
+        self.minRates = dict(minRates or {})
+
+        self._minIntervals = {}
+
+        for msgType, maxRate in self.maxRates.items():
+            self._minIntervals[msgType] = 1.0 / maxRate if maxRate > 0 else None
+
+    def getMinInterval(self, msgType):
+        """
+        Retrieves the minimum time between messages of the specified type
+
+        @param msgType: The type of message
+
+        @return The minimum interval (seconds), 0 if the type is not limited,
+                or None if the type is never sent
+        """
+
+        return self._minIntervals.get(msgType, 0)
+
+# Default send policies, tuned to the bandwidth of each transport
+DEFAULT_SEND_POLICIES = {
+    Transport.WIFI: SendPolicy(minRates={
+        MessageType.GPS_MESSAGE: 1,
+        MessageType.RPY_MESSAGE: 10,
+        MessageType.NMEA_MESSAGE: 1,
+    }),
+    Transport.BLUETOOTH: SendPolicy({
+        MessageType.RPY_MESSAGE: 10,
+        MessageType.NMEA_MESSAGE: 0,
+    }, {
+        MessageType.GPS_MESSAGE: 1,
+        MessageType.RPY_MESSAGE: 2,
+    }),
+    Transport.LOCAL: SendPolicy(),
+}
+
+class ClientConnection(object):
+    """
+    Class that holds the state of a connected client
+    """
+
+    # Time between link capacity estimates (seconds)
+    _estimationPeriod = 0.5
+
+    # Unsent bytes queued in the kernel above which the link is considered congested
+    _maxQueuedBytes = 4096
+
+    # Average send completion time above which the link is considered congested (seconds)
+    _maxSendTime = 0.005
+
+    # Number of uncongested estimates required before rates are raised again
+    _recoveryPeriods = 4
+
+    # Factors applied to a lowered rate when the link is congested or recovering
+    _decreaseFactor = 0.5
+    _increaseFactor = 1.5
+
+    # Time a new client has to send its resume request before it is sent plain frames (seconds)
+    _resumeGracePeriod = 1.0
+
+    def __init__(self, sock, transport, sendPolicy, address=None):
+        """
+        Constructor
+
+        @param sock:       The client socket
+        @param transport:  The transport the client connected over
+        @param sendPolicy: The send policy for the client
+        @param address:    The client address
+
+        @return None
+        """
+
+        self.sock = sock
+        self.transport = transport
+        self.sendPolicy = sendPolicy
+        self.address = address
+
+        # Estimated link throughput (bytes per second)
+        self.throughput = None
+        self.failed = False
+
+        # Message types the client subscribed to, or None for every type (statuses are always sent)
+        self.subscribedTypes = None
+
+        # Flag denoting whether frames sent to the client carry sequence numbers, and the
+        # (session, last sequence number) of a resume request the sender has not handled yet
+        self.sequenced = False
+        self.resumeRequest = None
+
+        self._connectTime = time.monotonic()
+
+        # Flag denoting whether sequenced frames carry binary payloads for the types that have one
+        self.binary = False
+
+        # Flag denoting whether the client unpacks batch frames (see MessageHandler.encodeBatch)
+        self.batched = False
+
+        # Compressor of the frames sent to the client (see FrameCompressor), or None to send them uncompressed
+        self.compressor = None
+
+        self._lastSendTimes = {}
+
+        # Rates lowered because of congestion (dictionary of Hz, missing types are not lowered)
+        self._adaptedRates = {}
+
+        # Counts of messages offered to and sent to the client during the current estimation period
+        self._offeredCounts = {}
+        self._sentCounts = {}
+
+        self._periodStartTime = None
+        self._periodBytesSent = 0
+        self._periodSendTime = 0
+        self._periodNumSends = 0
+        self._periodStartQueuedBytes = 0
+        self._uncongestedPeriods = 0
+
+    def awaitsResume(self, now):
+        """
+        Checks to see if the client may still send a resume request, in which case it is sent nothing
+        until it does, so no message reaches it both as a plain frame and again in the replay
+
+        @param now: The current time (monotonic seconds)
+
+        @return True if the client is waiting to resume, otherwise False
+        """
+
+        if self.sequenced:
+            return False
+
+        # Requested but not handled by the sender yet
+        if self.resumeRequest is not None:
+            return True
+
+        # Clients that never resume are sent plain frames once the grace period is over
+        return now - self._connectTime < ClientConnection._resumeGracePeriod
+
+    def getNumToSend(self, msgType, numMsgs, now):
+        """
+        Decides how many of the messages of the specified type produced since the last send
+        cycle to send to the client. A type sent at a limited rate only sends the newest one
+        when it is due, and records it as sent.
+
+        @param msgType: The type of message
+        @param numMsgs: The number of messages of the type produced since the last send cycle
+        @param now:     The current time (monotonic seconds)
+
+        @return The number of the newest messages to send
+        """
+
+        if self.failed or not self.acceptsType(msgType):
+            return 0
+
+        minInterval = self.sendPolicy.getMinInterval(msgType)
+
+        self._offeredCounts[msgType] = self._offeredCounts.get(msgType, 0) + numMsgs
+
+        adaptedRate = self._adaptedRates.get(msgType)
+
+        if adaptedRate is not None:
+            minInterval = max(minInterval, 1.0 / adaptedRate)
+
+        if minInterval:
+            lastSendTime = self._lastSendTimes.get(msgType)
+
+            if lastSendTime is not None and now - lastSendTime < minInterval:
+                return 0
+
+            self._lastSendTimes[msgType] = now
+
+            numMsgs = 1
+
+        self._sentCounts[msgType] = self._sentCounts.get(msgType, 0) + numMsgs
+
+        return numMsgs
+
+    def acceptsType(self, msgType):
+        """
+        Checks to see if the client subscribed to a message type and its transport carries it
+
+        @param msgType: The type of message
+
+        @return True if messages of the type may be sent to the client, otherwise False
+        """
+
+        subscribedTypes = self.subscribedTypes
+
+        if subscribedTypes is not None and msgType not in subscribedTypes and msgType != MessageType.STATUS_MESSAGE:
+            return False
+
+        return self.sendPolicy.getMinInterval(msgType) is not None
+
+    def recordSend(self, numBytes, sendTime):
+        """
+        Records a completed send to the client
+
+        @param numBytes: The number of bytes sent
+        @param sendTime: The time the send took to complete (seconds)
+
+        @return None
+        """
+
+        self._periodBytesSent += numBytes
+        self._periodSendTime += sendTime
+        self._periodNumSends += 1
+
+    def getCompressionSummary(self):
+        """
+        Describes how well the frames sent to the client compress and what it costs
+
+        @param None
+
+        @return The summary (string), or None if nothing was compressed for the client
+        """
+
+        compressor = self.compressor
+
+        if compressor is None or not compressor.numRawBytes:
+            return None
+
+        return ('Client %s (%s) compression: %d bytes sent as %d (ratio %.1f), %.1f ms CPU (%.1f us per KB)' %
+                (self.address, self.transport, compressor.numRawBytes, compressor.numCompressedBytes,
+                 compressor.getRatio(), compressor.cpuTime * 1e3, compressor.cpuTime * 1e6 * 1024 / compressor.numRawBytes))
+
+    def getQueuedBytes(self):
+        """
+        Retrieves the number of bytes queued in the kernel that the client has not yet received
+
+        @param None
+
+        @return The number of queued bytes, or None if the socket or platform does not support the query
+        """
+
+        # The query is only available on Linux (the relay also runs on Windows and macOS)
+        try:
+            import fcntl
+            import termios
+        except ImportError:
+            return None
+
+        request = getattr(termios, 'TIOCOUTQ', None)
+
+        if request is None:
+            return None
+
+        buf = array.array('i', [0])
+
+        try:
+            fcntl.ioctl(self.sock.fileno(), request, buf, True)
+        except (OSError, ValueError):
+            return None
+
+        return buf[0]
+
+    def updateRates(self, now):
+        """
+        Estimates the link capacity once per estimation period and lowers
+        or raises the per type rates to match it
+
+        @param now: The current time (monotonic seconds)
+
+        @return None
+        """
+
+        if self._periodStartTime is None:
+            self.__startPeriod(now)
+
+            return
+
+        elapsedTime = now - self._periodStartTime
+
+        if elapsedTime < ClientConnection._estimationPeriod:
+            return
+
+        queuedBytes = self.getQueuedBytes()
+
+        # Bytes that left the send buffer are the bytes the link actually delivered
+        deliveredBytes = self._periodBytesSent
+
+        if queuedBytes is not None:
+            deliveredBytes -= queuedBytes - self._periodStartQueuedBytes
+
+        self.throughput = max(deliveredBytes, 0) / elapsedTime
+
+        congested = False
+
+        if queuedBytes is not None and queuedBytes > ClientConnection._maxQueuedBytes:
+            congested = True
+
+        if self._periodNumSends and self._periodSendTime / self._periodNumSends > ClientConnection._maxSendTime:
+            congested = True
+
+        if congested:
+            self._uncongestedPeriods = 0
+
+            self.__lowerRates(elapsedTime)
+        else:
+            self._uncongestedPeriods += 1
+
+            if self._uncongestedPeriods >= ClientConnection._recoveryPeriods:
+                self.__raiseRates(elapsedTime)
+
+        self.__startPeriod(now, queuedBytes)
+
+    def __lowerRates(self, elapsedTime):
+        """
+        Lowers the rate of every type that can be lowered
+
+        @param elapsedTime: The length of the estimation period (seconds)
+
+        @return None
+        """
+
+        for msgType, minRate in self.sendPolicy.minRates.items():
+            sentRate = self._sentCounts.get(msgType, 0) / elapsedTime
+
+            if sentRate <= minRate:
+                continue
+
+            adaptedRate = max(sentRate * ClientConnection._decreaseFactor, minRate)
+
+            self._adaptedRates[msgType] = adaptedRate
+
+            print('Client %s (%s) is congested. Lowering type %d rate from %.1f to %.1f Hz' %
+                  (self.address, self.transport, msgType, sentRate, adaptedRate))
+
+    def __raiseRates(self, elapsedTime):
+        """
+        Raises the rate of every type that was lowered, removing the limit
+        once the rate reaches the rate messages are offered at
+
+        @param elapsedTime: The length of the estimation period (seconds)
+
+        @return None
+        """
+
+        for msgType, adaptedRate in list(self._adaptedRates.items()):
+            offeredRate = self._offeredCounts.get(msgType, 0) / elapsedTime
+
+            adaptedRate *= ClientConnection._increaseFactor
+
+            if adaptedRate >= offeredRate:
+                del self._adaptedRates[msgType]
+
+                print('Client %s (%s) recovered. Restoring type %d to its full rate' %
+                      (self.address, self.transport, msgType))
+            else:
+                self._adaptedRates[msgType] = adaptedRate
+
+        self._uncongestedPeriods = 0
+
+    def __startPeriod(self, now, queuedBytes=None):
+        """
+        Starts a new estimation period
+
+        @param now:         The current time (monotonic seconds)
+        @param queuedBytes: The number of bytes currently queued in the kernel
+
+        @return None
+        """
+
+        self._periodStartTime = now
+        self._periodBytesSent = 0
+        self._periodSendTime = 0
+        self._periodNumSends = 0
+        self._periodStartQueuedBytes = queuedBytes or 0
+
+        self._offeredCounts.clear()
+        self._sentCounts.clear()
@@ -1,97 +1,240 @@
 # Python Modules
 import json
-import threading
+import socket
 import time
 
-# 3rd Party Modules
-import gps
-
 # Project Modules
+from acquisition_scheduler import Sensor, SensorState
+from gpsd_client import GPSDClient
 from message_handler import MessageType
 
-class GPSReader(threading.Thread):
+class GPSReader(Sensor):
     """
     Class used for reading GPS data from a sensor
     """
 
-    def __init__(self, msgQueue, readPeriod=0.5):
+    # Sensor name (reported to clients in the handshake)
+    sensorName = 'gps'
+
+    # Fields forwarded from each Time Position Velocity report
+    _tpvFields = ('time', 'lat', 'lon', 'alt', 'speed', 'climb', 'epy', 'epx', 'epv')
+
+    def __init__(self, ringBuffer, host='localhost', port=2947, updateRate=None, forwardNmea=False,
+                 readPeriod=0.5, minBackoff=0.5, maxBackoff=30):
         """
         Constructor
 
-        @param msgQueue   The queue to place GPS messages on
-        @param readPeriod The time between GPS reads (seconds)
+        @param ringBuffer    The ring buffer to place GPS messages on
+        @param host          The gpsd host
+        @param port          The gpsd port
+        @param updateRate    The receiver update rate to request from gpsd (Hz, e.g. 5 or 10),
+                             or None to leave the receiver at its default rate
+        @param forwardNmea   Flag dictating whether to forward raw NMEA sentences
+        @param readPeriod    The time between checks for gpsd reports when none arrive, and between
+                             reconnection checks (seconds). Reports are read as soon as they arrive.
+        @param minBackoff    The initial time between gpsd reconnection attempts (seconds)
+        @param maxBackoff    The maximum time between gpsd reconnection attempts (seconds)
 
         @return None
         """
 
-        threading.Thread.__init__(self)
+        Sensor.__init__(self, ringBuffer, GPSReader.sensorName, readPeriod)
+
+        self._updateRate = updateRate
+        self._forwardNmea = forwardNmea
+        self._watchOptions = {'nmea': True} if forwardNmea else None
+        self._minBackoff = minBackoff
+        self._maxBackoff = maxBackoff
+        self._backoff = minBackoff
+        self._nextConnectTime = 0
+
+        # Devices that have already been asked for the update rate
+        self._configuredDevices = set()
+
+        # Reused for every TPV report so the high rate path does not build a new dictionary per fix
+        self._gpsData = dict.fromkeys(GPSReader._tpvFields)
+
+        # Latest satellite and pulse per second reports
+        self.skyReport = None
+        self.ppsReport = None
+
+        self._gpsdClient = GPSDClient(host, port)
+
+    @staticmethod
+    def getMsgTypes(forwardNmea=False, **sensorArgs):
+        """
+        Retrieves the messages a reader configured with the specified arguments publishes
+        (reported to clients in the handshake)
+
+        @param forwardNmea: Flag dictating whether raw NMEA sentences are forwarded
+        @param sensorArgs:  The other constructor arguments
+
+        @return Tuple of message types
+        """
+
+        if forwardNmea:
+            return (MessageType.GPS_MESSAGE, MessageType.NMEA_MESSAGE)
+
+        return (MessageType.GPS_MESSAGE,)
+
+    def open(self):
+        """
+        Overriden method called by the scheduler to connect to gpsd
+
+        @param None
 
-        self.shutdownEvent = threading.Event()
+        @return None
+        """
 
-        self._msgQueue = msgQueue
-        self._readPeriod = readPeriod
+        self._gpsdClient.connect(self._watchOptions)
 
-        # Initialize GPS (Python 3 version info found at https://learn.adafruit.com/adafruit-ultimate-gps-on-the-raspberry-pi/using-your-gps)
-        self._gpsSession = gps.gps('localhost', '2947')
-        self._gpsSession.stream(gps.WATCH_ENABLE | gps.WATCH_NEWSTYLE)
-    
-    def run(self):
+    def poll(self):
         """
-        Overriden method called when the thread is started
+        Overriden method called by the scheduler to read any reports that have arrived
 
         @param None
 
         @return None
         """
 
-        while not self.shutdownEvent.is_set():
-            gpsData = self.__getGPSData()
+        # (Re)connect to gpsd
+        if not self._gpsdClient.isConnected():
+            if time.monotonic() < self._nextConnectTime:
+                return None
+
+            try:
+                self._gpsdClient.connect(self._watchOptions)
+
+                self._configuredDevices.clear()
+                self._backoff = self._minBackoff
 
-            # Broadcast GPS data
-            if gpsData:
-                msgData = json.dumps(gpsData)
+                self.setState(SensorState.READY)
+            except socket.error:
+                self._nextConnectTime = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self._maxBackoff)
 
-                self._msgQueue.put((msgData, MessageType.GPS_MESSAGE))
+                return None
 
-            time.sleep(self._readPeriod)
+        lines = self._gpsdClient.readLines()
 
-        # Cleanup
-        self.__shutdown()
+        # gpsd disconnected
+        if lines is None:
+            print('Lost connection to gpsd. Attempting to reestablish connection...')
 
-    def __getGPSData(self):
+            self._gpsdClient.close()
+
+            self.setState(SensorState.DOWN)
+
+            return None
+
+        # Broadcast each fix that arrived since the last read
+        for line in lines:
+            self.__processLine(line)
+
+        return None
+
+    def __processLine(self, line):
         """
-        Retrieves GPS data from a USB sensor
+        Processes a line received from gpsd
 
-        @param None
+        @param line: The line (bytes)
+
+        @return None
+        """
+
+        # Raw NMEA sentences
+        if line[:1] in (b'$', b'!'):
+            if self._forwardNmea:
+                self.publish(line.decode(errors='replace'), MessageType.NMEA_MESSAGE)
+
+            return
+
+        # gpsd always leads with the class, so TPV reports are recognized without parsing everything else
+        if line.startswith(b'{"class":"TPV"'):
+            try:
+                report = json.loads(line.decode())
+            except ValueError:
+                return
+
+            gpsData = self._gpsData
+
+            for field in GPSReader._tpvFields:
+                gpsData[field] = report.get(field)
+
+            self.publish(gpsData, MessageType.GPS_MESSAGE)
+        elif line.startswith(b'{"class":"SKY"'):
+            self.skyReport = self.__parseReport(line)
+        elif line.startswith(b'{"class":"PPS"'):
+            self.ppsReport = self.__parseReport(line)
+        elif self._updateRate and line.startswith((b'{"class":"DEVICE"', b'{"class":"DEVICES"')):
+            report = self.__parseReport(line)
+
+            if report is not None:
+                self.__configureUpdateRate(report.get('devices', [report]))
+
+    def __parseReport(self, line):
+        """
+        Parses a report received from gpsd
+
+        @param line: The line (bytes)
+
+        @return The report (dictionary), or None if it could not be parsed
+        """
+
+        try:
+            return json.loads(line.decode())
+        except ValueError:
+            return None
 
-        @return GPS data (dictionary)
+    def __configureUpdateRate(self, devices):
         """
+        Asks gpsd to switch the specified devices to the configured update rate
 
-        gpsData = {}
+        @param devices: List of device reports (dictionaries)
 
-        data = self._gpsSession.next()
+        @return None
+        """
+
+        cycle = 1.0 / self._updateRate
+
+        for device in devices:
+            path = device.get('path')
+
+            if path is None or path in self._configuredDevices:
+                continue
+
+            self._configuredDevices.add(path)
+
+            # Check to see if the device is already running at the requested rate
+            if abs(device.get('cycle', 1.0) - cycle) < 1e-3:
+                continue
+
+            # Not all receivers accept rate changes, in which case gpsd reports the unchanged cycle
+            print('Requesting %g Hz updates from GPS device: %s' % (self._updateRate, path))
+
+            self._gpsdClient.sendCommand('?DEVICE=' + json.dumps({'path': path, 'cycle': cycle}))
+
+    def fileno(self):
+        """
+        Overriden method called by the scheduler to wait for gpsd reports
+
+        @param None
+
+        @return The gpsd socket file descriptor, or None while disconnected
+        """
 
-        # Filter on the Time Position Velocity class
-        if data['class'] == 'TPV':
-            gpsData['time'] = data.get('time')
-            gpsData['lat'] = data.get('lat')
-            gpsData['lon'] = data.get('lon')
-            gpsData['alt'] = data.get('alt')
-            gpsData['speed'] = data.get('speed')
-            gpsData['climb'] = data.get('climb')
-            gpsData['epy'] = data.get('epy')
-            gpsData['epx'] = data.get('epx')
-            gpsData['epv'] = data.get('epv')
+        if not self._gpsdClient.isConnected():
+            return None
 
-        return gpsData
+        return self._gpsdClient.fileno()
 
-    def __shutdown(self):
+    def close(self):
         """
-        Performs shutdown procedures for the thread
+        Overriden method called by the scheduler to perform shutdown procedures for the sensor
 
         @param None
 
         @return None
         """
 
-        pass
+        self._gpsdClient.close()
@@ -0,0 +1,158 @@
+# Python Modules
+import errno
+import json
+import socket
+
+class GPSDClient(object):
+    """
+    Non-blocking client for the gpsd JSON protocol
+    (https://gpsd.gitlab.io/gpsd/gpsd_json.html)
+    """
+
+    _recvSize = 4096
+
+    def __init__(self, host='localhost', port=2947, connectTimeout=2):
+        """
+        Constructor
+
+        @param host:           The gpsd host
+        @param port:           The gpsd port
+        @param connectTimeout: The timeout when connecting to gpsd (seconds)
+
+        @return None
+        """
+
+        self._host = host
+        self._port = port
+        self._connectTimeout = connectTimeout
+
+        self._sock = None
+        self._recvBuffer = b''
+
+    def connect(self, watchOptions=None):
+        """
+        Connects to gpsd and enables watcher mode
+
+        @param watchOptions: Additional ?WATCH options (dictionary)
+
+        @return None
+        """
+
+        self._sock = socket.create_connection((self._host, self._port), self._connectTimeout)
+        self._sock.setblocking(False)
+        self._recvBuffer = b''
+
+        watch = {'enable': True, 'json': True}
+
+        if watchOptions:
+            watch.update(watchOptions)
+
+        self.sendCommand('?WATCH=' + json.dumps(watch))
+
+    def close(self):
+        """
+        Closes the connection to gpsd
+
+        @param None
+
+        @return None
+        """
+
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def fileno(self):
+        """
+        Retrieves the socket file descriptor so the client can be used with select
+
+        @param None
+
+        @return The file descriptor
+        """
+
+        return self._sock.fileno()
+
+    def isConnected(self):
+        """
+        Checks to see if the client is connected to gpsd
+
+        @param None
+
+        @return True if connected, otherwise False
+        """
+
+        return self._sock is not None
+
+    def sendCommand(self, command):
+        """
+        Sends a command to gpsd
+
+        @param command: The command (string, e.g. '?POLL;')
+
+        @return None
+        """
+
+        self._sock.setblocking(True)
+
+        try:
+            self._sock.sendall((command + '\n').encode())
+        finally:
+            self._sock.setblocking(False)
+
+    def readLines(self):
+        """
+        Reads whatever is available on the socket without blocking
+
+        @param None
+
+        @return List of complete lines (bytes), or None if gpsd disconnected
+        """
+
+        while True:
+            try:
+                data = self._sock.recv(self._recvSize)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+
+                return None
+
+            # gpsd closed the connection
+            if not data:
+                return None
+
+            self._recvBuffer += data
+
+            if len(data) < self._recvSize:
+                break
+
+        # Keep any partial line until the rest of it arrives
+        lines = self._recvBuffer.split(b'\n')
+        self._recvBuffer = lines.pop()
+
+        return [line.rstrip(b'\r') for line in lines if line]
+
+    def readReports(self):
+        """
+        Reads and parses whatever reports are available without blocking
+
+        @param None
+
+        @return List of reports (dictionaries), or None if gpsd disconnected
+        """
+
+        lines = self.readLines()
+
+        if lines is None:
+            return None
+
+        reports = []
+
+        for line in lines:
+            try:
+                reports.append(json.loads(line.decode()))
+            except ValueError:
+                pass
+
+        return reports
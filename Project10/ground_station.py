@@ -0,0 +1,485 @@
+# Python Modules
+import argparse
+import os
+import selectors
+import signal
+import threading
+import time
+
+# Project Modules
+from message_handler import MessageType
+from socket_profile import SOCKET_PROFILES
+from telemetry_client import GPSSample, ResumeReport, RPYSample, SensorStatus, SourcedRecord, TelemetryClient, VehicleInfo
+from terminal_renderer import TerminalRenderer
+
+# Globals
+keepRunning = True
+
+class VehicleLink(object):
+    """
+    Class that holds the connection to one vehicle, its latest telemetry and its link statistics
+    """
+
+    def __init__(self, name, client):
+        """
+        Constructor
+
+        @param name:   The vehicle name
+        @param client: The telemetry client connected to the vehicle
+
+        @return None
+        """
+
+        self.name = name
+        self.client = client
+
+        # Identity the vehicle reported (VehicleInfo), None until it connects
+        self.info = None
+
+        # Latest telemetry
+        self.gps = None
+        self.rpy = None
+        self.sensorStates = {}
+
+        # Link state ('connecting', 'connected' or 'waiting') and when the next connection attempt is due
+        self.state = 'waiting'
+        self.stateTime = 0
+        self.nextAttemptTime = 0
+
+        # Link statistics
+        self.numRecords = 0
+        self.lastRecordTime = None
+        self.numReconnects = 0
+        self.numReplayed = 0
+        self.numLost = 0
+
+        # Rates measured over the last statistics period
+        self.recordRate = 0.0
+        self.byteRate = 0.0
+
+        self._lastNumRecords = 0
+        self._lastNumBytes = 0
+
+    def updateRates(self, elapsed):
+        """
+        Updates the record and byte rates
+
+        @param elapsed: The time since the rates were last updated (seconds)
+
+        @return None
+        """
+
+        numBytes = self.client.numBytesReceived
+
+        self.recordRate = (self.numRecords - self._lastNumRecords) / elapsed
+        self.byteRate = (numBytes - self._lastNumBytes) / elapsed
+
+        self._lastNumRecords = self.numRecords
+        self._lastNumBytes = numBytes
+
+class GroundStation(threading.Thread):
+    """
+    Client that keeps connections to many vehicles from a single thread and displays their
+    telemetry side by side.
+
+    Every connection is registered with one selector, and connections are established and
+    re-established without blocking, so a vehicle that is out of range never holds up the
+    others (Bluetooth connections are the exception, PyBluez can only connect blocking).
+    """
+
+    _statsPeriod = 1.0
+
+    def __init__(self, vehicles, selectTimeout=3, connectTimeout=5, socketProfile='default', maxFps=20):
+        """
+        Constructor
+
+        @param vehicles:       The vehicles to connect to (dictionary of name to (address, useBluetooth))
+        @param selectTimeout:  The maximum time to wait for data
+        @param connectTimeout: The time to wait for a connection to be established (seconds)
+        @param socketProfile:  The name of the socket profile applied to WiFi connections (see SOCKET_PROFILES)
+        @param maxFps:         The maximum number of times the screen is redrawn per second
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        self.shutdownEvent = threading.Event()
+        self._selectTimeout = selectTimeout
+        self._connectTimeout = connectTimeout
+
+        # Initialize colorama (only needed for escape codes on Windows) and clear screen
+        if os.name == 'nt':
+            import colorama
+
+            colorama.init()
+
+        self._renderer = TerminalRenderer(self.__layout, maxFps)
+        self._renderer.clear()
+
+        self._selector = selectors.DefaultSelector()
+
+        # Callbacks are (record type, callback) tuples, a record type of None matches every record
+        self._callbacks = []
+
+        self._links = []
+
+        for name, (address, useBluetooth) in sorted(vehicles.items()):
+            client = TelemetryClient(address, useBluetooth=useBluetooth, connectTimeout=connectTimeout,
+                                     socketProfile=socketProfile, connectNow=False)
+
+            # Raw NMEA sentences are not displayed, so the vehicles do not need to send them
+            client.subscribe([MessageType.GPS_MESSAGE, MessageType.RPY_MESSAGE])
+
+            link = VehicleLink(name, client)
+            client.addCallback(lambda record, link=link: self.__processRecord(link, record))
+
+            self._links.append(link)
+
+        self._lastStatsTime = time.monotonic()
+
+    def addCallback(self, callback, recordType=None):
+        """
+        Registers a callback that is called with every record received from any vehicle
+
+        @param callback:   The callback, called with a SourcedRecord tagged with the vehicle name
+        @param recordType: The record type (e.g. RPYSample), or None for every record
+
+        @return None
+        """
+
+        self._callbacks.append((recordType, callback))
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        while not self.shutdownEvent.is_set():
+            now = time.monotonic()
+
+            self.__connectDue(now)
+
+            # Wake up in time for the next connection attempt, to abandon a slow one and to draw a pending frame
+            selectTimeout = self._selectTimeout
+            frameTimeout = self._renderer.getTimeout()
+
+            if frameTimeout is not None:
+                selectTimeout = min(frameTimeout, selectTimeout)
+
+            for link in self._links:
+                if link.state == 'waiting':
+                    selectTimeout = min(max(link.nextAttemptTime - now, 0), selectTimeout)
+                elif link.state == 'connecting':
+                    selectTimeout = min(max(link.stateTime + self._connectTimeout - now, 0), selectTimeout)
+
+            for key, mask in self._selector.select(selectTimeout):
+                link = key.data
+
+                if link.state == 'connecting':
+                    self.__finishConnect(link)
+                # Read whatever the vehicle sent, which is passed to the record callback
+                elif link.client.recvRecords() is None:
+                    self.__disconnect(link)
+
+            now = time.monotonic()
+
+            if now - self._lastStatsTime >= GroundStation._statsPeriod:
+                for link in self._links:
+                    link.updateRates(now - self._lastStatsTime)
+
+                self._lastStatsTime = now
+
+                # The link statistics change every period, even without new telemetry
+                self._renderer.invalidate()
+
+            self._renderer.draw()
+
+        # Cleanup
+        self.__shutdown()
+
+    def __connectDue(self, now):
+        """
+        Starts the connection attempts that are due and abandons those that took too long
+
+        @param now: The current time (seconds)
+
+        @return None
+        """
+
+        for link in self._links:
+            if link.state == 'connecting' and now - link.stateTime >= self._connectTimeout:
+                self.__disconnect(link)
+            elif link.state == 'waiting' and now >= link.nextAttemptTime:
+                try:
+                    connected = link.client.connect(blocking=False)
+                except OSError:
+                    self.__scheduleAttempt(link)
+
+                    continue
+
+                if connected:
+                    self.__setState(link, 'connected')
+
+                    self._selector.register(link.client, selectors.EVENT_READ, link)
+                else:
+                    self.__setState(link, 'connecting')
+
+                    # The socket becomes writable once the connection is established (or failed)
+                    self._selector.register(link.client, selectors.EVENT_WRITE, link)
+
+    def __finishConnect(self, link):
+        """
+        Completes a connection attempt once its socket is writable
+
+        @param link: The vehicle link
+
+        @return None
+        """
+
+        self._selector.unregister(link.client)
+
+        try:
+            link.client.finishConnect()
+        except OSError:
+            self.__scheduleAttempt(link)
+
+            return
+
+        self.__setState(link, 'connected')
+
+        self._selector.register(link.client, selectors.EVENT_READ, link)
+
+    def __disconnect(self, link):
+        """
+        Closes a vehicle's connection (or connection attempt) and schedules the next attempt
+
+        @param link: The vehicle link
+
+        @return None
+        """
+
+        self._selector.unregister(link.client)
+
+        link.client.close()
+
+        if link.state == 'connected':
+            link.numReconnects += 1
+
+        self.__scheduleAttempt(link)
+
+    def __scheduleAttempt(self, link):
+        """
+        Schedules the next connection attempt to a vehicle, backing off after repeated failures
+
+        @param link: The vehicle link
+
+        @return None
+        """
+
+        link.nextAttemptTime = time.monotonic() + link.client.getReconnectDelay()
+
+        self.__setState(link, 'waiting')
+
+    def __setState(self, link, state):
+        """
+        Sets the state of a vehicle link
+
+        @param link:  The vehicle link
+        @param state: The new state
+
+        @return None
+        """
+
+        link.state = state
+        link.stateTime = time.monotonic()
+
+        self._renderer.invalidate()
+
+    def __processRecord(self, link, record):
+        """
+        Updates a vehicle's data with a record received from it and passes the record on to the callbacks
+
+        @param link:   The vehicle link
+        @param record: The record
+
+        @return None
+        """
+
+        link.numRecords += 1
+        link.lastRecordTime = time.monotonic()
+
+        # Check to see if a sensor status was received
+        if isinstance(record, SensorStatus):
+            link.sensorStates[record.sensor] = record.state
+        # Check to see if a GPS sample was received
+        elif isinstance(record, GPSSample):
+            link.gps = record
+        # Check to see if a RPY sample was received
+        elif isinstance(record, RPYSample):
+            link.rpy = record
+        # Check to see if the vehicle summarized what it replays after a reconnection
+        elif isinstance(record, ResumeReport):
+            link.numReplayed += record.replayed
+            link.numLost += record.lost or 0
+        # Check to see if the vehicle identified itself
+        elif isinstance(record, VehicleInfo):
+            link.info = record
+
+        self._renderer.invalidate()
+
+        if self._callbacks:
+            sourcedRecord = SourcedRecord(link.name, record)
+
+            for recordType, callback in self._callbacks:
+                if recordType is None or isinstance(record, recordType):
+                    callback(sourcedRecord)
+
+    def __layout(self):
+        """
+        Lays out the telemetry and link statistics of every vehicle
+
+        @param None
+
+        @return List of screen lines
+        """
+
+        now = time.monotonic()
+
+        outputStrs = []
+        outputStrs.append('------------------------------------------------ Telemetry ------------------------------------------------')
+        outputStrs.append('')
+        outputStrs.append('%-12s %12s %13s %10s %9s %9s %9s  %s' % ('Vehicle', 'Latitude', 'Longitude', 'Alt (m)',
+                                                                  'Roll', 'Pitch', 'Yaw', 'Sensors'))
+
+        for link in self._links:
+            gps = link.gps or GPSSample(*([None] * len(GPSSample._fields)))
+            rpy = link.rpy or RPYSample(None, None, None, 'unknown')
+
+            outputStrs.append('%-12s %12s %13s %10s %9s %9s %9s  %s' % (
+                link.name[:12],
+                GroundStation.__format('%4.6f', gps.lat),
+                GroundStation.__format('%4.6f', gps.lon),
+                GroundStation.__format('%4.1f', gps.alt),
+                GroundStation.__format('%4.1f', rpy.roll),
+                GroundStation.__format('%4.1f', rpy.pitch),
+                GroundStation.__format('%4.1f', rpy.yaw),
+                ', '.join('%s: %s' % (sensor, state) for sensor, state in sorted(link.sensorStates.items()))))
+
+        outputStrs.append('')
+        outputStrs.append('-------------------------------------------------- Links --------------------------------------------------')
+        outputStrs.append('')
+        outputStrs.append('%-12s %-10s %8s %8s %8s %10s %9s %9s  %s' % ('Vehicle', 'State', 'Msgs/s', 'kB/s', 'Age (s)',
+                                                                     'Reconnects', 'Replayed', 'Lost', 'Identity'))
+
+        for link in self._links:
+            age = None if link.lastRecordTime is None else now - link.lastRecordTime
+            identity = '' if link.info is None else '%s (source %s, version %s)' % link.info[:3]
+
+            outputStrs.append('%-12s %-10s %8.1f %8.1f %8s %10d %9d %9d  %s' % (
+                link.name[:12], link.state, link.recordRate, link.byteRate / 1024,
+                GroundStation.__format('%.1f', age), link.numReconnects, link.numReplayed, link.numLost, identity))
+
+        return outputStrs
+
+    @staticmethod
+    def __format(fmt, value):
+        """
+        Formats a value for display
+
+        @param fmt:   The format string
+        @param value: The value, or None if it is not known
+
+        @return The formatted value, or NaN if the value is not known
+        """
+
+        return 'NaN' if value is None else fmt % value
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        self._renderer.close()
+
+        for link in self._links:
+            link.client.close()
+
+        self._selector.close()
+
+def parseVehicle(spec):
+    """
+    Parses a vehicle given on the command line
+
+    @param spec: NAME=HOST:PORT for WiFi, NAME=bt:MAC:CHANNEL for Bluetooth, or NAME=unix:PATH for a local Unix domain socket
+
+    @return (name, (address, useBluetooth)) tuple
+    """
+
+    name, sep, address = spec.partition('=')
+
+    if not sep or not name:
+        raise argparse.ArgumentTypeError('Expected NAME=ADDRESS: %s' % spec)
+
+    kind, sep, rest = address.partition(':')
+
+    try:
+        if kind == 'unix':
+            return name, (rest, False)
+
+        if kind == 'bt':
+            mac, sep, channel = rest.rpartition(':')
+
+            return name, ((mac, int(channel)), True)
+
+        host, sep, port = address.rpartition(':')
+
+        return name, ((host, int(port)), False)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid address: %s' % address)
+
+def service_shutdown(signum, fname):
+    """
+    Handles signals (interrupts)
+
+    @param signum: The signal to be handled
+    @param fname:  The callback function name
+
+    @return None
+    """
+
+    global keepRunning
+
+    keepRunning = False
+
+if __name__ == "__main__":
+    # Register a signal handler
+    signal.signal(signal.SIGINT, service_shutdown)
+
+    parser = argparse.ArgumentParser(description='Displays the telemetry received from several vehicles')
+    parser.add_argument('vehicles', nargs='+', type=parseVehicle, metavar='NAME=ADDRESS',
+                        help='A vehicle, as NAME=HOST:PORT, NAME=bt:MAC:CHANNEL or NAME=unix:PATH')
+    parser.add_argument('--connect-timeout', type=float, default=5, help='The time to wait for a connection')
+    parser.add_argument('--socket-profile', default='default', choices=sorted(SOCKET_PROFILES),
+                        help='The socket profile applied to WiFi connections')
+    parser.add_argument('--fps', type=int, default=20, help='The maximum screen refresh rate')
+    args = parser.parse_args()
+
+    # Start the ground station
+    groundStation = GroundStation(dict(args.vehicles), connectTimeout=args.connect_timeout,
+                                  socketProfile=args.socket_profile, maxFps=args.fps)
+    groundStation.start()
+
+    # Keep alive
+    while keepRunning:
+        time.sleep(1)
+
+    groundStation.shutdownEvent.set()
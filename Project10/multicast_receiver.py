@@ -0,0 +1,104 @@
+# Python Modules
+import socket
+import struct
+
+# Project Modules
+from message_handler import MessageHandler
+
+class MulticastReceiver(object):
+    """
+    Receives messages sent to a UDP multicast group, detecting gaps and dropping stale samples
+    """
+
+    _maxDatagramSize = 65535
+
+    # How far back a sequence number may be and still be treated as a reordered sample
+    # rather than the sender having restarted
+    _reorderWindow = 1024
+
+    def __init__(self, group='239.0.0.67', port=9001, interfaceAddress='0.0.0.0'):
+        """
+        Constructor
+
+        @param group:            The multicast group address
+        @param port:             The multicast port
+        @param interfaceAddress: The address of the interface to join the group on
+
+        @return None
+        """
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('', port))
+
+        membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton(interfaceAddress))
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+        # Last sequence number received for each message type
+        self._lastSeqs = {}
+
+        self.numReceived = 0
+        self.numLost = 0
+        self.numStale = 0
+
+    def fileno(self):
+        """
+        Retrieves the socket file descriptor so the receiver can be used with select
+
+        @param None
+
+        @return The file descriptor
+        """
+
+        return self._sock.fileno()
+
+    def recvMsg(self):
+        """
+        Receives a message from the multicast group
+
+        @param None
+
+        @return Returns a tuple (msgType, msg) if a new message was received,
+                otherwise returns None (invalid or older than one already received)
+        """
+
+        data = self._sock.recv(MulticastReceiver._maxDatagramSize)
+
+        datagram = MessageHandler.decodeDatagram(data)
+
+        if datagram is None:
+            return None
+
+        msgType, seq, msg = datagram
+
+        lastSeq = self._lastSeqs.get(msgType)
+
+        if lastSeq is not None:
+            # Sequence numbers wrap, so compare the distance modulo 2^32
+            seqDelta = (seq - lastSeq) & 0xFFFFFFFF
+
+            # Duplicate or reordered sample older than the latest value
+            if seqDelta == 0 or 0x100000000 - seqDelta <= MulticastReceiver._reorderWindow:
+                self.numStale += 1
+
+                return None
+
+            # Samples that were skipped were lost (unless the sender restarted)
+            if seqDelta < 0x80000000:
+                self.numLost += seqDelta - 1
+
+        self._lastSeqs[msgType] = seq
+        self.numReceived += 1
+
+        return (msgType, msg)
+
+    def close(self):
+        """
+        Closes the multicast socket
+
+        @param None
+
+        @return None
+        """
+
+        self._sock.close()
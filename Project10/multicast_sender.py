@@ -0,0 +1,87 @@
+# Python Modules
+import socket
+
+# Project Modules
+from message_handler import MessageType, MessageHandler
+
+class MulticastSender(object):
+    """
+    Sends messages to passive observers over UDP multicast
+    """
+
+    # Types where only the latest sample matters, so older queued samples are not sent
+    _latestValueTypes = (MessageType.GPS_MESSAGE, MessageType.RPY_MESSAGE)
+
+    def __init__(self, group='239.0.0.67', port=9001, ttl=1, interfaceAddress=None):
+        """
+        Constructor
+
+        @param group:            The multicast group address
+        @param port:             The multicast port
+        @param ttl:              The multicast time to live (1 keeps datagrams on the local network)
+        @param interfaceAddress: The address of the interface to send on, or None for the default
+
+        @return None
+        """
+
+        self._destination = (group, port)
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+
+        if interfaceAddress is not None:
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interfaceAddress))
+
+        # Next sequence number of each message type
+        self._seqs = {}
+
+    def sendMsgs(self, msgs):
+        """
+        Sends a batch of messages, keeping only the latest sample of the latest value types
+
+        @param msgs: List of (msgData, msgType) tuples, oldest first
+
+        @return None
+        """
+
+        latestIndexes = {}
+
+        for index, (msgData, msgType) in enumerate(msgs):
+            if msgType in MulticastSender._latestValueTypes:
+                latestIndexes[msgType] = index
+
+        for index, (msgData, msgType) in enumerate(msgs):
+            if msgType in latestIndexes and latestIndexes[msgType] != index:
+                continue
+
+            self.sendMsg(msgData, msgType)
+
+    def sendMsg(self, msgData, msgType):
+        """
+        Sends a message to the multicast group
+
+        @param msgData: The message data (string)
+        @param msgType: The type of message
+
+        @return None
+        """
+
+        seq = self._seqs.get(msgType, 0)
+        self._seqs[msgType] = seq + 1
+
+        try:
+            self._sock.sendto(MessageHandler.encodeDatagram(msgData, msgType, seq), self._destination)
+        # Observers tolerate loss, so a failed send is simply dropped
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Closes the multicast socket
+
+        @param None
+
+        @return None
+        """
+
+        self._sock.close()
@@ -0,0 +1,89 @@
+# Python Modules
+import ctypes
+import ctypes.util
+import os
+
+class RealtimeProfile(object):
+    """
+    Class that holds the scheduling options applied to sensor acquisition threads
+    """
+
+    # mlockall flags (sys/mman.h)
+    _MCL_CURRENT = 1
+    _MCL_FUTURE = 2
+
+    _policies = {
+        'fifo': 'SCHED_FIFO',
+        'rr': 'SCHED_RR',
+    }
+
+    def __init__(self, policy=None, priority=50, cpus=None, lockMemory=False):
+        """
+        Constructor
+
+        @param policy:     The real time scheduling policy ('fifo' or 'rr'), or None to keep the default policy
+        @param priority:   The real time priority (1-99, higher runs first)
+        @param cpus:       The CPUs to pin acquisition threads to, or None to leave them unpinned
+        @param lockMemory: Flag denoting whether to lock the process memory so reads never wait on page faults
+
+        @return None
+        """
+
+        if policy is not None and policy not in RealtimeProfile._policies:
+            raise ValueError('Unknown scheduling policy: %s' % policy)
+
+        self.policy = policy
+        self.priority = priority
+        self.cpus = cpus
+        self.lockMemory = lockMemory
+
+    def apply(self):
+        """
+        Applies the profile to the calling thread. Options the platform does not support or the
+        process is not permitted to use (real time scheduling usually needs root or CAP_SYS_NICE)
+        are reported and skipped, so acquisition still runs with the default scheduling.
+
+        @param None
+
+        @return None
+        """
+
+        if self.policy is not None:
+            policy = getattr(os, RealtimeProfile._policies[self.policy], None)
+
+            try:
+                # On Linux, process 0 is the calling thread
+                os.sched_setscheduler(0, policy, os.sched_param(self.priority))
+            except (AttributeError, TypeError, OSError) as e:
+                print('Unable to set %s scheduling: %s' % (self.policy, e))
+
+        if self.cpus is not None:
+            try:
+                os.sched_setaffinity(0, self.cpus)
+            except (AttributeError, OSError) as e:
+                print('Unable to set CPU affinity: %s' % e)
+
+        if self.lockMemory:
+            RealtimeProfile.__lockMemory()
+
+    @staticmethod
+    def __lockMemory():
+        """
+        Locks every current and future page of the process into memory
+
+        @param None
+
+        @return None
+        """
+
+        libcName = ctypes.util.find_library('c')
+
+        if libcName is None:
+            print('Unable to lock memory: C library not found')
+
+            return
+
+        libc = ctypes.CDLL(libcName, use_errno=True)
+
+        if libc.mlockall(RealtimeProfile._MCL_CURRENT | RealtimeProfile._MCL_FUTURE) != 0:
+            print('Unable to lock memory: %s' % os.strerror(ctypes.get_errno()))
@@ -0,0 +1,238 @@
+# Python Modules
+import csv
+import json
+import struct
+
+class NpyWriter(object):
+    """
+    Writes rows to a NumPy .npy file as a structured array, appending them as they arrive. The
+    header is rewritten with the final number of rows when the file is closed, so numpy is not
+    needed to record, and the file can be loaded (or memory mapped) with numpy.load.
+    """
+
+    _magic = b'\x93NUMPY\x01\x00'
+
+    # Header length alignment required by the format
+    _headerAlignment = 64
+
+    # Struct format of each numpy type
+    _structFormats = {
+        '<f8': 'd',
+        '<i8': 'q',
+        '|S8': '8s',
+        '|S16': '16s',
+    }
+
+    def __init__(self, path, fields):
+        """
+        Constructor
+
+        @param path:   The file path
+        @param fields: The columns, as (name, numpy type) tuples (see _structFormats for the supported types)
+
+        @return None
+        """
+
+        self._fields = fields
+        self._rowFormat = struct.Struct('<' + ''.join(NpyWriter._structFormats[npyType] for name, npyType in fields))
+
+        # String columns are stored as fixed length bytes
+        self._stringColumns = [column for column, (name, npyType) in enumerate(fields) if npyType.startswith('|S')]
+
+        self._numRows = 0
+
+        # Reserve room for the longest shape, so the header keeps its length when it is rewritten
+        self._headerLength = len(self.__encodeHeader(2 ** 63 - 1))
+
+        self._file = open(path, 'wb')
+        self._file.write(self.__encodeHeader(0, self._headerLength))
+
+    def write(self, rows):
+        """
+        Appends rows to the file
+
+        @param rows: List of rows (tuples of values in column order)
+
+        @return None
+        """
+
+        rowFormat = self._rowFormat
+
+        if self._stringColumns:
+            rows = [list(row) for row in rows]
+
+            for row in rows:
+                for column in self._stringColumns:
+                    row[column] = row[column].encode()
+
+        self._file.write(b''.join([rowFormat.pack(*row) for row in rows]))
+        self._file.flush()
+
+        self._numRows += len(rows)
+
+    def writeArray(self, array):
+        """
+        Appends the elements of a structured array to the file, without converting them to rows
+
+        @param array: NumPy structured array with the columns of the file
+
+        @return None
+        """
+
+        self._file.write(array.astype(self._fields).tobytes())
+        self._file.flush()
+
+        self._numRows += len(array)
+
+    def close(self):
+        """
+        Writes the final number of rows into the header and closes the file
+
+        @param None
+
+        @return None
+        """
+
+        self._file.seek(0)
+        self._file.write(self.__encodeHeader(self._numRows, self._headerLength))
+        self._file.close()
+
+    def __encodeHeader(self, numRows, headerLength=None):
+        """
+        Encodes the file header (format version 1.0)
+
+        @param numRows:      The number of rows in the file
+        @param headerLength: The length to pad the header to, or None for the shortest aligned length
+
+        @return The header (bytes)
+        """
+
+        header = str({'descr': list(self._fields), 'fortran_order': False, 'shape': (numRows,)})
+
+        # The header is padded with spaces and ends with a new line, so the data starts aligned
+        length = len(NpyWriter._magic) + 2 + len(header) + 1
+
+        if headerLength is None:
+            padding = -length % NpyWriter._headerAlignment
+        else:
+            padding = headerLength - length
+
+        header = (header + ' ' * padding + '\n').encode('latin1')
+
+        return NpyWriter._magic + struct.pack('<H', len(header)) + header
+
+class CsvWriter(object):
+    """
+    Writes rows to a CSV file, in batches
+    """
+
+    def __init__(self, path, fieldNames):
+        """
+        Constructor
+
+        @param path:       The file path
+        @param fieldNames: The column names
+
+        @return None
+        """
+
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(fieldNames)
+
+    def write(self, rows):
+        """
+        Appends rows to the file
+
+        @param rows: List of rows (tuples of values in column order)
+
+        @return None
+        """
+
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        """
+        Closes the file
+
+        @param None
+
+        @return None
+        """
+
+        self._file.close()
+
+class GeoJsonWriter(object):
+    """
+    Writes positions to a GeoJSON file as a collection of point features, in batches. The
+    collection is closed when the file is closed.
+    """
+
+    def __init__(self, path, fieldNames):
+        """
+        Constructor
+
+        @param path:       The file path
+        @param fieldNames: The column names, which must include lat and lon (the other
+                           columns become feature properties)
+
+        @return None
+        """
+
+        self._fieldNames = fieldNames
+        self._latIndex = fieldNames.index('lat')
+        self._lonIndex = fieldNames.index('lon')
+
+        self._numFeatures = 0
+
+        self._file = open(path, 'w')
+        self._file.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, rows):
+        """
+        Appends a feature for each row with a known position
+
+        @param rows: List of rows (tuples of values in column order)
+
+        @return None
+        """
+
+        features = []
+
+        for row in rows:
+            lat = row[self._latIndex]
+            lon = row[self._lonIndex]
+
+            # Unknown values are NaN, which is the only value not equal to itself
+            if lat != lat or lon != lon:
+                continue
+
+            properties = dict((name, value) for name, value in zip(self._fieldNames, row)
+                              if name not in ('lat', 'lon') and value == value)
+
+            features.append(json.dumps({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                                        'properties': properties}))
+
+        if not features:
+            return
+
+        if self._numFeatures:
+            self._file.write(',\n')
+
+        self._file.write(',\n'.join(features))
+        self._file.flush()
+
+        self._numFeatures += len(features)
+
+    def close(self):
+        """
+        Closes the feature collection and the file
+
+        @param None
+
+        @return None
+        """
+
+        self._file.write('\n]}\n')
+        self._file.close()
@@ -0,0 +1,124 @@
+# Python Modules
+import time
+
+class Sample(object):
+    """
+    Preallocated ring buffer slot holding one message
+    """
+
+    __slots__ = ('msgData', 'msgType', 'timestamp')
+
+    def __init__(self):
+        """
+        Constructor
+
+        @param None
+
+        @return None
+        """
+
+        self.msgData = None
+        self.msgType = None
+        self.timestamp = None
+
+class RingBuffer(object):
+    """
+    Single producer, single consumer ring buffer of preallocated sample slots.
+
+    The producer only writes the write index and the consumer only writes the read index,
+    so neither side takes a lock. A slot is filled before the write index is advanced past
+    it and is not reused until the consumer has advanced the read index past it.
+    """
+
+    def __init__(self, capacity=256):
+        """
+        Constructor
+
+        @param capacity: The number of slots (rounded up to a power of two)
+
+        @return None
+        """
+
+        size = 1
+
+        while size < capacity:
+            size *= 2
+
+        self._slots = [Sample() for i in range(size)]
+        self._capacity = size
+        self._mask = size - 1
+
+        self._writeIndex = 0
+        self._readIndex = 0
+
+        self.numDropped = 0
+
+    def put(self, msgData, msgType, timestamp=None):
+        """
+        Writes a message into the next slot (producer only). The message is dropped
+        when the consumer has fallen a full buffer behind.
+
+        @param msgData:   The message data (string)
+        @param msgType:   The type of message
+        @param timestamp: The time the message was produced (monotonic seconds), or None for now
+
+        @return True if the message was written, otherwise False
+        """
+
+        index = self._writeIndex
+
+        if index - self._readIndex >= self._capacity:
+            self.numDropped += 1
+
+            return False
+
+        sample = self._slots[index & self._mask]
+        sample.msgData = msgData
+        sample.msgType = msgType
+        sample.timestamp = time.monotonic() if timestamp is None else timestamp
+
+        self._writeIndex = index + 1
+
+        return True
+
+    def drain(self):
+        """
+        Iterates over every message written before the drain started (consumer only).
+        The slots are released once the iteration completes, so they must not be kept.
+
+        @param None
+
+        @return Generator of samples, oldest first
+        """
+
+        readIndex = self._readIndex
+        writeIndex = self._writeIndex
+
+        while readIndex < writeIndex:
+            yield self._slots[readIndex & self._mask]
+
+            readIndex += 1
+
+        self._readIndex = readIndex
+
+    def isFull(self):
+        """
+        Checks to see if the next message would be dropped
+
+        @param None
+
+        @return True if every slot holds a message the consumer has not read, otherwise False
+        """
+
+        return self._writeIndex - self._readIndex >= self._capacity
+
+    def __len__(self):
+        """
+        Retrieves the number of messages waiting to be drained
+
+        @param None
+
+        @return The number of messages
+        """
+
+        return self._writeIndex - self._readIndex
@@ -1,70 +1,118 @@
 # Python Modules
-import json
-import pigpio
-import serial
 import struct
-import threading
-import time
 
 # Project Modules
+from acquisition_scheduler import Sensor, SensorState
 from message_handler import MessageType
 
-class RPYReader(threading.Thread):
+# Bus Modules (only the selected bus is imported, see RPYReader.open)
+pigpio = None
+serial = None
+
+class RPYReader(Sensor):
     """
     Class used for reading roll, pitch, yaw data from an Arduino over serial
     """
 
-    def __init__(self, msgQueue, useSerial=True, readPeriod=0.1):
+    # Sensor name (reported to clients in the handshake)
+    sensorName = 'rpy'
+
+    # Time between commanding the Arduino to read from the IMU and reading the result over I2C
+    _i2cReadDelay = 0.2
+
+    # Time to wait before reestablishing the I2C connection after a failed read
+    _i2cReconnectDelay = 1
+
+    def __init__(self, ringBuffer, useSerial=True, readPeriod=0.1):
         """
         Constructor
 
-        @param msgQueue   The queue to place GPS messages on
+        @param ringBuffer The ring buffer to place RPY messages on
         @param useSerial  Flag dictating whether to use Serial or I2C bus
         @param readPeriod The time between RPY reads (seconds)
 
         @return None
         """
 
-        threading.Thread.__init__(self)
-
-        self.shutdownEvent = threading.Event()
+        Sensor.__init__(self, ringBuffer, RPYReader.sensorName, readPeriod)
 
-        self._msgQueue = msgQueue
         self._useSerial = useSerial
-        self._readPeriod = readPeriod
 
-        # Initialize the specified bus
-        if useSerial:
-            self.__establishSerConn()
-        else:
-            self._gpio = pigpio.pi()
-            self._gpioHandle = self._gpio.i2c_open(1, 0x05)
-    
-    def run(self):
+        self._serialBuffer = b''
+        self._serialSupervisor = None
+
+        self._gpio = None
+        self._gpioHandle = None
+        self._i2cReadPending = False
+
+    @staticmethod
+    def getMsgTypes(**sensorArgs):
+        """
+        Retrieves the messages a reader configured with the specified arguments publishes
+        (reported to clients in the handshake)
+
+        @param sensorArgs: The constructor arguments
+
+        @return Tuple of message types
+        """
+
+        return (MessageType.RPY_MESSAGE,)
+
+    def open(self):
         """
-        Overriden method called when the thread is started
+        Overriden method called by the scheduler to initialize the specified bus
 
         @param None
 
         @return None
         """
-        
-        # Run until told to stop
-        while not self.shutdownEvent.is_set():
-            rpyData = self.__getRPYData()
 
-            # Broadcast RPY data
-            if rpyData:
-                msgData = json.dumps(rpyData)
+        global pigpio, serial
 
-                self._msgQueue.put((msgData, MessageType.RPY_MESSAGE))
+        if self._useSerial:
+            import serial
+
+            from serial_supervisor import SerialSupervisor
 
-            time.sleep(self._readPeriod)
+            # Connect in the background so a missing Arduino never stalls acquisition
+            self._serialSupervisor = SerialSupervisor(readTimeout=0)
+            self._serialSupervisor.start()
+
+            self.setState(SensorState.DOWN)
+        else:
+            import pigpio
 
-        # Cleanup
-        self.__shutdown()
+            self.__establishI2CConn()
 
-    def __getRPYData(self):
+    def poll(self):
+        """
+        Overriden method called by the scheduler to read RPY data
+
+        @param None
+
+        @return The delay until the next read (seconds), or None to use the read period
+        """
+
+        if self._useSerial:
+            rpyData = self.__getSerialRPYData()
+        else:
+            # Command the Arduino to read from the IMU and come back for the result
+            if not self._i2cReadPending:
+                return self.__commandI2CRead()
+
+            rpyData = self.__getI2CRPYData()
+
+        # Broadcast RPY data
+        if rpyData:
+            self.publish(rpyData, MessageType.RPY_MESSAGE)
+
+        # Give the Arduino time before reestablishing the I2C connection
+        if not self._useSerial and self._gpio is None:
+            return RPYReader._i2cReconnectDelay
+
+        return None
+
+    def __getSerialRPYData(self):
         """
         Retrieves RPY data from an Arduino over serial
 
@@ -75,90 +123,155 @@ class RPYReader(threading.Thread):
 
         rpyData = {}
 
-        # Check to see if serial is being used
-        if self._useSerial:
-            # Retrieve serial data
-            try:
-                serialData = self._serialPort.readline().decode()
-                serialData = serialData.rstrip('\r\n')
+        serialPort = self._serialSupervisor.getPort()
 
-                # Split serial data to find RPY
-                serialDataParts = serialData.split(',')
+        # Publish the sensor down state while the connection is being reestablished
+        if serialPort is None:
+            self.setState(SensorState.DOWN)
 
-                if len(serialDataParts) == 3:
-                    rpyData['roll'] = float(serialDataParts[0])
-                    rpyData['pitch'] = float(serialDataParts[1])
-                    rpyData['yaw'] = float(serialDataParts[2])
-                else:
-                    print(serialData)
-            except serial.serialutil.SerialException:
-                print('Exception while reading RPY data. Attempting to reestabilish serial connection...')
+            rpyData['roll'] = None
+            rpyData['pitch'] = None
+            rpyData['yaw'] = None
+            rpyData['status'] = 'down'
 
-                self._serialPort.close()
+            return rpyData
 
-                time.sleep(1)
+        self.setState(SensorState.READY)
 
-                self.__establishSerConn()
-        # I2C bus is being used
-        else:
-            try:
-                # Command the Arduino to read from the IMU
-                self._gpio.i2c_write_byte(self._gpioHandle, 1)
+        # Retrieve whatever serial data has arrived without blocking
+        try:
+            self._serialBuffer += serialPort.read(max(serialPort.in_waiting, 1))
+        except (OSError, serial.serialutil.SerialException):
+            print('Exception while reading RPY data. Attempting to reestabilish serial connection...')
+
+            self._serialBuffer = b''
+            self._serialSupervisor.reportFailure()
+
+            return rpyData
 
-                time.sleep(.2)
+        # Keep only the most recent complete line and any partial line that follows it
+        lines = self._serialBuffer.split(b'\n')
+        self._serialBuffer = lines.pop()
 
-                # Read the RPY data
-                numBytesRead, readBytes = self._gpio.i2c_read_device(self._gpioHandle, 12)
+        if not lines:
+            return rpyData
 
-                # Check to make sure the read was successful
-                if numBytesRead == 12:
-                    rollBytes = bytes(readBytes[0:4])
-                    pitchBytes = bytes(readBytes[4:8])
-                    yawBytes = bytes(readBytes[8:12])
+        serialData = lines[-1].decode(errors='replace')
+        serialData = serialData.rstrip('\r\n')
 
-                    rpyData['roll'] = struct.unpack('f', rollBytes)[0]
-                    rpyData['pitch'] = struct.unpack('f', pitchBytes)[0]
-                    rpyData['yaw'] = struct.unpack('f', yawBytes)[0]
-                # The read was not successful
-                else:
-                    print('Invalid I2C read. Attempting to reestablish I2C connection...')
+        # Split serial data to find RPY
+        serialDataParts = serialData.split(',')
 
-                    self._gpio.i2c_close(self._gpioHandle)
-                    self._gpio.stop()
+        try:
+            if len(serialDataParts) == 3:
+                rpyData['roll'] = float(serialDataParts[0])
+                rpyData['pitch'] = float(serialDataParts[1])
+                rpyData['yaw'] = float(serialDataParts[2])
+                rpyData['status'] = 'ok'
+            else:
+                print(serialData)
+        except ValueError:
+            print(serialData)
 
-                    time.sleep(1)
+            rpyData = {}
 
-                    self._gpio = pigpio.pi()
-                    self._gpioHandle = self._gpio.i2c_open(1, 0x05)
-            except (OSError, pigpio.error) as e:
-                print('Exception while reading/writing over I2C. Make sure the Arduino is connected to the I2C bus.')
+        return rpyData
+
+    def __commandI2CRead(self):
+        """
+        Commands the Arduino to read from the IMU
+
+        @param None
+
+        @return The delay until the RPY data can be read (seconds)
+        """
+
+        # Reestablish the I2C connection after a failed read
+        if self._gpio is None:
+            self.__establishI2CConn()
+
+        try:
+            self._gpio.i2c_write_byte(self._gpioHandle, 1)
+
+            self._i2cReadPending = True
+
+            return RPYReader._i2cReadDelay
+        except (OSError, pigpio.error) as e:
+            print('Exception while reading/writing over I2C. Make sure the Arduino is connected to the I2C bus.')
+
+            return None
+
+    def __getI2CRPYData(self):
+        """
+        Retrieves RPY data from an Arduino over I2C
+
+        @param None
+
+        @return RPY data (dictionary)
+        """
+
+        rpyData = {}
+
+        self._i2cReadPending = False
+
+        try:
+            # Read the RPY data
+            numBytesRead, readBytes = self._gpio.i2c_read_device(self._gpioHandle, 12)
+
+            # Check to make sure the read was successful
+            if numBytesRead == 12:
+                rollBytes = bytes(readBytes[0:4])
+                pitchBytes = bytes(readBytes[4:8])
+                yawBytes = bytes(readBytes[8:12])
+
+                rpyData['roll'] = struct.unpack('f', rollBytes)[0]
+                rpyData['pitch'] = struct.unpack('f', pitchBytes)[0]
+                rpyData['yaw'] = struct.unpack('f', yawBytes)[0]
+                rpyData['status'] = 'ok'
+
+                self.setState(SensorState.READY)
+            # The read was not successful
+            else:
+                print('Invalid I2C read. Attempting to reestablish I2C connection...')
+
+                self.setState(SensorState.DOWN)
+
+                self.__closeI2CConn()
+        except (OSError, pigpio.error) as e:
+            print('Exception while reading/writing over I2C. Make sure the Arduino is connected to the I2C bus.')
 
         return rpyData
 
-    def __establishSerConn(self):
+    def __establishI2CConn(self):
         """
-        Etablishes a serial connection on a ttyACM* port
+        Etablishes an I2C connection with the Arduino
 
         @param None
 
         @return None
         """
 
-        for portNum in range(0, 10):
-            try:
-                port = '/dev/ttyACM' + str(portNum)
+        self._gpio = pigpio.pi()
+        self._gpioHandle = self._gpio.i2c_open(1, 0x05)
+
+    def __closeI2CConn(self):
+        """
+        Closes the I2C connection with the Arduino
+
+        @param None
 
-                self._serialPort = serial.Serial(port, 115200)
+        @return None
+        """
 
-                print('Successfully (re)established serial connection on port: %s' % port)
+        self._gpio.i2c_close(self._gpioHandle)
+        self._gpio.stop()
 
-                break
-            except serial.serialutil.SerialException:
-                pass
+        self._gpio = None
+        self._gpioHandle = None
 
-    def __shutdown(self):
+    def close(self):
         """
-        Performs shutdown procedures for the thread
+        Overriden method called by the scheduler to perform shutdown procedures for the sensor
 
         @param None
 
@@ -166,7 +279,8 @@ class RPYReader(threading.Thread):
         """
 
         if self._useSerial:
-            self._serialPort.close()
-        else:
-            self._gpio.i2c_close(self._gpioHandle)
-            self._gpio.stop()
+            if self._serialSupervisor is not None:
+                self._serialSupervisor.shutdownEvent.set()
+                self._serialSupervisor.join()
+        elif self._gpio is not None:
+            self.__closeI2CConn()
@@ -0,0 +1,175 @@
+# Python Modules
+import glob
+import os
+import serial
+import threading
+
+class SerialSupervisor(threading.Thread):
+    """
+    Class used for (re)establishing a serial connection in the background
+    """
+
+    def __init__(self, baudRate=115200, devicePattern='ttyACM*', readTimeout=0.1,
+                 pollPeriod=0.5, minBackoff=0.5, maxBackoff=30):
+        """
+        Constructor
+
+        @param baudRate:      The serial baud rate
+        @param devicePattern: The tty device name pattern to watch for in sysfs
+        @param readTimeout:   The serial read timeout (seconds)
+        @param pollPeriod:    The time between health checks while connected (seconds)
+        @param minBackoff:    The initial time between reconnection attempts (seconds)
+        @param maxBackoff:    The maximum time between reconnection attempts (seconds)
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        self.shutdownEvent = threading.Event()
+
+        self._baudRate = baudRate
+        self._devicePattern = devicePattern
+        self._readTimeout = readTimeout
+        self._pollPeriod = pollPeriod
+        self._minBackoff = minBackoff
+        self._maxBackoff = maxBackoff
+
+        self._backoff = minBackoff
+        self._lastGoodPort = None
+        self._serialPort = None
+        self._serialPortMutex = threading.Lock()
+        self._reconnectEvent = threading.Event()
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        while not self.shutdownEvent.is_set():
+            # Check to see if the connection is still healthy
+            if self._serialPort is not None:
+                self._reconnectEvent.wait(self._pollPeriod)
+                self._reconnectEvent.clear()
+
+                # The device disappeared from sysfs without a read failing
+                if self._serialPort is not None and not os.path.exists(self._serialPort.port):
+                    self.reportFailure()
+
+                continue
+
+            # Attempt to reestablish the connection
+            if self.__establishSerConn():
+                self._backoff = self._minBackoff
+            else:
+                self.shutdownEvent.wait(self._backoff)
+
+                self._backoff = min(self._backoff * 2, self._maxBackoff)
+
+        # Cleanup
+        self.__shutdown()
+
+    def getPort(self):
+        """
+        Retrieves the current serial port
+
+        @param None
+
+        @return The serial port, or None if the connection is down
+        """
+
+        return self._serialPort
+
+    def reportFailure(self):
+        """
+        Marks the current serial connection as failed so that
+        it is reestablished in the background
+
+        @param None
+
+        @return None
+        """
+
+        with self._serialPortMutex:
+            serialPort = self._serialPort
+            self._serialPort = None
+
+        if serialPort is not None:
+            print('Serial connection on port %s lost. Reestablishing in the background...' % serialPort.port)
+
+            try:
+                serialPort.close()
+            except (OSError, serial.serialutil.SerialException):
+                pass
+
+        self._reconnectEvent.set()
+
+    def __getCandidatePorts(self):
+        """
+        Retrieves the serial ports currently present in sysfs, with
+        the last port that connected successfully tried first
+
+        @param None
+
+        @return List of serial port paths
+        """
+
+        ports = []
+
+        for devicePath in sorted(glob.glob(os.path.join('/sys/class/tty', self._devicePattern))):
+            ports.append(os.path.join('/dev', os.path.basename(devicePath)))
+
+        if self._lastGoodPort in ports:
+            ports.remove(self._lastGoodPort)
+            ports.insert(0, self._lastGoodPort)
+
+        return ports
+
+    def __establishSerConn(self):
+        """
+        Attempts to establish a serial connection on one of the candidate ports
+
+        @param None
+
+        @return True if a connection was established, otherwise False
+        """
+
+        for port in self.__getCandidatePorts():
+            if self.shutdownEvent.is_set():
+                break
+
+            try:
+                serialPort = serial.Serial(port, self._baudRate, timeout=self._readTimeout)
+            except serial.serialutil.SerialException:
+                continue
+
+            with self._serialPortMutex:
+                self._serialPort = serialPort
+
+            self._lastGoodPort = port
+
+            print('Successfully (re)established serial connection on port: %s' % port)
+
+            return True
+
+        return False
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        with self._serialPortMutex:
+            serialPort = self._serialPort
+            self._serialPort = None
+
+        if serialPort is not None:
+            serialPort.close()
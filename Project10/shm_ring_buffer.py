@@ -0,0 +1,193 @@
+# Python Modules
+import multiprocessing
+import struct
+import threading
+import time
+
+from multiprocessing import resource_tracker, shared_memory
+
+class SharedRingBuffer(object):
+    """
+    Lock-free single producer ring buffer of messages in shared memory.
+
+    The producer writes each message into the next slot and only then advances the write
+    index. A slot's sequence number is cleared while it is being overwritten and set to the
+    message index once it is complete, so a consumer can tell when the producer lapped it
+    during a read. Consumers keep their own read index and never write to the buffer.
+    """
+
+    # Write index, capacity, slot size (padded to a cache line)
+    _headerFormat = struct.Struct('QII')
+    _headerSize = 64
+
+    # Sequence number followed by the message type, message length and timestamp
+    _slotFormat = struct.Struct('<IId')
+    _slotHeaderSize = 24
+
+    def __init__(self, name, capacity=1024, slotSize=512, create=False):
+        """
+        Constructor
+
+        @param name:     The name of the shared memory block
+        @param capacity: The number of slots (only used when creating)
+        @param slotSize: The size of each slot in bytes, including its header (a multiple of 8, only used when creating)
+        @param create:   Flag denoting whether to create the buffer or attach to an existing one
+
+        @return None
+        """
+
+        self._create = create
+
+        if create:
+            # Replace a buffer left behind by a server that did not shut down cleanly
+            try:
+                staleMemory = shared_memory.SharedMemory(name)
+                staleMemory.close()
+                staleMemory.unlink()
+            except FileNotFoundError:
+                pass
+
+            self._sharedMemory = shared_memory.SharedMemory(name, create=True,
+                                                           size=SharedRingBuffer._headerSize + capacity * slotSize)
+
+            SharedRingBuffer._headerFormat.pack_into(self._sharedMemory.buf, 0, 0, capacity, slotSize)
+        else:
+            try:
+                self._sharedMemory = shared_memory.SharedMemory(name, track=False)
+            except TypeError:
+                # Before Python 3.13 attaching registers the block with the resource tracker,
+                # which would remove it when this process exits
+                self._sharedMemory = shared_memory.SharedMemory(name)
+
+                # A process started by multiprocessing shares the resource tracker of its parent
+                if multiprocessing.parent_process() is None:
+                    resource_tracker.unregister(self._sharedMemory._name, 'shared_memory')
+
+        self._buf = self._sharedMemory.buf
+
+        # The write index and slot sequence numbers are accessed through a view of 64 bit words,
+        # which copies each one in a single store. Struct packing clears the target bytes before
+        # writing them, so a reader could see half of an update.
+        self._words = self._buf.cast('Q')
+
+        writeIndex, self._capacity, self._slotSize = SharedRingBuffer._headerFormat.unpack_from(self._buf, 0)
+
+        self._maxMsgSize = self._slotSize - SharedRingBuffer._slotHeaderSize
+
+        # Producer side write index and consumer side read index (each kept locally)
+        self._writeIndex = writeIndex
+        self._readIndex = writeIndex
+
+        self._writeMutex = threading.Lock()
+
+        self.numDropped = 0
+
+    def put(self, msgData, msgType, timestamp=None):
+        """
+        Writes a message into the buffer, so the buffer can stand in for an in process ring buffer
+
+        @param msgData:   The message data (string)
+        @param msgType:   The type of message
+        @param timestamp: The time the message was produced (monotonic seconds), or None for now
+
+        @return True if the message was written, otherwise False
+        """
+
+        return self.write(msgData.encode(), msgType, time.monotonic() if timestamp is None else timestamp)
+
+    def write(self, data, msgType, timestamp):
+        """
+        Writes a message into the next slot (producer only)
+
+        @param data:      The message data (bytes)
+        @param msgType:   The type of message
+        @param timestamp: The time the message was produced (monotonic seconds, shared by every process)
+
+        @return True if the message was written, otherwise False (too large for a slot)
+        """
+
+        if len(data) > self._maxMsgSize:
+            print('Dropping %d byte message of type %d that does not fit in a ring buffer slot' % (len(data), msgType))
+
+            return False
+
+        # Several sensors may publish at once, but readers only ever see one producer
+        with self._writeMutex:
+            index = self._writeIndex
+            offset = SharedRingBuffer._headerSize + (index % self._capacity) * self._slotSize
+            dataOffset = offset + SharedRingBuffer._slotHeaderSize
+
+            # Invalidate the slot, fill it, then publish it
+            self._words[offset // 8] = 0
+
+            SharedRingBuffer._slotFormat.pack_into(self._buf, offset + 8, msgType, len(data), timestamp)
+
+            self._buf[dataOffset:dataOffset + len(data)] = data
+
+            self._words[offset // 8] = index + 1
+
+            self._writeIndex = index + 1
+            self._words[0] = self._writeIndex
+
+        return True
+
+    def read(self, maxMsgs=None):
+        """
+        Reads every message written since the last read (consumer only)
+
+        @param maxMsgs: The maximum number of messages to read, or None for all of them
+
+        @return List of (msgData, msgType, timestamp) tuples, oldest first
+        """
+
+        writeIndex = self._words[0]
+
+        # The producer lapped the consumer, so the oldest messages are gone
+        if writeIndex - self._readIndex > self._capacity:
+            self.numDropped += writeIndex - self._capacity - self._readIndex
+            self._readIndex = writeIndex - self._capacity
+
+        if maxMsgs is not None:
+            writeIndex = min(writeIndex, self._readIndex + maxMsgs)
+
+        msgs = []
+
+        for index in range(self._readIndex, writeIndex):
+            offset = SharedRingBuffer._headerSize + (index % self._capacity) * self._slotSize
+            dataOffset = offset + SharedRingBuffer._slotHeaderSize
+
+            seq = self._words[offset // 8]
+            msgType, length, timestamp = SharedRingBuffer._slotFormat.unpack_from(self._buf, offset + 8)
+
+            data = bytes(self._buf[dataOffset:dataOffset + min(length, self._maxMsgSize)])
+
+            # Check that the producer did not overwrite the slot while it was being read
+            seqAfter = self._words[offset // 8]
+
+            if seq != index + 1 or seqAfter != seq:
+                self.numDropped += 1
+
+                continue
+
+            msgs.append((data.decode(), msgType, timestamp))
+
+        self._readIndex = writeIndex
+
+        return msgs
+
+    def close(self):
+        """
+        Detaches from the buffer, removing it if this is the creator
+
+        @param None
+
+        @return None
+        """
+
+        self._words.release()
+
+        self._buf = None
+        self._sharedMemory.close()
+
+        if self._create:
+            self._sharedMemory.unlink()
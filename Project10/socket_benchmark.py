@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+# Python Modules
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+
+# Project Modules
+from message_handler import MessageType, MessageHandler
+from socket_profile import SOCKET_PROFILES
+
+class SocketBenchmark(object):
+    """
+    Measures telemetry latency and send cost over a socket with each socket profile
+    """
+
+    def __init__(self, address='127.0.0.1', numFrames=2000, burstSize=5, sendPeriod=0.01):
+        """
+        Constructor
+
+        @param address:    The local address to run both ends of the benchmark on
+        @param numFrames:  The number of RPY frames to send per run
+        @param burstSize:  The number of frames sent back to back, like the TCP sender draining its queue
+        @param sendPeriod: The time between bursts (seconds)
+
+        @return None
+        """
+
+        self._address = address
+        self._numFrames = numFrames
+        self._burstSize = burstSize
+        self._sendPeriod = sendPeriod
+
+    def run(self, profileName, useSendFrames):
+        """
+        Runs the benchmark with the specified profile
+
+        @param profileName:   The name of the socket profile
+        @param useSendFrames: Flag denoting whether bursts are sent with one scatter-gather call
+
+        @return Dictionary of results
+        """
+
+        profile = SOCKET_PROFILES[profileName]
+
+        serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        serverSocket.bind((self._address, 0))
+        serverSocket.listen(1)
+
+        latencies = []
+
+        receiver = threading.Thread(target=self.__receive, args=(serverSocket.getsockname(), profile, latencies))
+        receiver.start()
+
+        sock, address = serverSocket.accept()
+        profile.apply(sock)
+
+        sendTime = 0
+        numSent = 0
+
+        while numSent < self._numFrames:
+            frames = []
+
+            for i in range(min(self._burstSize, self._numFrames - numSent)):
+                msg = json.dumps({'roll': 1.0, 'pitch': 2.0, 'yaw': 3.0, 'sent': time.monotonic()})
+
+                frames.append(MessageHandler.encodeMsg(msg, MessageType.RPY_MESSAGE))
+
+            startTime = time.perf_counter()
+
+            if useSendFrames:
+                MessageHandler.sendFrames(sock, frames)
+            else:
+                for frame in frames:
+                    sock.sendall(frame)
+
+            sendTime += time.perf_counter() - startTime
+            numSent += len(frames)
+
+            time.sleep(self._sendPeriod)
+
+        receiver.join()
+
+        sock.close()
+        serverSocket.close()
+
+        latencies.sort()
+
+        return {
+            'profile': profileName,
+            'sendFrames': useSendFrames,
+            'meanLatency': sum(latencies) / len(latencies) * 1000,
+            'p99Latency': latencies[int(len(latencies) * 0.99)] * 1000,
+            'maxLatency': latencies[-1] * 1000,
+            'sendCost': sendTime / numSent * 1e6,
+        }
+
+    def __receive(self, address, profile, latencies):
+        """
+        Receives the benchmark frames, recording the latency of each one
+
+        @param address:   The benchmark server address
+        @param profile:   The socket profile
+        @param latencies: List the latencies are appended to (seconds)
+
+        @return None
+        """
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        profile.apply(sock)
+        sock.connect(address)
+
+        while len(latencies) < self._numFrames:
+            header = MessageHandler.recvAll(sock, 8)
+            msgSize, msgType = struct.unpack('!II', header)
+
+            msg = json.loads(MessageHandler.recvAll(sock, msgSize).decode())
+
+            latencies.append(time.monotonic() - msg['sent'])
+
+        sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compares telemetry latency across socket profiles')
+    parser.add_argument('--address', default='127.0.0.1', help='The address to run the benchmark on')
+    parser.add_argument('--frames', type=int, default=2000, help='The number of frames per run')
+    args = parser.parse_args()
+
+    benchmark = SocketBenchmark(args.address, args.frames)
+
+    print('%-12s %-10s %12s %12s %12s %14s' % ('Profile', 'sendmsg', 'Mean (ms)', 'P99 (ms)', 'Max (ms)', 'Send (us/msg)'))
+
+    for profileName in sorted(SOCKET_PROFILES):
+        for useSendFrames in (False, True):
+            results = benchmark.run(profileName, useSendFrames)
+
+            print('%-12s %-10s %12.3f %12.3f %12.3f %14.2f' % (profileName, useSendFrames, results['meanLatency'],
+                                                             results['p99Latency'], results['maxLatency'],
+                                                             results['sendCost']))
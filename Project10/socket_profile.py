@@ -0,0 +1,91 @@
+# Python Modules
+import socket
+
+class SocketProfile(object):
+    """
+    Class that holds the socket options applied to TCP client connections
+    """
+
+    def __init__(self, noDelay=False, sendBufferSize=None, notSentLowWatermark=None, keepAlive=False,
+                 keepAliveIdle=None, keepAliveInterval=None, keepAliveCount=None, userTimeout=None):
+        """
+        Constructor
+
+        @param noDelay:             Flag denoting whether to disable Nagle's algorithm (TCP_NODELAY)
+        @param sendBufferSize:      The kernel send buffer size (bytes), or None for the default
+        @param notSentLowWatermark: The amount of unsent data (bytes) above which the socket is not
+                                    reported as writable (TCP_NOTSENT_LOWAT), or None for the default
+        @param keepAlive:           Flag denoting whether to send keepalive probes
+        @param keepAliveIdle:       The idle time before the first keepalive probe (seconds)
+        @param keepAliveInterval:   The time between keepalive probes (seconds)
+        @param keepAliveCount:      The number of unanswered probes before the connection is dropped
+        @param userTimeout:         The time sent data may remain unacknowledged before the
+                                    connection is dropped (milliseconds, TCP_USER_TIMEOUT)
+
+        @return None
+        """
+
+        self.noDelay = noDelay
+        self.sendBufferSize = sendBufferSize
+        self.notSentLowWatermark = notSentLowWatermark
+        self.keepAlive = keepAlive
+        self.keepAliveIdle = keepAliveIdle
+        self.keepAliveInterval = keepAliveInterval
+        self.keepAliveCount = keepAliveCount
+        self.userTimeout = userTimeout
+
+    def apply(self, sock):
+        """
+        Applies the profile to a socket. Options are only applied to TCP sockets,
+        and options the platform does not support are skipped.
+
+        @param sock: The socket
+
+        @return None
+        """
+
+        if getattr(sock, 'family', None) not in (socket.AF_INET, socket.AF_INET6):
+            return
+
+        options = []
+
+        if self.noDelay:
+            options.append((socket.IPPROTO_TCP, 'TCP_NODELAY', 1))
+
+        if self.sendBufferSize is not None:
+            options.append((socket.SOL_SOCKET, 'SO_SNDBUF', self.sendBufferSize))
+
+        if self.notSentLowWatermark is not None:
+            options.append((socket.IPPROTO_TCP, 'TCP_NOTSENT_LOWAT', self.notSentLowWatermark))
+
+        if self.keepAlive:
+            options.append((socket.SOL_SOCKET, 'SO_KEEPALIVE', 1))
+
+            if self.keepAliveIdle is not None:
+                options.append((socket.IPPROTO_TCP, 'TCP_KEEPIDLE', self.keepAliveIdle))
+
+            if self.keepAliveInterval is not None:
+                options.append((socket.IPPROTO_TCP, 'TCP_KEEPINTVL', self.keepAliveInterval))
+
+            if self.keepAliveCount is not None:
+                options.append((socket.IPPROTO_TCP, 'TCP_KEEPCNT', self.keepAliveCount))
+
+        if self.userTimeout is not None:
+            options.append((socket.IPPROTO_TCP, 'TCP_USER_TIMEOUT', self.userTimeout))
+
+        for level, optionName, value in options:
+            option = getattr(socket, optionName, None)
+
+            if option is not None:
+                sock.setsockopt(level, option, value)
+
+# Profiles that can be selected by name
+SOCKET_PROFILES = {
+    # Operating system defaults
+    'default': SocketProfile(),
+
+    # Small frames are sent immediately, at most ~16 KB may queue in the kernel on slow
+    # links, and dead peers are detected within a few seconds
+    'lowLatency': SocketProfile(noDelay=True, sendBufferSize=16384, notSentLowWatermark=4096, keepAlive=True,
+                                keepAliveIdle=2, keepAliveInterval=1, keepAliveCount=3, userTimeout=5000),
+}
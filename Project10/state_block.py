@@ -0,0 +1,197 @@
+# Python Modules
+import math
+import multiprocessing
+import struct
+import threading
+
+from multiprocessing import resource_tracker, shared_memory
+
+# Project Modules
+from message_handler import MessageType
+
+class StateBlock(object):
+    """
+    Shared memory block holding the latest GPS and RPY state for processes on the vehicle.
+
+    The block is protected by a sequence lock: the writer makes the sequence number odd
+    while it updates the block and even again once it is done. Readers never take a lock or
+    make a system call, they retry whenever the sequence number was odd or changed while
+    they were reading.
+    """
+
+    _seqFormat = struct.Struct('Q')
+
+    # Receive time (monotonic seconds), lat, lon, alt, speed, climb, epx, epy, epv, GPS time (ISO 8601)
+    _gpsFormat = struct.Struct('<d8d32s')
+    _gpsFields = ('lat', 'lon', 'alt', 'speed', 'climb', 'epx', 'epy', 'epv')
+    _gpsOffset = _seqFormat.size
+
+    # Receive time (monotonic seconds), roll, pitch, yaw
+    _rpyFormat = struct.Struct('<d3d')
+    _rpyFields = ('roll', 'pitch', 'yaw')
+    _rpyOffset = _gpsOffset + _gpsFormat.size
+
+    size = _rpyOffset + _rpyFormat.size
+
+    # Number of times a read is retried before giving up on a writer that stopped part way through a write
+    _maxReadAttempts = 10000
+
+    def __init__(self, name='rpi_telemetry', create=False):
+        """
+        Constructor
+
+        @param name:   The name of the shared memory block
+        @param create: Flag denoting whether to create the block (writer) or attach to it (reader)
+
+        @return None
+        """
+
+        self._create = create
+
+        if create:
+            # Replace a block left behind by a server that did not shut down cleanly
+            try:
+                staleMemory = shared_memory.SharedMemory(name)
+                staleMemory.close()
+                staleMemory.unlink()
+            except FileNotFoundError:
+                pass
+
+            self._sharedMemory = shared_memory.SharedMemory(name, create=True, size=StateBlock.size)
+
+            # Nothing has been received yet
+            buf = self._sharedMemory.buf
+
+            StateBlock._seqFormat.pack_into(buf, 0, 0)
+            StateBlock._gpsFormat.pack_into(buf, StateBlock._gpsOffset, 0, *([math.nan] * 8 + [b'']))
+            StateBlock._rpyFormat.pack_into(buf, StateBlock._rpyOffset, 0, *([math.nan] * 3))
+        else:
+            self._sharedMemory = StateBlock.__attach(name)
+
+        self._buf = self._sharedMemory.buf
+        self._writeMutex = threading.Lock()
+
+        # The sequence number is accessed through a view of 64 bit words, which copies it in a
+        # single store. Struct packing clears the target bytes before writing them, so a reader
+        # could see half of an update.
+        self._words = self._buf.cast('Q')
+
+    def update(self, msgType, data, now):
+        """
+        Writes the latest sample of a message type into the block
+
+        @param msgType: The type of message
+        @param data:    The message data (dictionary)
+        @param now:     The receive time (monotonic seconds)
+
+        @return None
+        """
+
+        if msgType == MessageType.GPS_MESSAGE:
+            fmt = StateBlock._gpsFormat
+            offset = StateBlock._gpsOffset
+            values = [now] + [StateBlock.__toFloat(data.get(field)) for field in StateBlock._gpsFields]
+            values.append((data.get('time') or '').encode()[:32])
+        elif msgType == MessageType.RPY_MESSAGE:
+            fmt = StateBlock._rpyFormat
+            offset = StateBlock._rpyOffset
+            values = [now] + [StateBlock.__toFloat(data.get(field)) for field in StateBlock._rpyFields]
+        else:
+            return
+
+        # Several sensors may publish at once, but readers only ever see one writer
+        with self._writeMutex:
+            seq = self._words[0]
+
+            self._words[0] = seq + 1
+            fmt.pack_into(self._buf, offset, *values)
+            self._words[0] = seq + 2
+
+    def read(self):
+        """
+        Reads a consistent snapshot of the block
+
+        @param None
+
+        @return Dictionary with 'gps' and 'rpy' entries, each holding the latest sample
+                (values that have not been received are NaN), or None if no consistent
+                snapshot could be read
+        """
+
+        for attempt in range(StateBlock._maxReadAttempts):
+            seqBefore = self._words[0]
+
+            # A write is in progress
+            if seqBefore & 1:
+                continue
+
+            gpsValues = StateBlock._gpsFormat.unpack_from(self._buf, StateBlock._gpsOffset)
+            rpyValues = StateBlock._rpyFormat.unpack_from(self._buf, StateBlock._rpyOffset)
+
+            seqAfter = self._words[0]
+
+            if seqBefore == seqAfter:
+                break
+        else:
+            return None
+
+        gpsData = dict(zip(StateBlock._gpsFields, gpsValues[1:9]))
+        gpsData['receiveTime'] = gpsValues[0]
+        gpsData['time'] = gpsValues[9].rstrip(b'\0').decode()
+
+        rpyData = dict(zip(StateBlock._rpyFields, rpyValues[1:]))
+        rpyData['receiveTime'] = rpyValues[0]
+
+        return {'seq': seqAfter, 'gps': gpsData, 'rpy': rpyData}
+
+    def close(self):
+        """
+        Detaches from the block, removing it if this is the writer
+
+        @param None
+
+        @return None
+        """
+
+        self._words.release()
+
+        self._buf = None
+        self._sharedMemory.close()
+
+        if self._create:
+            self._sharedMemory.unlink()
+
+    @staticmethod
+    def __attach(name):
+        """
+        Attaches to an existing shared memory block without taking ownership of it
+
+        @param name: The name of the shared memory block
+
+        @return The shared memory block
+        """
+
+        try:
+            return shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the block with the resource tracker,
+            # which would remove it when this reader exits
+            sharedMemory = shared_memory.SharedMemory(name)
+
+            # A process started by multiprocessing shares the resource tracker of its parent
+            if multiprocessing.parent_process() is None:
+                resource_tracker.unregister(sharedMemory._name, 'shared_memory')
+
+            return sharedMemory
+
+    @staticmethod
+    def __toFloat(value):
+        """
+        Converts a message value to a float, using NaN for missing values
+
+        @param value: The value
+
+        @return The float value
+        """
+
+        return math.nan if value is None else float(value)
@@ -1,33 +1,50 @@
 # Python Modules
-import bluetooth
-import colorama
-import json
+import argparse
+import math
 import os
-import pprint
 import select
 import signal
-import socket
 import threading
 import time
 
 # Project Modules
-from message_handler import MessageType, MessageHandler
+from batch_decoder import SampleBatch
+from message_handler import MessageType
+from multicast_receiver import MulticastReceiver
+from socket_profile import SOCKET_PROFILES
+from telemetry_client import GPSSample, ResumeReport, RPYSample, SensorStatus, TelemetryClient
+from terminal_renderer import TerminalRenderer
+from time_series import TelemetrySeries
 
 # Globals
 keepRunning = True
 
 class TCPClient(threading.Thread):
     """
-    Client that establishes socket connections with a server
+    Client that displays the telemetry received from a server
     """
 
-    def __init__(self, useWifi=True, selectTimeout=3, socketTimeout=5):
+    def __init__(self, useWifi=True, selectTimeout=3, socketTimeout=5, socketProfile='default',
+                 multicastGroup=None, multicastPort=9001, maxFps=20, serverAddress=None, statsWindows=(),
+                 binary=False, compress='auto'):
         """
         Constructor
 
         @param useWifi:       Flag denoting whether to use WiFi or Bluetooth
         @param selectTimeout: The select timeout when checking the socket list
-        @param socketTimeout: The socket timeout
+        @param socketTimeout: The time to wait for the connection to be established
+        @param socketProfile: The name of the socket profile applied to WiFi connections (see SOCKET_PROFILES)
+        @param multicastGroup: The UDP multicast group to passively observe instead of connecting, or None
+        @param multicastPort:  The UDP multicast port
+        @param maxFps:         The maximum number of times the screen is redrawn per second
+        @param serverAddress:  The server address, (host, port) for WiFi, (MAC address, channel) for Bluetooth,
+                               or the socket path of the server's Unix domain socket (defaults to the RPi)
+        @param statsWindows:   The windows (seconds) to display rolling statistics of each channel over,
+                               empty to not display statistics (requires numpy)
+        @param binary:         Flag denoting whether to ask the server for binary payloads, decoded in
+                               batches when numpy is available
+        @param compress:       Whether the server compresses the frames it sends, 'auto' to let it decide
+                               (it compresses over Bluetooth), True or False
 
         @return None
         """
@@ -37,43 +54,71 @@ class TCPClient(threading.Thread):
         self.shutdownEvent = threading.Event()
         self._selectTimeout = selectTimeout
 
-        # Initialize colorama and clear screen
-        colorama.init()
+        # Initialize colorama (only needed for escape codes on Windows) and clear screen
+        if os.name == 'nt':
+            import colorama
 
-        print('\033[2J')
+            colorama.init()
 
+        # Messages update the data below, the screen is redrawn from it at a capped frame rate
+        self._renderer = TerminalRenderer(self.__layout, maxFps)
+        self._renderer.clear()
+
+        self._telemetryClient = None
+        self._multicastReceiver = None
+
+        # Join the multicast group as a passive observer, which costs the vehicle nothing per client
+        if multicastGroup is not None:
+            self._multicastReceiver = MulticastReceiver(multicastGroup, multicastPort)
         # Connect to server
-        if useWifi:
-            self._clientSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._clientSocket.settimeout(socketTimeout)
+        elif useWifi:
+            if serverAddress is None:
+                serverAddress = ('192.168.1.67', 9000)  # RPi IP on home network
+                #serverAddress = ('192.168.4.1', 9000)  # RPi wireless access point
 
-            self._clientSocket.connect(('192.168.1.67', 9000))  # RPi IP on home network
-            #self._clientSocket.connect(('192.168.4.1', 9000))  # RPi wireless access point
+            self._telemetryClient = TelemetryClient(serverAddress, connectTimeout=socketTimeout, socketProfile=socketProfile,
+                                                    connectNow=False, binary=binary, compress=compress)
         else:
-            self._clientSocket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+            if serverAddress is None:
+                serverAddress = ('DC:A6:32:17:6A:83', 5)
 
+            self._telemetryClient = TelemetryClient(serverAddress, useBluetooth=True, connectTimeout=socketTimeout,
+                                                    connectNow=False, binary=binary, compress=compress)
 
-            self._clientSocket.connect(('DC:A6:32:17:6A:83', 5))
+        if self._telemetryClient is not None:
+            # Raw NMEA sentences are not displayed, so the server does not need to send them
+            self._telemetryClient.subscribe([MessageType.GPS_MESSAGE, MessageType.RPY_MESSAGE])
+            self._telemetryClient.addCallback(self.__processRecord)
 
-        # Set initial output data
+        # Set initial output data (values are formatted when the screen is drawn)
         self._gpsData = {
             'time': '',
-            'lon': 'NaN',
-            'lat': 'NaN',
-            'alt': 'NaN',
-            'speed': 'NaN',
-            'climb': 'NaN',
-            'epx': 'NaN',
-            'epy': 'NaN',
-            'epv': 'NaN',
+            'lon': None,
+            'lat': None,
+            'alt': None,
+            'speed': None,
+            'climb': None,
+            'epx': None,
+            'epy': None,
+            'epv': None,
         }
 
         self._rpyData = {
-            'roll': 'NaN',
-            'pitch': 'NaN',
-            'yaw': 'NaN'
+            'roll': None,
+            'pitch': None,
+            'yaw': None,
+            'status': 'unknown'
         }
 
+        self._sensorStates = {}
+
+        # Rolling history of each channel, only kept when statistics are displayed
+        self._statsWindows = sorted(statsWindows)
+        self._series = TelemetrySeries() if self._statsWindows else None
+
+        self._serverState = 'connecting'
+        self._resumeReport = None
+
     def run(self):
         """
         Overriden method called when the thread is started
@@ -84,98 +129,180 @@ class TCPClient(threading.Thread):
         """
 
         inputSocketList = []
-        inputSocketList.append(self._clientSocket)
+        inputSocketList.append(self._multicastReceiver or self._telemetryClient)
+
+        # Wait for the server rather than fail when it is not reachable yet
+        if self._telemetryClient is not None:
+            self._renderer.draw(force=True)
+
+            if self._telemetryClient.reconnect(self.shutdownEvent):
+                self._serverState = 'connected'
+
+                self._renderer.invalidate()
 
         while not self.shutdownEvent.is_set():
-            readyToRead, readyToWrite, inputError = select.select(inputSocketList, [], [], self._selectTimeout)
+            # Wake up in time to draw a pending frame
+            selectTimeout = self._selectTimeout
+            frameTimeout = self._renderer.getTimeout()
+
+            if frameTimeout is not None:
+                selectTimeout = min(frameTimeout, selectTimeout)
+
+            readyToRead, readyToWrite, inputError = select.select(inputSocketList, [], [], selectTimeout)
 
             for sock in readyToRead:
-                # Read a message off of the socket
-                msgData = MessageHandler.recvMsg(sock)
+                # Read a datagram off of the multicast group (None if it was stale or invalid)
+                if sock is self._multicastReceiver:
+                    msgData = sock.recvMsg()
+
+                    if msgData is not None:
+                        self.__processRecord(TelemetryClient.decodeRecord(*msgData))
 
-                # Process the message
-                if msgData is not None:
-                    self.__processMsg(msgData)
-                else:
-                    break
+                    continue
+
+                # Read whatever the server sent, which is passed to the record callback
+                if sock.recvRecords() is None:
+                    self._serverState = 'reconnecting'
+
+                    self._renderer.invalidate()
+                    self._renderer.draw(force=True)
+
+                    # The server replays what was missed once the connection is back
+                    if sock.reconnect(self.shutdownEvent):
+                        self._serverState = 'connected'
+
+                        self._renderer.invalidate()
+
+            self._renderer.draw()
 
         # Cleanup
         self.__shutdown()
 
-    def __processMsg(self, msgData):
+    def __processRecord(self, record):
         """
-        Processes a message received from the server
+        Updates the displayed data with a record received from the server
 
-        @param msgData: The message data
+        @param record: The record
 
         @return None
         """
 
-        # Retrieve the message type and data
-        msgType = msgData[0]
-        msg = json.loads(msgData[1])
-
-        # Check to see if a GPS message was received
-        if msgType == MessageType.GPS_MESSAGE:
-            if msg['time'] is not None:
-                self._gpsData['time'] = msg['time']
-            
-            if msg['lon'] is not None:
-                self._gpsData['lon'] = '%4.6f %s (deg)' % (msg['lon'], 'E' if msg['lon'] > 0 else 'W')
-            
-            if msg['lat'] is not None:
-                self._gpsData['lat'] = '%4.6f %s (deg)' % (msg['lat'], 'N' if msg['lat'] > 0 else 'S')
-            
-            if msg['alt'] is not None:
-                self._gpsData['alt'] = '%4.6f (m)' % msg['alt']
-            
-            if msg['speed'] is not None:
-                self._gpsData['speed'] = '%4.6f (MPH)' % msg['speed']
-            
-            if msg['climb'] is not None:
-                self._gpsData['climb'] = '%4.6f (ft/min)' % msg['climb']
-            
-            # Estimated Longitude Error
-            if msg['epx'] is not None:
-                self._gpsData['epx'] = '+/- %4.6f (m)' % msg['epx']
-            
-            # Estimated Latitude Error
-            if msg['epy'] is not None:
-                self._gpsData['epy'] = '+/- %4.6f (m)' % msg['epy']
-            
-            # Estimated Vertical Error
-            if msg['epv'] is not None:
-                self._gpsData['epv'] = '+/- %4.6f (m)' % msg['epv']
-        # Check to see if a RPY message was received
-        elif msgType == MessageType.RPY_MESSAGE:
-            self._rpyData['roll'] = '%4.6f (deg)' % msg['roll']
-            self._rpyData['pitch'] = '%4.6f (deg)' % msg['pitch']
-            self._rpyData['yaw'] = '%4.6f (deg)' % msg['yaw']
-
-        # Print the current GPS and RPY data
-        print('\033[H')  # Moves cursor to 0,0 on screen
+        if self._series is not None:
+            self._series.addRecord(record)
+
+        # Only the newest sample of a batch is displayed
+        if isinstance(record, SampleBatch):
+            record = TelemetryClient.decodeBatchSample(record)
+
+        # Check to see if a sensor status was received
+        if isinstance(record, SensorStatus):
+            self._sensorStates[record.sensor] = record.state
+        # Check to see if a GPS sample was received
+        elif isinstance(record, GPSSample):
+            for key, value in zip(GPSSample._fields, record):
+                if value is not None:
+                    self._gpsData[key] = value
+        # Check to see if a RPY sample was received
+        elif isinstance(record, RPYSample):
+            self._rpyData['roll'] = record.roll
+            self._rpyData['pitch'] = record.pitch
+            self._rpyData['yaw'] = record.yaw
+            self._rpyData['status'] = record.status
+        # Check to see if the server summarized what it replays after a reconnection
+        elif isinstance(record, ResumeReport):
+            self._resumeReport = record
+        # Raw NMEA sentences are not displayed
+        else:
+            return
+
+        self._renderer.invalidate()
+
+    def __layout(self):
+        """
+        Lays out the current GPS and RPY data
+
+        @param None
+
+        @return List of screen lines
+        """
+
+        gpsData = self._gpsData
+        rpyData = self._rpyData
+
+        lon = gpsData['lon']
+        lat = gpsData['lat']
 
         outputStrs = []
         outputStrs.append('------------------------------ GPS ------------------------------')
-        outputStrs.append('           Time:  %s' % self._gpsData['time'])
-        outputStrs.append('      Longitude:  %s' % self._gpsData['lon'])
-        outputStrs.append('       Latitude:  %s' % self._gpsData['lat'])
-        outputStrs.append('       Altitude:  %s' % self._gpsData['alt'])
-        outputStrs.append('          Speed:  %s' % self._gpsData['speed'])
-        outputStrs.append('          Climb:  %s' % self._gpsData['climb'])
-        outputStrs.append('Longitude Error:  %s' % self._gpsData['epx'])
-        outputStrs.append(' Latitude Error:  %s' % self._gpsData['epy'])
-        outputStrs.append(' Altitude Error:  %s' % self._gpsData['epv'])
+        outputStrs.append('           Time:  %s' % gpsData['time'])
+        outputStrs.append('      Longitude:  %s' % ('NaN' if lon is None else '%4.6f %s (deg)' % (lon, 'E' if lon > 0 else 'W')))
+        outputStrs.append('       Latitude:  %s' % ('NaN' if lat is None else '%4.6f %s (deg)' % (lat, 'N' if lat > 0 else 'S')))
+        outputStrs.append('       Altitude:  %s' % TCPClient.__format('%4.6f (m)', gpsData['alt']))
+        outputStrs.append('          Speed:  %s' % TCPClient.__format('%4.6f (MPH)', gpsData['speed']))
+        outputStrs.append('          Climb:  %s' % TCPClient.__format('%4.6f (ft/min)', gpsData['climb']))
+        outputStrs.append('Longitude Error:  %s' % TCPClient.__format('+/- %4.6f (m)', gpsData['epx']))
+        outputStrs.append(' Latitude Error:  %s' % TCPClient.__format('+/- %4.6f (m)', gpsData['epy']))
+        outputStrs.append(' Altitude Error:  %s' % TCPClient.__format('+/- %4.6f (m)', gpsData['epv']))
         outputStrs.append('')
         outputStrs.append('------------------------------ RPY ------------------------------')
         outputStrs.append('')
-        outputStrs.append('           Roll: %s' % self._rpyData['roll'])
-        outputStrs.append('          Pitch: %s' % self._rpyData['pitch'])
-        outputStrs.append('            Yaw: %s' % self._rpyData['yaw'])
+        outputStrs.append('           Roll: %s' % TCPClient.__format('%4.6f (deg)', rpyData['roll']))
+        outputStrs.append('          Pitch: %s' % TCPClient.__format('%4.6f (deg)', rpyData['pitch']))
+        outputStrs.append('            Yaw: %s' % TCPClient.__format('%4.6f (deg)', rpyData['yaw']))
+        outputStrs.append('         Status: %s' % rpyData['status'])
+        outputStrs.append('')
+        outputStrs.append('---------------------------- Sensors ----------------------------')
+        outputStrs.append('')
+        outputStrs.append(', '.join('%s: %s' % (sensor, state) for sensor, state in sorted(self._sensorStates.items())))
+
+        if self._telemetryClient is not None:
+            serverState = self._serverState
+
+            # Only reconnections resume anything
+            if self._resumeReport is not None and self._resumeReport.lost is not None:
+                serverState += ' (resumed, %d replayed, %d lost)' % (self._resumeReport.replayed, self._resumeReport.lost)
+
+            outputStrs.append('')
+            outputStrs.append('         Server: %s' % serverState)
+
+        for window in self._statsWindows:
+            stats = self._series.getStats(window)
+
+            outputStrs.append('')
+            outputStrs.append(('-' * 24 + ' Last %g seconds ' % window).ljust(65, '-'))
+            outputStrs.append('')
+            outputStrs.append('%15s %12s %12s %12s %12s %12s' % ('', 'Mean', 'Std Dev', 'Min', 'Max', 'Rate (/s)'))
 
-        fullOutputStr = '\n'.join(outputStr for outputStr in outputStrs)
+            for channel in TelemetrySeries.rpyChannels + TelemetrySeries.gpsChannels:
+                channelStats = stats[channel]
+                values = (channelStats.mean, channelStats.variance ** 0.5, channelStats.min, channelStats.max, channelStats.rate)
 
-        print(fullOutputStr)
+                # Statistics of channels without enough samples are NaN
+                outputStrs.append('%15s %s' % (channel.capitalize(), ' '.join(
+                    TCPClient.__format('%12.4f', None if math.isnan(value) else value).rjust(12) for value in values)))
+
+        if self._multicastReceiver is not None:
+            outputStrs.append('')
+            outputStrs.append('--------------------------- Multicast ---------------------------')
+            outputStrs.append('')
+            outputStrs.append('       Received: %d' % self._multicastReceiver.numReceived)
+            outputStrs.append('           Lost: %d' % self._multicastReceiver.numLost)
+            outputStrs.append('          Stale: %d' % self._multicastReceiver.numStale)
+
+        return outputStrs
+
+    @staticmethod
+    def __format(fmt, value):
+        """
+        Formats a value for display
+
+        @param fmt:   The format string
+        @param value: The value, or None if it is not known
+
+        @return The formatted value, or NaN if the value is not known
+        """
+
+        return 'NaN' if value is None else fmt % value
 
     def __shutdown(self):
         """
@@ -186,7 +313,12 @@ class TCPClient(threading.Thread):
         @return None
         """
 
-        self._clientSocket.close()
+        self._renderer.close()
+
+        if self._multicastReceiver is not None:
+            self._multicastReceiver.close()
+        else:
+            self._telemetryClient.close()
 
 def service_shutdown(signum, fname):
     """
@@ -206,8 +338,37 @@ if __name__ == "__main__":
     # Register a signal handler
     signal.signal(signal.SIGINT, service_shutdown)
 
+    parser = argparse.ArgumentParser(description='Displays the telemetry received from the RPi')
+    parser.add_argument('--host', default='192.168.1.67',
+                        help='The server address (192.168.4.1 on the RPi wireless access point)')
+    parser.add_argument('--port', type=int, default=9000, help='The server port')
+    parser.add_argument('--bluetooth', metavar='MAC', help='Connect over Bluetooth to the specified address instead')
+    parser.add_argument('--channel', type=int, default=5, help='The Bluetooth channel')
+    parser.add_argument('--unix', metavar='PATH', help='Connect to the server\'s Unix domain socket instead')
+    parser.add_argument('--multicast', metavar='GROUP', help='Passively observe the multicast group instead')
+    parser.add_argument('--multicast-port', type=int, default=9001, help='The multicast port')
+    parser.add_argument('--socket-profile', default='default', choices=sorted(SOCKET_PROFILES),
+                        help='The socket profile applied to WiFi connections')
+    parser.add_argument('--fps', type=int, default=20, help='The maximum screen refresh rate')
+    parser.add_argument('--stats', metavar='WINDOWS', default='',
+                        help='Comma separated windows (seconds) to display rolling statistics over (requires numpy)')
+    parser.add_argument('--binary', action='store_true', help='Ask the server for binary payloads')
+    parser.add_argument('--compress', default='auto', choices=('auto', 'on', 'off'),
+                        help='Whether the server compresses the stream (auto compresses over Bluetooth)')
+    args = parser.parse_args()
+
+    if args.bluetooth is not None:
+        serverAddress = (args.bluetooth, args.channel)
+    elif args.unix is not None:
+        serverAddress = args.unix
+    else:
+        serverAddress = (args.host, args.port)
+
     # Start the TCP client
-    tcpClient = TCPClient(useWifi=True)
+    tcpClient = TCPClient(useWifi=args.bluetooth is None, socketProfile=args.socket_profile, multicastGroup=args.multicast,
+                          multicastPort=args.multicast_port, maxFps=args.fps, serverAddress=serverAddress,
+                          statsWindows=[float(window) for window in args.stats.split(',') if window], binary=args.binary,
+                          compress={'auto': 'auto', 'on': True, 'off': False}[args.compress])
     tcpClient.start()
 
     # Keep alive
@@ -1,25 +1,38 @@
 # Python Modules
-import bluetooth
+import collections
+import json
+import random
+import socket
 import threading
 import time
 
 # Project Modules
-from message_handler import MessageType, MessageHandler
+from message_handler import BinaryPayload, MessageType, MessageHandler
 
 class TCPSender(threading.Thread):
     """
     Periodically sends messages to connected clients
     """
 
-    def __init__(self, msgQueue, serverSocket, socketList, socketListMutex, sendPeriod=0.1):
+    def __init__(self, ringBuffers, clients, clientsMutex, sendPeriod=0.1, multicastSender=None, historySize=2048,
+                 identity=None, batchSize=64, batchWindow=0.005, compressionReportPeriod=None):
         """
         Constructor
 
-        @param msqQueue        The queue to read messages from
-        @param serverSocket    The server socket
-        @param socketList      The socker list used for sending messages
-        @param socketListMutex The mutex used to ensure the socket list is correct
-        @param sendPeriod      The time between checking the queue for messages to send
+        @param ringBuffers     The ring buffers to read messages from (one per producer)
+        @param clients         The connected clients (dictionary of socket to ClientConnection)
+        @param clientsMutex    The mutex used to ensure the clients are correct
+        @param sendPeriod      The time between matching each client's rates to what its link can carry (seconds)
+        @param multicastSender The multicast sender for passive observers, or None
+        @param historySize     The number of recent messages kept for clients that reconnect
+        @param identity        The vehicle identity sent to clients in the handshake (dictionary with the
+                               vehicleId, sourceId, version and sensors), or None to send none
+        @param batchSize       The maximum number of consecutive messages of one type packed into a batch
+                               frame for clients that accept them (1 disables batching)
+        @param batchWindow     The time between checking the ring buffers for messages to send (seconds), which
+                               is the window messages are batched over and the longest a message waits to be sent
+        @param compressionReportPeriod The time between printed compression reports of the clients that
+                                       receive compressed frames (seconds), or None to disable the reports
 
         @return None
         """
@@ -28,12 +41,48 @@ class TCPSender(threading.Thread):
 
         self.shutdownEvent = threading.Event()
 
-        self._msqQueue = msgQueue
-        self._serverSocket = serverSocket
-        self._socketList = socketList
-        self._socketListMutex = socketListMutex
+        self._ringBuffers = ringBuffers
+        self._clients = clients
+        self._clientsMutex = clientsMutex
         self._sendPeriod = sendPeriod
-    
+        self._multicastSender = multicastSender
+        self._batchSize = max(batchSize, 1)
+        self._batchWindow = batchWindow
+        self._compressionReportPeriod = compressionReportPeriod
+
+        # Sequence numbers restart with the server, so clients can only resume within the same session
+        self._session = '%016x' % random.getrandbits(64)
+        self._nextSeq = 0
+
+        # Recently sent messages, as (seq, msgData, msgType, timestamp) tuples
+        self._history = collections.deque(maxlen=historySize)
+
+        # Latest message of each type, as (seq, msgData, msgType, timestamp) tuples, sent to new clients as a snapshot
+        self._latest = {}
+
+        # Converts sample times (monotonic seconds) to seconds since the epoch for binary payloads
+        self._clockOffset = time.time() - time.monotonic()
+
+        # Frames sent to clients that completed the handshake carry the source id
+        self._sourceId = None
+        self._helloFrame = None
+
+        if identity is not None:
+            self.setIdentity(identity)
+
+    def setIdentity(self, identity):
+        """
+        Sets the vehicle identity sent to clients in the handshake
+
+        @param identity: The vehicle identity (dictionary with the vehicleId, sourceId, version and sensors)
+
+        @return None
+        """
+
+        self._sourceId = identity['sourceId']
+        self._helloFrame = MessageHandler.encodeMsg(json.dumps(identity), MessageType.HELLO_MESSAGE,
+                                                    sourceId=self._sourceId)
+
     def run(self):
         """
         Overriden method called when the thread is started
@@ -43,29 +92,287 @@ class TCPSender(threading.Thread):
         @return None
         """
 
+        nextRateUpdateTime = time.monotonic() + self._sendPeriod
+        nextReportTime = None
+
+        if self._compressionReportPeriod is not None:
+            nextReportTime = time.monotonic() + self._compressionReportPeriod
+
         while not self.shutdownEvent.is_set():
-            while not self._msqQueue.empty():
-                msg = self._msqQueue.get()
+            self._clientsMutex.acquire()
+
+            # Handshake frames waiting to be sent to each client, and the messages sent after them as
+            # (seq, msgData, msgType, timestamp) tuples
+            pendingFrames = dict((client, []) for client in self._clients.values())
+            pendingMsgs = {}
+            msgs = []
+
+            now = time.monotonic()
+
+            for client, frames in pendingFrames.items():
+                # Clients that reconnected receive what they missed ahead of anything new
+                if client.resumeRequest is not None:
+                    pendingMsgs[client] = []
+
+                    self.__resume(client, frames, pendingMsgs[client])
+                # Clients about to resume are sent nothing, the replay covers it
+                elif not client.awaitsResume(now):
+                    pendingMsgs[client] = []
+
+            # Messages of each type drained this cycle, oldest first
+            typeMsgs = {}
+
+            # Drain every producer's messages in one batch
+            for ringBuffer in self._ringBuffers:
+                for sample in ringBuffer.drain():
+                    msgData = sample.msgData
+                    msgType = sample.msgType
+
+                    seq = self._nextSeq
+                    self._nextSeq += 1
+
+                    msg = (seq, msgData, msgType, sample.timestamp)
+
+                    self._history.append(msg)
+                    self._latest[msgType] = msg
+
+                    if self._multicastSender is not None:
+                        msgs.append((msgData, msgType))
+
+                    typeMsgs.setdefault(msgType, []).append(msg)
 
-                msgData = msg[0]
-                msgType = msg[1]
+            # Rate limited types send the newest message of the cycle, the others send every one
+            for client, clientMsgs in pendingMsgs.items():
+                sendMsgs = []
 
-                self._socketListMutex.acquire()
+                for msgType, drainedMsgs in typeMsgs.items():
+                    numToSend = client.getNumToSend(msgType, len(drainedMsgs), now)
 
-                for sock in self._socketList:
-                    if sock is not self._serverSocket:
-                        try:
-                            MessageHandler.sendMsg(sock, msgData, msgType)
-                        except bluetooth.btcommon.BluetoothError:
-                            pass
+                    if numToSend:
+                        sendMsgs.extend(drainedMsgs[-numToSend:])
 
-                self._socketListMutex.release()
+                # Sequence numbers keep increasing across types
+                clientMsgs.extend(sorted(sendMsgs))
+
+            # Encode each frame once and send the same frame to every client it applies to
+            frameCache = {}
+
+            for client, frames in pendingFrames.items():
+                frames.extend(self.__encodeFrames(client, pendingMsgs.get(client, []), frameCache))
+
+            # Flush everything queued for a client with one call
+            for client, frames in pendingFrames.items():
+                if frames:
+                    self.__send(client, frames)
+
+            self._clientsMutex.release()
+
+            # Observers on the multicast group cost one datagram per message regardless of their number
+            if self._multicastSender is not None and msgs:
+                self._multicastSender.sendMsgs(msgs)
+
+            # Match each client's rates to what its link can currently carry
+            now = time.monotonic()
+
+            if now >= nextRateUpdateTime:
+                self._clientsMutex.acquire()
+
+                for client in self._clients.values():
+                    client.updateRates(now)
+
+                if nextReportTime is not None and now >= nextReportTime:
+                    self.__reportCompression()
+
+                    nextReportTime += self._compressionReportPeriod
+
+                self._clientsMutex.release()
+
+                nextRateUpdateTime = max(nextRateUpdateTime + self._sendPeriod, now)
+
+            time.sleep(self._batchWindow)
 
-            time.sleep(self._sendPeriod)
-        
         # Cleanup
         self.__shutdown()
 
+    def __resume(self, client, frames, msgs):
+        """
+        Handles a client's resume request, queueing the vehicle identity and a summary followed by every
+        message in the history the client missed, or by a snapshot of the latest message of each type for
+        a new client. Frames sent to the client carry sequence numbers (and the source id) from now on.
+
+        @param client: The client
+        @param frames: The frames waiting to be sent to the client
+        @param msgs:   The messages waiting to be sent to the client, after the frames
+
+        @return None
+        """
+
+        session, lastSeq = client.resumeRequest
+
+        client.resumeRequest = None
+        client.sequenced = True
+
+        numReplayed = 0
+        numLost = None
+
+        # The sequence numbers of another session mean nothing to this one
+        if session == self._session and lastSeq is not None:
+            firstSeq = self._history[0][0] if self._history else self._nextSeq
+            numLost = max(firstSeq - lastSeq - 1, 0)
+
+            for msg in self._history:
+                if msg[0] > lastSeq and client.acceptsType(msg[2]):
+                    msgs.append(msg)
+
+            numReplayed = len(msgs)
+        else:
+            # Sensor statuses were already sent when the client connected
+            for msg in sorted(self._latest.values()):
+                if msg[2] != MessageType.STATUS_MESSAGE and client.acceptsType(msg[2]):
+                    msgs.append(msg)
+
+        summary = {'session': self._session, 'replayed': numReplayed, 'lost': numLost}
+
+        if self._helloFrame is not None:
+            frames.append(self._helloFrame)
+
+        frames.append(MessageHandler.encodeMsg(json.dumps(summary), MessageType.RESUME_MESSAGE, sourceId=self._sourceId))
+
+        if lastSeq is not None:
+            print('Client %s (%s) resumed after sequence number %d: replaying %d messages, %s lost' %
+                  (client.address, client.transport, lastSeq, numReplayed, numLost))
+
+    def __encodeFrames(self, client, msgs, frameCache):
+        """
+        Encodes the messages waiting to be sent to a client. Once the client has resumed, each run of
+        consecutive messages of one type is packed into a batch frame if the client accepts them, and
+        messages have a binary payload if the client asked for binary payloads and the type has one.
+
+        @param client:     The client
+        @param msgs:       List of (seq, msgData, msgType, timestamp) tuples
+        @param frameCache: Frames already encoded for other clients (dictionary of key to frame)
+
+        @return List of encoded frames
+        """
+
+        frames = []
+
+        # Clients that have not resumed only understand plain frames, unless they just asked to resume,
+        # in which case the replay covers the messages
+        if not client.sequenced:
+            if client.resumeRequest is not None:
+                return frames
+
+            for seq, msgData, msgType, timestamp in msgs:
+                key = ('plain', seq)
+                frame = frameCache.get(key)
+
+                if frame is None:
+                    frame = frameCache[key] = MessageHandler.encodeMsg(msgData, msgType)
+
+                frames.append(frame)
+
+            return frames
+
+        batchSize = self._batchSize if client.batched else 1
+        start = 0
+
+        while start < len(msgs):
+            msgType = msgs[start][2]
+            end = start + 1
+
+            # Batches never reorder messages, so sequence numbers keep increasing
+            while end < len(msgs) and end - start < batchSize and msgs[end][2] == msgType:
+                end += 1
+
+            binary = client.binary and msgType in BinaryPayload.fields
+            run = msgs[start:end]
+            key = (binary, tuple(msg[0] for msg in run))
+            frame = frameCache.get(key)
+
+            if frame is None:
+                payloads = [self.__encodePayload(msgData, msgType, timestamp, binary)
+                            for seq, msgData, msgType, timestamp in run]
+
+                if len(run) == 1:
+                    frame = MessageHandler.encodeMsg(payloads[0], msgType, run[0][0], self._sourceId)
+                else:
+                    frame = MessageHandler.encodeBatch(payloads, msgType, key[1], self._sourceId)
+
+                frameCache[key] = frame
+
+            frames.append(frame)
+
+            start = end
+
+        return frames
+
+    def __encodePayload(self, msgData, msgType, timestamp, binary):
+        """
+        Encodes the payload of a message
+
+        @param msgData:   The message data (string)
+        @param msgType:   The type of message
+        @param timestamp: The time the message was produced (monotonic seconds)
+        @param binary:    Flag denoting whether to encode the binary payload of the message type
+
+        @return The payload (string, or bytes for a binary payload)
+        """
+
+        if binary:
+            return BinaryPayload.encode(msgType, json.loads(msgData), timestamp + self._clockOffset)
+
+        return msgData
+
+    def __send(self, client, frames):
+        """
+        Sends frames to a client, recording how long the send took
+
+        @param client: The client
+        @param frames: List of encoded frames
+
+        @return None
+        """
+
+        # The link carries (and the rates adapt to) the compressed bytes
+        if client.compressor is not None:
+            frames = [client.compressor.compress(frames)]
+
+        startTime = time.monotonic()
+
+        try:
+            MessageHandler.sendFrames(client.sock, frames)
+        # Bluetooth errors are also OSErrors, so either transport may be in use
+        except OSError as e:
+            print('Failed to send to client %s (%s): %s. Dropping client.' % (client.address, client.transport, e))
+
+            client.failed = True
+
+            # Wake the server so it removes the client
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+            return
+
+        client.recordSend(sum(len(frame) for frame in frames), time.monotonic() - startTime)
+
+    def __reportCompression(self):
+        """
+        Prints how well the frames sent to each client compress and what it costs
+
+        @param None
+
+        @return None
+        """
+
+        for client in self._clients.values():
+            compressionSummary = client.getCompressionSummary()
+
+            if compressionSummary is not None:
+                print(compressionSummary)
+
     def __shutdown(self):
         """
         Performs shutdown procedures for the thread
@@ -75,4 +382,5 @@ class TCPSender(threading.Thread):
         @return None
         """
 
-        pass
+        if self._multicastSender is not None:
+            self._multicastSender.close()
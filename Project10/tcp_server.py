@@ -1,12 +1,8 @@
 #!/usr/bin/env python
 
 # Python Modules
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
-import bluetooth
+import json
+import os
 import select
 import signal
 import socket
@@ -14,72 +10,213 @@ import time
 import threading
 
 # Project Modules
+from acquisition_process import AcquisitionProcess
+from acquisition_scheduler import AcquisitionScheduler
+from client_connection import ClientConnection, DEFAULT_SEND_POLICIES, Transport
 from gps_reader import GPSReader
-from message_handler import MessageHandler
+from message_handler import FrameCompressor, MessageHandler, MessageType
+from multicast_sender import MulticastSender
+from ring_buffer import RingBuffer
 from rpy_reader import RPYReader
+from socket_profile import SOCKET_PROFILES
+from state_block import StateBlock
 from tcp_sender import TCPSender
+from upstream_link import UpstreamLink
 
 # Globals
 keepRunning = True
 
+# Software version reported to clients in the handshake
+SOFTWARE_VERSION = '10.1'
+
 class TCPServer(threading.Thread):
     """
     Server that establishes socket connections between the server and clients
     """
 
-    def __init__(self, wifiAddress='0.0.0.0', wifiPort=9000, btPort=5, useWifi=True, backLog=1, selectTimeout=5):
+    def __init__(self, wifiAddress='0.0.0.0', wifiPort=9000, btPort=5, useWifi=True, useBluetooth=None, backLog=1,
+                 selectTimeout=5, sendPolicies=None, socketProfile='default', gpsUpdateRate=None, forwardNmea=False,
+                 numAcquisitionWorkers=0, multicastGroup=None, multicastPort=9001, unixSocketPath=None,
+                 stateBlockName=None, acquisitionMode='thread', acquisitionCpus=None, realtimeProfile=None,
+                 latencyReportPeriod=None, historySize=2048, vehicleId=None, sourceId=0, upstreamAddress=None,
+                 upstreamBluetooth=False, sendPeriod=0.1, batchSize=64, batchWindow=0.005,
+                 compressionReportPeriod=None):
         """
         Constructor
 
         @param wifiAddress:   The WiFi address
         @param wifiPort:      The WiFi port
         @param btPort:        The Bluetooth port
-        @param useWifi:       Flag denoting whether to use WiFi or Bluetooth
+        @param useWifi:       Flag denoting whether to listen for WiFi clients
+        @param useBluetooth:  Flag denoting whether to listen for Bluetooth clients
+                              (defaults to only listening on Bluetooth when WiFi is not used)
         @param backLog:       Number of unaccepted connections allowed 
                               before refusing new connections
         @param selectTimeout: The select timeout when checking the socket list (seconds)
+        @param sendPolicies:  The send policy for each transport (dictionary of Transport to SendPolicy)
+        @param socketProfile: The name of the socket profile applied to WiFi clients (see SOCKET_PROFILES)
+        @param gpsUpdateRate: The GPS receiver update rate (Hz), or None for the receiver default
+        @param forwardNmea:   Flag denoting whether to forward raw NMEA sentences to clients
+        @param numAcquisitionWorkers: The number of worker threads used to read sensors
+                                      (0 reads every sensor on the scheduler thread)
+        @param multicastGroup: The UDP multicast group passive observers join, or None to disable multicast
+        @param multicastPort:  The UDP multicast port
+        @param unixSocketPath: The Unix domain socket path local clients connect to, or None to disable it
+        @param stateBlockName: The name of the shared memory block holding the latest state for
+                               local readers, or None to disable it
+        @param acquisitionMode: Where sensors are read, 'thread' (in this process) or 'process'
+                                (in a separate process publishing into a shared memory ring buffer)
+        @param acquisitionCpus: The CPUs to pin the acquisition process to, or None to leave it unpinned
+        @param realtimeProfile: The scheduling options (RealtimeProfile) applied to the acquisition
+                                threads, or None for the default scheduling
+        @param latencyReportPeriod: The time between printed sensor read latency reports (seconds),
+                                    or None to disable the reports
+        @param historySize:    The number of recent messages kept for clients that reconnect
+        @param vehicleId:      The vehicle id reported to clients, or None for the host name
+        @param sourceId:       The compact id (0-65535) carried in the frames sent to clients, unique
+                               among the vehicles a ground station or relay combines
+        @param upstreamAddress: The address of a vehicle to relay instead of reading sensors (see UpstreamLink),
+                                or None. Clients are then sent the vehicle's identity.
+        @param upstreamBluetooth: Flag denoting whether to connect to the relayed vehicle over Bluetooth
+        @param sendPeriod:     The time between matching each client's rates to what its link can carry (seconds)
+        @param batchSize:      The maximum number of consecutive messages of one type packed into a batch frame
+                               (1 disables batching)
+        @param batchWindow:    The time between sends to clients (seconds), which is the window messages are
+                               batched over and the longest a message waits to be sent
+        @param compressionReportPeriod: The time between printed compression reports of the clients that
+                                        receive compressed frames (seconds), or None to only report when
+                                        they disconnect
 
         @return None
         """
 
         threading.Thread.__init__(self)
 
+        if not 0 <= sourceId <= 0xFFFF:
+            raise ValueError('Source id out of range (0-65535): %d' % sourceId)
+
         self.shutdownEvent = threading.Event()
 
         self._selectTimeout = selectTimeout
+        self._socketProfile = SOCKET_PROFILES[socketProfile]
+
+        self._sendPolicies = dict(DEFAULT_SEND_POLICIES)
+        self._sendPolicies.update(sendPolicies or {})
+
+        if useBluetooth is None:
+            useBluetooth = not useWifi
+
+        # Create a server socket to listen for connections on each transport
+        self._serverSockets = {}
 
-        # Create a server socket to listen for connections
         if useWifi:
-            self._serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            wifiSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            wifiSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            wifiSocket.bind((wifiAddress, wifiPort))
+
+            self._serverSockets[wifiSocket] = Transport.WIFI
+
+        if useBluetooth:
+            import bluetooth
+
+            btSocket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+            btSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            btSocket.bind(('', btPort))
+
+            self._serverSockets[btSocket] = Transport.BLUETOOTH
+
+        # Processes on the vehicle connect over a Unix domain socket instead of loopback TCP
+        self._unixSocketPath = unixSocketPath
+
+        if unixSocketPath is not None:
+            if os.path.exists(unixSocketPath):
+                os.unlink(unixSocketPath)
+
+            unixSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            unixSocket.bind(unixSocketPath)
+
+            self._serverSockets[unixSocket] = Transport.LOCAL
+
+        for serverSocket in self._serverSockets:
+            serverSocket.listen(backLog)
+
+        # Add the server sockets to the socket list
+        self._socketList = list(self._serverSockets)
+
+        # Connected clients, shared with the TCP sender
+        self._clients = {}
+        self._clientsMutex = threading.Lock()
+
+        # Create the multicast sender for passive observers
+        multicastSender = None
+
+        if multicastGroup is not None:
+            multicastSender = MulticastSender(multicastGroup, multicastPort)
+
+        # Create the sensors and run them all from one acquisition scheduler. Sensors
+        # are opened in the background so clients can connect while they come up.
+        self._stateBlock = None
+
+        if stateBlockName is not None:
+            self._stateBlock = StateBlock(stateBlockName, create=True)
+
+        sensorSpecs = [
+            (GPSReader, {'updateRate': gpsUpdateRate, 'forwardNmea': forwardNmea}),
+            (RPYReader, {'useSerial': False}),
+        ]
+
+        # Each producer gets a ring buffer of its own, so none of them take a lock to publish
+        ringBuffers = []
 
-            self._serverSocket.bind((wifiAddress, wifiPort))
+        # A relay re-serves the messages of a vehicle (created once the TCP sender exists). After an
+        # outage the vehicle replays its whole history (as long as the relay's by default) in one burst,
+        # so there is room for it and the live messages that arrive before the sender drains it.
+        if upstreamAddress is not None:
+            ringBuffers.append(RingBuffer(historySize + 1024))
+        elif acquisitionMode == 'process':
+            ringBuffers.append(RingBuffer(1024))
+
+            self._acquisition = AcquisitionProcess(ringBuffers[0], sensorSpecs, numWorkers=numAcquisitionWorkers,
+                                                   stateBlockName=stateBlockName, cpus=acquisitionCpus,
+                                                   realtimeProfile=realtimeProfile,
+                                                   latencyReportPeriod=latencyReportPeriod)
         else:
-            self._serverSocket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-            self._serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._acquisition = AcquisitionScheduler(numWorkers=numAcquisitionWorkers, stateBlock=self._stateBlock,
+                                                     realtimeProfile=realtimeProfile,
+                                                     latencyReportPeriod=latencyReportPeriod)
 
-            self._serverSocket.bind(('', btPort))
+            for sensorClass, sensorArgs in sensorSpecs:
+                ringBuffers.append(RingBuffer())
 
-        self._serverSocket.listen(backLog)
+                self._acquisition.addSensor(sensorClass(ringBuffers[-1], **sensorArgs))
 
-        # Add the server socket to the socket list
-        self._socketList = []
-        self._socketList.append(self._serverSocket)
+        # Identifies the vehicle to clients, so those combining several vehicles can tell them apart
+        identity = {
+            'vehicleId': vehicleId or socket.gethostname(),
+            'sourceId': sourceId,
+            'version': SOFTWARE_VERSION,
+            'sensors': dict((sensorClass.sensorName, list(sensorClass.getMsgTypes(**sensorArgs)))
+                            for sensorClass, sensorArgs in sensorSpecs),
+        }
 
-        self._socketListMutex = threading.Lock()
-        self._msqQueue = queue.Queue()
+        # A relay learns the identity from the vehicle
+        if upstreamAddress is not None:
+            identity = None
 
         # Create TCP sender
-        self._tcpSender = TCPSender(self._msqQueue, self._serverSocket, self._socketList, self._socketListMutex)
+        self._tcpSender = TCPSender(ringBuffers, self._clients, self._clientsMutex, multicastSender=multicastSender,
+                                    sendPeriod=sendPeriod, historySize=historySize, identity=identity,
+                                    batchSize=batchSize, batchWindow=batchWindow,
+                                    compressionReportPeriod=compressionReportPeriod)
         self._tcpSender.start()
 
-        # Create GPS reader
-        self._gpsReader = GPSReader(self._msqQueue)
-        self._gpsReader.start()
+        if upstreamAddress is not None:
+            self._acquisition = UpstreamLink(ringBuffers[0], upstreamAddress, useBluetooth=upstreamBluetooth,
+                                             socketProfile=socketProfile, identityCallback=self._tcpSender.setIdentity)
 
-        # Create RPY reader
-        self._rpyReader = RPYReader(self._msqQueue, useSerial=False)
-        self._rpyReader.start()
+        self._acquisition.start()
 
     def run(self):
         """
@@ -98,19 +235,37 @@ class TCPServer(threading.Thread):
             # Iterate over input sockets
             for sock in readyToRead:
                 # Received new connection request
-                if sock is self._serverSocket:
-                    print('Received connection request. Establishing connection with client.')
+                if sock in self._serverSockets:
+                    transport = self._serverSockets[sock]
+
+                    print('Received %s connection request. Establishing connection with client.' % transport)
 
                     # Accept the connection and append it to the socket list
-                    clientSocket, address = self._serverSocket.accept()
+                    clientSocket, address = sock.accept()
 
                     # Prevent recv calls from blocking indefinitely
                     #TODO: Could use this as message timeout instead of MessageHandler timeout?
                     clientSocket.settimeout(1)
 
-                    self._socketListMutex.acquire()
+                    self._socketProfile.apply(clientSocket)
+
+                    # Report the current readiness of each sensor before the client receives any data
+                    try:
+                        for sensorStatus in self._acquisition.getSensorStatuses():
+                            MessageHandler.sendMsg(clientSocket, json.dumps(sensorStatus), MessageType.STATUS_MESSAGE)
+                    # A client that resets or stalls right away must not stop the server (Bluetooth errors are also OSErrors)
+                    except OSError as e:
+                        print('Failed to send sensor statuses to client %s (%s): %s. Dropping client.' % (address, transport, e))
+
+                        clientSocket.close()
+
+                        continue
+
                     self._socketList.append(clientSocket)
-                    self._socketListMutex.release()
+
+                    self._clientsMutex.acquire()
+                    self._clients[clientSocket] = ClientConnection(clientSocket, transport, self._sendPolicies[transport], address)
+                    self._clientsMutex.release()
                 # Received message from client
                 else:
                     # Read a message off of the socket
@@ -123,9 +278,16 @@ class TCPServer(threading.Thread):
                     else:
                         print('Client disconnected')
 
-                        self._socketListMutex.acquire()
                         self._socketList.remove(sock)
-                        self._socketListMutex.release()
+
+                        self._clientsMutex.acquire()
+                        client = self._clients.pop(sock)
+                        self._clientsMutex.release()
+
+                        compressionSummary = client.getCompressionSummary()
+
+                        if compressionSummary is not None:
+                            print(compressionSummary)
 
                         sock.close()
 
@@ -142,7 +304,54 @@ class TCPServer(threading.Thread):
         @return None
         """
 
-        pass
+        msgType, msg = msgData
+
+        # The client chose the message types it receives
+        if msgType == MessageType.SUBSCRIBE_MESSAGE:
+            try:
+                subscribedTypes = frozenset(int(subscribedType) for subscribedType in json.loads(msg)['types'])
+            except (ValueError, KeyError, TypeError):
+                print('Ignoring invalid subscription: %s' % msg)
+
+                return
+
+            client = self._clients.get(sock)
+
+            if client is not None:
+                client.subscribedTypes = subscribedTypes
+
+                print('Client %s (%s) subscribed to message types %s' %
+                      (client.address, client.transport, sorted(subscribedTypes)))
+        # The client wants sequence numbers and anything it missed since it was last connected
+        elif msgType == MessageType.RESUME_MESSAGE:
+            try:
+                resumeRequest = json.loads(msg)
+                lastSeq = resumeRequest.get('seq')
+                lastSeq = None if lastSeq is None else int(lastSeq)
+            except (ValueError, AttributeError, TypeError):
+                print('Ignoring invalid resume request: %s' % msg)
+
+                return
+
+            client = self._clients.get(sock)
+
+            # The TCP sender replays the history, so the replay is ordered with the messages it sends
+            if client is not None:
+                client.binary = bool(resumeRequest.get('binary'))
+                client.batched = bool(resumeRequest.get('batch'))
+
+                # Compression is on by default over Bluetooth, the slowest link. Once on it stays on,
+                # since the client decompresses the stream as a whole.
+                compress = resumeRequest.get('compress', False)
+
+                if compress == 'auto':
+                    compress = client.transport == Transport.BLUETOOTH
+
+                if compress is True and client.compressor is None:
+                    client.compressor = FrameCompressor()
+
+                    print('Client %s (%s) receives compressed frames' % (client.address, client.transport))
+                client.resumeRequest = (resumeRequest.get('session'), lastSeq)
 
     def __shutdown(self):
         """
@@ -153,15 +362,20 @@ class TCPServer(threading.Thread):
         @return None
         """
 
-        self._rpyReader.shutdownEvent.set()
-        self._gpsReader.shutdownEvent.set()
+        self._acquisition.shutdownEvent.set()
         self._tcpSender.shutdownEvent.set()
 
-        self._rpyReader.join()
-        self._gpsReader.join()
+        self._acquisition.join()
         self._tcpSender.join()
 
-        self._serverSocket.close()
+        for serverSocket in self._serverSockets:
+            serverSocket.close()
+
+        if self._unixSocketPath is not None:
+            os.unlink(self._unixSocketPath)
+
+        if self._stateBlock is not None:
+            self._stateBlock.close()
 
 def service_shutdown(signum, fname):
     """
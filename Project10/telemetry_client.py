@@ -0,0 +1,665 @@
+# Python Modules
+import asyncio
+import collections
+import errno
+import json
+import os
+import random
+import select
+import socket
+import time
+
+# Project Modules
+from batch_decoder import BatchDecoder, SampleBatch
+from message_handler import BinaryPayload, MessageType, MessageHandler, FrameDecoder
+from socket_profile import SOCKET_PROFILES
+
+# Decoded messages. Values are passed through as received, missing values are None.
+GPSSample = collections.namedtuple('GPSSample', ('time', 'lat', 'lon', 'alt', 'speed', 'climb', 'epx', 'epy', 'epv'))
+RPYSample = collections.namedtuple('RPYSample', ('roll', 'pitch', 'yaw', 'status'))
+NMEASentence = collections.namedtuple('NMEASentence', ('sentence',))
+SensorStatus = collections.namedtuple('SensorStatus', ('sensor', 'state'))
+RawMessage = collections.namedtuple('RawMessage', ('msgType', 'msg'))
+
+# Summary of a reconnection, the number of missed messages the server replays and the number it no
+# longer held (None when the server restarted, so nothing could be resumed)
+ResumeReport = collections.namedtuple('ResumeReport', ('replayed', 'lost'))
+
+# Identity of a vehicle, sent by the server when the client connects (sensors maps each sensor name
+# to the message types it publishes)
+VehicleInfo = collections.namedtuple('VehicleInfo', ('vehicleId', 'sourceId', 'version', 'sensors'))
+
+# A record tagged with the vehicle it came from
+SourcedRecord = collections.namedtuple('SourcedRecord', ('source', 'record'))
+
+class TelemetryClient(object):
+    """
+    Connects to a telemetry server and decodes the messages it sends into records.
+
+    Records can be read by polling (for use with select), by iterating over the client
+    (with for or async for), or by registering callbacks that are called for each record
+    as it is decoded. The client never writes to the terminal.
+
+    Every message the server sends carries a sequence number. After a reconnection the client
+    sends the last sequence number it received, and the server replays the messages it missed.
+
+    Messages also carry the compact source id of the vehicle that produced them, so a client
+    connected to something combining several vehicles (such as a relay) can tell them apart.
+    """
+
+    _recvSize = 65536
+
+    def __init__(self, address, useBluetooth=False, connectTimeout=5, socketProfile='default',
+                 autoReconnect=False, minBackoff=0.5, maxBackoff=10, connectNow=True, tagSources=False,
+                 decodeRecords=True, binary=False, compress='auto'):
+        """
+        Constructor
+
+        @param address:        The server address, (host, port) for WiFi, (MAC address, channel)
+                               for Bluetooth, or the socket path for a local Unix domain socket
+        @param useBluetooth:   Flag denoting whether to connect over Bluetooth
+        @param connectTimeout: The time to wait for the connection to be established (seconds)
+        @param socketProfile:  The name of the socket profile applied to WiFi connections (see SOCKET_PROFILES)
+        @param autoReconnect:  Flag denoting whether iterating over the client reconnects when the server
+                               disconnects instead of ending
+        @param minBackoff:     The initial time between reconnection attempts (seconds)
+        @param maxBackoff:     The maximum time between reconnection attempts (seconds)
+        @param connectNow:     Flag denoting whether to connect before returning, otherwise the caller connects later
+        @param tagSources:     Flag denoting whether records are returned as SourcedRecord tuples, tagged with
+                               the source id of the vehicle that sent them (None if the server sent none)
+        @param decodeRecords:  Flag denoting whether to decode messages into records, otherwise every telemetry
+                               message is returned as a RawMessage (e.g. to forward it as received)
+        @param binary:         Flag denoting whether to ask for binary payloads. When numpy is available,
+                               consecutive binary messages of one type are returned as a single SampleBatch,
+                               otherwise each one is decoded into a record.
+        @param compress:       Whether the server compresses the frames it sends, 'auto' to let it decide
+                               (it compresses over Bluetooth), True or False
+
+        @return None
+        """
+
+        self._address = address
+        self._useBluetooth = useBluetooth
+        self._connectTimeout = connectTimeout
+        self._socketProfile = socketProfile
+        self._autoReconnect = autoReconnect
+        self._minBackoff = minBackoff
+        self._maxBackoff = maxBackoff
+        self._backoff = minBackoff
+        self._tagSources = tagSources
+        self._decodeRecords = decodeRecords
+        self._binary = binary
+        self._compress = compress
+        self._decoderClass = FrameDecoder
+
+        if binary:
+            try:
+                import numpy
+
+                self._decoderClass = BatchDecoder
+            except ImportError:
+                pass
+
+        self._sock = None
+        self._decoder = None
+
+        # Callbacks are (record type, callback) tuples, a record type of None matches every record
+        self._callbacks = []
+
+        # Records decoded but not yet returned by the async iterator
+        self._pendingRecords = collections.deque()
+
+        # Message types last subscribed to, restored after a reconnection
+        self._subscribedTypes = None
+
+        # Server session and the last sequence number received in it
+        self.session = None
+        self.lastSeq = None
+
+        # Identity of each vehicle the client heard from, indexed by source id (None for unknown ids)
+        self.sources = []
+
+        self.numBytesReceived = 0
+
+        self.connected = False
+        self.connecting = False
+
+        if connectNow:
+            self.connect()
+
+    def connect(self, blocking=True):
+        """
+        Connects to the server and asks it for sequence numbers and any messages missed since
+        the previous connection
+
+        @param blocking: Flag denoting whether to wait for the connection. Otherwise the connection is only
+                         started and finishConnect is called once the socket is writable (Bluetooth
+                         connections are always waited for).
+
+        @return True if the client is connected, otherwise False (the connection is in progress)
+        """
+
+        address = self._address
+
+        if self._useBluetooth:
+            import bluetooth
+
+            self._sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+
+            blocking = True
+        elif isinstance(address, str):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+            SOCKET_PROFILES[self._socketProfile].apply(self._sock)
+
+        try:
+            if blocking:
+                self._sock.settimeout(self._connectTimeout)
+                self._sock.connect(address)
+            else:
+                self._sock.setblocking(False)
+
+                error = self._sock.connect_ex(address)
+
+                if error in (errno.EINPROGRESS, errno.EAGAIN):
+                    self.connecting = True
+
+                    return False
+
+                if error != 0:
+                    raise OSError(error, os.strerror(error))
+
+            self.__startSession()
+        except BaseException:
+            self._sock.close()
+
+            raise
+
+        return True
+
+    def finishConnect(self):
+        """
+        Completes a connection started without blocking, once the socket is writable
+
+        @param None
+
+        @return None
+        """
+
+        self.connecting = False
+
+        try:
+            error = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+            if error != 0:
+                raise OSError(error, os.strerror(error))
+
+            self.__startSession()
+        except BaseException:
+            self._sock.close()
+
+            raise
+
+    def getReconnectDelay(self):
+        """
+        Retrieves the time to wait before the next reconnection attempt. The wait doubles with
+        every failed attempt, up to the maximum backoff, and starts over once connected.
+
+        @param None
+
+        @return The time to wait (seconds)
+        """
+
+        # Randomize the wait so clients that lost the server together do not return together
+        delay = self._backoff * random.uniform(0.5, 1.5)
+        self._backoff = min(self._backoff * 2, self._maxBackoff)
+
+        return delay
+
+    def reconnect(self, shutdownEvent=None):
+        """
+        Reconnects to the server, retrying with a jittered exponential backoff until it succeeds
+
+        @param shutdownEvent: Event that stops the attempts when set, or None to keep trying
+
+        @return True if the client reconnected, otherwise False (stopped by the shutdown event)
+        """
+
+        self.close()
+
+        while shutdownEvent is None or not shutdownEvent.is_set():
+            try:
+                self.connect()
+
+                return True
+            except OSError:
+                pass
+
+            delay = self.getReconnectDelay()
+
+            if shutdownEvent is None:
+                time.sleep(delay)
+            elif shutdownEvent.wait(delay):
+                break
+
+        return False
+
+    def fileno(self):
+        """
+        Retrieves the socket file descriptor so the client can be used with select
+
+        @param None
+
+        @return The file descriptor
+        """
+
+        return self._sock.fileno()
+
+    def subscribe(self, msgTypes):
+        """
+        Asks the server to only send the specified message types (sensor statuses are always sent)
+
+        @param msgTypes: The message types to receive
+
+        @return None
+        """
+
+        self._subscribedTypes = sorted(msgTypes)
+
+        # Subscriptions are sent on every connect
+        if not self.connected:
+            return
+
+        self._sock.setblocking(True)
+
+        try:
+            self.__sendMsg({'types': self._subscribedTypes}, MessageType.SUBSCRIBE_MESSAGE)
+        finally:
+            self._sock.setblocking(False)
+
+    def addCallback(self, callback, recordType=None):
+        """
+        Registers a callback that is called with every record of the specified type as it is decoded
+
+        @param callback:   The callback, called with the record (a SourcedRecord when tagging sources)
+        @param recordType: The record type (e.g. RPYSample), or None for every record
+
+        @return None
+        """
+
+        self._callbacks.append((recordType, callback))
+
+    def recvRecords(self):
+        """
+        Reads the data available on the socket without blocking and decodes it
+
+        @param None
+
+        @return List of records (empty if no complete message arrived), or None if the server disconnected
+        """
+
+        try:
+            data = self._sock.recv(TelemetryClient._recvSize)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError:
+            data = b''
+
+        return self.__decode(data)
+
+    def poll(self, timeout=None):
+        """
+        Waits for data from the server and decodes it
+
+        @param timeout: The maximum time to wait (seconds), or None to wait indefinitely
+
+        @return List of records (empty if none arrived in time), or None if the server disconnected
+        """
+
+        readyToRead, readyToWrite, inputError = select.select([self._sock], [], [], timeout)
+
+        if not readyToRead:
+            return []
+
+        return self.recvRecords()
+
+    def close(self):
+        """
+        Closes the connection
+
+        @param None
+
+        @return None
+        """
+
+        self.connected = False
+        self.connecting = False
+
+        if self._sock is not None:
+            self._sock.close()
+
+    def __iter__(self):
+        """
+        Iterates over records as they arrive until the server disconnects (or forever
+        when reconnecting automatically)
+
+        @param None
+
+        @return Generator of records
+        """
+
+        while True:
+            records = self.poll()
+
+            if records is None:
+                if self._autoReconnect and self.reconnect():
+                    continue
+
+                return
+
+            for record in records:
+                yield record
+
+    def __aiter__(self):
+        """
+        Iterates over records as they arrive until the server disconnects (async for)
+
+        @param None
+
+        @return The client
+        """
+
+        return self
+
+    async def __anext__(self):
+        """
+        Waits for the next record
+
+        @param None
+
+        @return The next record
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while not self._pendingRecords:
+            if not self.connected:
+                if not self._autoReconnect:
+                    raise StopAsyncIteration
+
+                await loop.run_in_executor(None, self.reconnect)
+
+            # Bluetooth sockets from PyBluez cannot be awaited, so they are read on a worker thread
+            if isinstance(self._sock, socket.socket):
+                try:
+                    data = await loop.sock_recv(self._sock, TelemetryClient._recvSize)
+                except OSError:
+                    data = b''
+
+                records = self.__decode(data)
+            else:
+                records = await loop.run_in_executor(None, self.poll)
+
+            if records is not None:
+                self._pendingRecords.extend(records)
+
+        return self._pendingRecords.popleft()
+
+    def __decode(self, data):
+        """
+        Decodes received data into records and passes each record to the callbacks
+
+        @param data: The received data (empty if the server disconnected)
+
+        @return List of records, or None if the server disconnected
+        """
+
+        if not data:
+            self.connected = False
+
+            return None
+
+        self.numBytesReceived += len(data)
+
+        records = []
+
+        for frame in self._decoder.feed(data):
+            if isinstance(frame, SampleBatch):
+                record = self.__processBatch(frame)
+
+                if record is not None:
+                    records.append(SourcedRecord(self.__getBatchSource(record), record) if self._tagSources else record)
+
+                continue
+
+            msgType, msg, seq, sourceId = frame
+
+            if seq is not None:
+                # Skip messages received before the connection dropped that the server replayed anyway
+                if self.lastSeq is not None and seq <= self.lastSeq:
+                    continue
+
+                self.lastSeq = seq
+
+            if msgType == MessageType.RESUME_MESSAGE:
+                record = self.__processResume(msg)
+            elif msgType == MessageType.HELLO_MESSAGE:
+                record = self.__processHello(msg)
+            elif self._decodeRecords:
+                record = TelemetryClient.decodeRecord(msgType, msg)
+            else:
+                record = RawMessage(msgType, msg)
+
+            if self._tagSources:
+                record = SourcedRecord(sourceId, record)
+
+            records.append(record)
+
+        if self._callbacks:
+            for record in records:
+                # Tagged records are matched on the record they carry
+                untaggedRecord = record.record if self._tagSources else record
+
+                for recordType, callback in self._callbacks:
+                    if recordType is None or isinstance(untaggedRecord, recordType):
+                        callback(record)
+
+        return records
+
+    def __processResume(self, msg):
+        """
+        Processes the server's answer to a resume request
+
+        @param msg: The message (string)
+
+        @return The resume report
+        """
+
+        summary = json.loads(msg)
+
+        # The server restarted, so its sequence numbers start over
+        if summary.get('session') != self.session:
+            self.session = summary.get('session')
+            self.lastSeq = None
+
+        return ResumeReport(summary.get('replayed', 0), summary.get('lost'))
+
+    def __processBatch(self, batch):
+        """
+        Drops the samples of a batch received before the connection dropped that the server replayed anyway
+
+        @param batch: The sample batch
+
+        @return The sample batch, or None if every sample was already received
+        """
+
+        samples = batch.samples
+
+        if 'seq' not in samples.dtype.names:
+            return batch
+
+        if self.lastSeq is not None:
+            samples = samples[samples['seq'] > self.lastSeq]
+
+            if not len(samples):
+                return None
+
+            batch = SampleBatch(batch.msgType, samples)
+
+        self.lastSeq = int(samples['seq'][-1])
+
+        return batch
+
+    @staticmethod
+    def __getBatchSource(batch):
+        """
+        Retrieves the source id of a batch
+
+        @param batch: The sample batch
+
+        @return The source id of the first sample, or None if the frames carried none
+        """
+
+        if 'sourceId' not in batch.samples.dtype.names:
+            return None
+
+        return int(batch.samples['sourceId'][0])
+
+    def __processHello(self, msg):
+        """
+        Processes a vehicle's identity
+
+        @param msg: The message (string)
+
+        @return The vehicle info
+        """
+
+        identity = json.loads(msg)
+
+        vehicleInfo = VehicleInfo(identity.get('vehicleId'), identity.get('sourceId'), identity.get('version'),
+                                  dict((sensor, tuple(msgTypes)) for sensor, msgTypes in identity.get('sensors', {}).items()))
+
+        sourceId = vehicleInfo.sourceId
+
+        if sourceId is not None:
+            if sourceId >= len(self.sources):
+                self.sources.extend([None] * (sourceId + 1 - len(self.sources)))
+
+            self.sources[sourceId] = vehicleInfo
+
+        return vehicleInfo
+
+    def __startSession(self):
+        """
+        Asks the server for sequence numbers, the messages missed since the previous connection and
+        the subscribed message types, then switches the socket to non-blocking reads
+
+        @param None
+
+        @return None
+        """
+
+        self._sock.settimeout(self._connectTimeout)
+
+        # Every decoder unpacks batch and compressed frames
+        self.__sendMsg({'session': self.session, 'seq': self.lastSeq, 'binary': self._binary, 'batch': True,
+                        'compress': self._compress}, MessageType.RESUME_MESSAGE)
+
+        if self._subscribedTypes is not None:
+            self.__sendMsg({'types': self._subscribedTypes}, MessageType.SUBSCRIBE_MESSAGE)
+
+        # Data is read as it arrives and decoded incrementally
+        self._sock.setblocking(False)
+
+        self._decoder = self._decoderClass()
+        self._backoff = self._minBackoff
+
+        self.connected = True
+
+    def __sendMsg(self, msg, msgType):
+        """
+        Sends a request to the server
+
+        @param msg:     The request (dictionary)
+        @param msgType: The type of message
+
+        @return None
+        """
+
+        MessageHandler.sendMsg(self._sock, json.dumps(msg), msgType)
+
+    @staticmethod
+    def decodeRecord(msgType, msg):
+        """
+        Decodes a message into a record
+
+        @param msgType: The type of message
+        @param msg:     The message (string, or bytes for a binary payload)
+
+        @return The record (GPSSample, RPYSample, NMEASentence, SensorStatus,
+                or RawMessage for types the client does not know)
+        """
+
+        if msgType == MessageType.NMEA_MESSAGE:
+            return NMEASentence(msg)
+
+        if msgType not in (MessageType.GPS_MESSAGE, MessageType.RPY_MESSAGE, MessageType.STATUS_MESSAGE):
+            return RawMessage(msgType, msg)
+
+        if isinstance(msg, bytes):
+            return TelemetryClient.__createSample(msgType, BinaryPayload.decode(msgType, msg))
+
+        data = json.loads(msg)
+
+        if msgType == MessageType.GPS_MESSAGE:
+            return GPSSample(*[data.get(field) for field in GPSSample._fields])
+
+        if msgType == MessageType.RPY_MESSAGE:
+            return RPYSample(data.get('roll'), data.get('pitch'), data.get('yaw'), data.get('status', 'ok'))
+
+        return SensorStatus(data.get('sensor'), data.get('state'))
+
+    @staticmethod
+    def decodeBatchSample(batch, index=-1):
+        """
+        Decodes one sample of a batch into a record (e.g. the newest one, to display it)
+
+        @param batch: The sample batch
+        @param index: The index of the sample
+
+        @return The record (GPSSample or RPYSample)
+        """
+
+        sample = batch.samples[index]
+
+        return TelemetryClient.__createSample(batch.msgType, dict((name, float(sample[name]))
+                                                                  for name in BinaryPayload.fields[batch.msgType]))
+
+    @staticmethod
+    def __createSample(msgType, data):
+        """
+        Creates the record of a binary payload
+
+        @param msgType: The type of message
+        @param data:    Dictionary of payload field name to value (see BinaryPayload)
+
+        @return The record (GPSSample or RPYSample)
+        """
+
+        record = {}
+
+        for name, value in data.items():
+            if name == 'status':
+                record[name] = BinaryPayload.statusName(value)
+            elif name == 'time':
+                record[name] = BinaryPayload.formatTime(value)
+            else:
+                # Unknown values are NaN, which is the only value not equal to itself
+                record[name] = None if value != value else value
+
+        if msgType == MessageType.GPS_MESSAGE:
+            return GPSSample(*[record.get(field) for field in GPSSample._fields])
+
+        return RPYSample(record.get('roll'), record.get('pitch'), record.get('yaw'), record['status'])
@@ -0,0 +1,429 @@
+# Python Modules
+import argparse
+import os
+import queue
+import signal
+import threading
+import time
+
+# Project Modules
+from batch_decoder import SampleBatch
+from message_handler import BinaryPayload, MessageType
+from record_writers import CsvWriter, GeoJsonWriter, NpyWriter
+from telemetry_client import GPSSample, RPYSample, TelemetryClient
+
+# Globals
+keepRunning = True
+
+# Columns recorded for each record type, as (name, numpy type) tuples. Every record is stamped
+# with the time it was received (seconds since the epoch), unknown values are NaN.
+RECORD_COLUMNS = {
+    'gps': [('recvTime', '<f8'), ('time', '<f8'), ('lat', '<f8'), ('lon', '<f8'), ('alt', '<f8'), ('speed', '<f8'),
+            ('climb', '<f8'), ('epx', '<f8'), ('epy', '<f8'), ('epv', '<f8')],
+    'rpy': [('recvTime', '<f8'), ('roll', '<f8'), ('pitch', '<f8'), ('yaw', '<f8'), ('status', '|S16')],
+}
+
+# File formats, and the record types each one is written for (GeoJSON only holds positions)
+RECORD_FORMATS = {
+    'npy': ('gps', 'rpy'),
+    'csv': ('gps', 'rpy'),
+    'geojson': ('gps',),
+}
+
+class RecordingWriter(threading.Thread):
+    """
+    Writes batches of records to disk in the background, so file I/O never holds up the
+    socket reads
+    """
+
+    def __init__(self, outputDir, formats):
+        """
+        Constructor
+
+        @param outputDir: The directory the files are written to (created if needed)
+        @param formats:   The file formats to write (see RECORD_FORMATS)
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        self._batches = queue.Queue()
+
+        os.makedirs(outputDir, exist_ok=True)
+
+        # Writers for each record type, one per format
+        self._writers = dict((recordType, []) for recordType in RECORD_COLUMNS)
+
+        for fileFormat in formats:
+            for recordType in RECORD_FORMATS[fileFormat]:
+                path = os.path.join(outputDir, '%s.%s' % (recordType, fileFormat))
+                columns = RECORD_COLUMNS[recordType]
+
+                if fileFormat == 'npy':
+                    writer = NpyWriter(path, columns)
+                elif fileFormat == 'csv':
+                    writer = CsvWriter(path, [name for name, npyType in columns])
+                else:
+                    writer = GeoJsonWriter(path, [name for name, npyType in columns])
+
+                self._writers[recordType].append(writer)
+
+    def write(self, batch):
+        """
+        Queues a batch of records to be written
+
+        @param batch: List of (receive time, record) tuples
+
+        @return None
+        """
+
+        self._batches.put(batch)
+
+    def stop(self):
+        """
+        Writes every queued batch, closes the files and stops the thread
+
+        @param None
+
+        @return None
+        """
+
+        self._batches.put(None)
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        while True:
+            batch = self._batches.get()
+
+            if batch is None:
+                break
+
+            self.__writeBatch(batch)
+
+        # Cleanup
+        self.__shutdown()
+
+    def __writeBatch(self, batch):
+        """
+        Converts a batch of records to rows and writes them in every format
+
+        @param batch: List of (receive time, record) tuples
+
+        @return None
+        """
+
+        rows = dict((recordType, []) for recordType in RECORD_COLUMNS)
+
+        for recvTime, record in batch:
+            if isinstance(record, SampleBatch):
+                recordType = 'gps' if record.msgType == MessageType.GPS_MESSAGE else 'rpy'
+
+                # Keep the rows in the order they were received
+                self.__writeRows(recordType, rows[recordType])
+                rows[recordType] = []
+
+                self.__writeSamples(recordType, recvTime, record.samples)
+            elif isinstance(record, GPSSample):
+                rows['gps'].append((recvTime, BinaryPayload.parseTime(record.time), RecordingWriter.__toFloat(record.lat),
+                                    RecordingWriter.__toFloat(record.lon), RecordingWriter.__toFloat(record.alt),
+                                    RecordingWriter.__toFloat(record.speed), RecordingWriter.__toFloat(record.climb),
+                                    RecordingWriter.__toFloat(record.epx), RecordingWriter.__toFloat(record.epy),
+                                    RecordingWriter.__toFloat(record.epv)))
+            elif isinstance(record, RPYSample):
+                rows['rpy'].append((recvTime, RecordingWriter.__toFloat(record.roll), RecordingWriter.__toFloat(record.pitch),
+                                    RecordingWriter.__toFloat(record.yaw), str(record.status)[:16]))
+
+        for recordType, recordRows in rows.items():
+            self.__writeRows(recordType, recordRows)
+
+    def __writeRows(self, recordType, rows):
+        """
+        Writes rows in every format
+
+        @param recordType: The record type ('gps' or 'rpy')
+        @param rows:       List of rows (tuples of values in column order)
+
+        @return None
+        """
+
+        if rows:
+            for writer in self._writers[recordType]:
+                writer.write(rows)
+
+    def __writeSamples(self, recordType, recvTime, samples):
+        """
+        Writes the samples of a batch in every format. The newest sample is stamped with the time
+        the batch was received and the others keep their spacing from the sensor sample times.
+
+        @param recordType: The record type ('gps' or 'rpy')
+        @param recvTime:   The time the batch was received (seconds since the epoch)
+        @param samples:    Structured array of samples (see SampleBatch)
+
+        @return None
+        """
+
+        import numpy
+
+        writers = self._writers[recordType]
+
+        if not writers:
+            return
+
+        columns = numpy.zeros(len(samples), RECORD_COLUMNS[recordType])
+        columns['recvTime'] = recvTime - (samples['sampleTime'][-1] - samples['sampleTime'])
+
+        for name in columns.dtype.names:
+            if name == 'status':
+                # Binary payloads carry the status as a code
+                columns[name] = [BinaryPayload.statusName(code) for code in samples[name].tolist()]
+            elif name in samples.dtype.names:
+                columns[name] = samples[name]
+
+        rows = None
+
+        for writer in writers:
+            if isinstance(writer, NpyWriter):
+                writer.writeArray(columns)
+            else:
+                if rows is None:
+                    rows = [tuple(value.decode() if isinstance(value, bytes) else value for value in row)
+                            for row in columns.tolist()]
+
+                writer.write(rows)
+
+    @staticmethod
+    def __toFloat(value):
+        """
+        Converts a value to a float
+
+        @param value: The value, or None if it is not known
+
+        @return The value, or NaN if it is not known
+        """
+
+        return float('nan') if value is None else float(value)
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        for writers in self._writers.values():
+            for writer in writers:
+                writer.close()
+
+class TelemetryRecorder(threading.Thread):
+    """
+    Headless client that records the GPS and RPY samples received from a server to disk.
+
+    Records are collected in memory and handed to a background writer every flush period,
+    so the socket is read without ever waiting on the disk.
+    """
+
+    def __init__(self, serverAddress, outputDir, formats=('npy', 'csv', 'geojson'), useBluetooth=False,
+                 flushPeriod=1.0, socketTimeout=5, socketProfile='default', binary=False):
+        """
+        Constructor
+
+        @param serverAddress: The server address, (host, port) for WiFi, (MAC address, channel) for Bluetooth,
+                              or the socket path of the server's Unix domain socket
+        @param outputDir:     The directory the files are written to (created if needed)
+        @param formats:       The file formats to write (see RECORD_FORMATS)
+        @param useBluetooth:  Flag denoting whether to connect over Bluetooth
+        @param flushPeriod:   The time between handing the received records to the writer (seconds)
+        @param socketTimeout: The time to wait for the connection to be established
+        @param socketProfile: The name of the socket profile applied to WiFi connections (see SOCKET_PROFILES)
+        @param binary:        Flag denoting whether to ask for binary payloads, decoded in batches when numpy
+                              is available
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        for fileFormat in formats:
+            if fileFormat not in RECORD_FORMATS:
+                raise ValueError('Unknown recording format: %s' % fileFormat)
+
+        self.shutdownEvent = threading.Event()
+        self._flushPeriod = flushPeriod
+
+        self._telemetryClient = TelemetryClient(serverAddress, useBluetooth=useBluetooth, connectTimeout=socketTimeout,
+                                                socketProfile=socketProfile, connectNow=False, binary=binary)
+
+        # Raw NMEA sentences are not recorded, so the server does not need to send them
+        self._telemetryClient.subscribe([MessageType.GPS_MESSAGE, MessageType.RPY_MESSAGE])
+        self._telemetryClient.addCallback(self.__processRecord, GPSSample)
+        self._telemetryClient.addCallback(self.__processRecord, RPYSample)
+        self._telemetryClient.addCallback(self.__processRecord, SampleBatch)
+
+        self._writer = RecordingWriter(outputDir, formats)
+
+        # Records received since the last flush, as (receive time, record) tuples
+        self._batch = []
+
+        self.numRecorded = 0
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        self._writer.start()
+
+        # Wait for the server rather than fail when it is not reachable yet
+        if self._telemetryClient.reconnect(self.shutdownEvent):
+            print('Connected to server')
+
+        nextFlushTime = time.monotonic() + self._flushPeriod
+
+        while not self.shutdownEvent.is_set():
+            # Read whatever the server sent, which is passed to the record callback
+            if self._telemetryClient.poll(max(nextFlushTime - time.monotonic(), 0)) is None:
+                print('Lost connection to server. Reconnecting.')
+
+                # The server replays what was missed once the connection is back
+                if self._telemetryClient.reconnect(self.shutdownEvent):
+                    print('Reconnected to server')
+
+            if time.monotonic() >= nextFlushTime:
+                self.__flush()
+
+                nextFlushTime = time.monotonic() + self._flushPeriod
+
+        # Cleanup
+        self.__shutdown()
+
+    def __processRecord(self, record):
+        """
+        Collects a record received from the server
+
+        @param record: The record
+
+        @return None
+        """
+
+        self._batch.append((time.time(), record))
+
+    def __flush(self):
+        """
+        Hands the records received since the last flush to the writer
+
+        @param None
+
+        @return None
+        """
+
+        if self._batch:
+            self.numRecorded += sum(len(record.samples) if isinstance(record, SampleBatch) else 1
+                                    for recvTime, record in self._batch)
+
+            self._writer.write(self._batch)
+            self._batch = []
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        self._telemetryClient.close()
+
+        self.__flush()
+
+        self._writer.stop()
+        self._writer.join()
+
+        print('Recorded %d samples' % self.numRecorded)
+
+def loadRecording(outputDir):
+    """
+    Loads the NumPy files of a recording, memory mapped so even long flights load immediately
+
+    @param outputDir: The directory the recording was written to
+
+    @return Dictionary of record type ('gps' or 'rpy') to structured array
+    """
+
+    import numpy
+
+    arrays = {}
+
+    for recordType in RECORD_COLUMNS:
+        path = os.path.join(outputDir, '%s.npy' % recordType)
+
+        if os.path.exists(path):
+            arrays[recordType] = numpy.load(path, mmap_mode='r')
+
+    return arrays
+
+def service_shutdown(signum, fname):
+    """
+    Handles signals (interrupts)
+
+    @param signum: The signal to be handled
+    @param fname:  The callback function name
+
+    @return None
+    """
+
+    global keepRunning
+
+    keepRunning = False
+
+if __name__ == "__main__":
+    # Register a signal handler
+    signal.signal(signal.SIGINT, service_shutdown)
+
+    parser = argparse.ArgumentParser(description='Records the telemetry received from the RPi to disk')
+    parser.add_argument('--host', default='192.168.1.67',
+                        help='The server address (192.168.4.1 on the RPi wireless access point)')
+    parser.add_argument('--port', type=int, default=9000, help='The server port')
+    parser.add_argument('--bluetooth', metavar='MAC', help='Connect over Bluetooth to the specified address instead')
+    parser.add_argument('--channel', type=int, default=5, help='The Bluetooth channel')
+    parser.add_argument('--unix', metavar='PATH', help='Connect to the server\'s Unix domain socket instead')
+    parser.add_argument('--output', default=time.strftime('recording-%Y%m%d-%H%M%S'),
+                        help='The directory the recording is written to')
+    parser.add_argument('--formats', default='npy,csv,geojson',
+                        help='Comma separated file formats (%s)' % ', '.join(sorted(RECORD_FORMATS)))
+    parser.add_argument('--flush-period', type=float, default=1.0, help='The time between writes to disk')
+    parser.add_argument('--binary', action='store_true', help='Ask the server for binary payloads')
+    args = parser.parse_args()
+
+    if args.bluetooth is not None:
+        serverAddress = (args.bluetooth, args.channel)
+    elif args.unix is not None:
+        serverAddress = args.unix
+    else:
+        serverAddress = (args.host, args.port)
+
+    # Start the recorder
+    recorder = TelemetryRecorder(serverAddress, args.output, formats=args.formats.split(','),
+                                 useBluetooth=args.bluetooth is not None, flushPeriod=args.flush_period,
+                                 binary=args.binary)
+    recorder.start()
+
+    # Keep alive
+    while keepRunning:
+        time.sleep(1)
+
+    recorder.shutdownEvent.set()
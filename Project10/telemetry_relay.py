@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Python Modules
+import argparse
+import signal
+import time
+
+# Project Modules
+from socket_profile import SOCKET_PROFILES
+from tcp_server import TCPServer
+
+# Globals
+keepRunning = True
+
+def service_shutdown(signum, fname):
+    """
+    Handles signals (interrupts)
+
+    @param signum: The signal to be handled
+    @param fname:  The callback function name
+
+    @return None
+    """
+
+    global keepRunning
+
+    keepRunning = False
+
+if __name__ == "__main__":
+    # Register a signal handler
+    signal.signal(signal.SIGINT, service_shutdown)
+
+    parser = argparse.ArgumentParser(description='Connects to the RPi once and serves its telemetry to any number of clients')
+    parser.add_argument('--host', default='192.168.1.67',
+                        help='The vehicle address (192.168.4.1 on the RPi wireless access point)')
+    parser.add_argument('--port', type=int, default=9000, help='The vehicle port')
+    parser.add_argument('--bluetooth', metavar='MAC', help='Connect to the vehicle over Bluetooth to the specified address instead')
+    parser.add_argument('--channel', type=int, default=5, help='The Bluetooth channel')
+    parser.add_argument('--listen-address', default='0.0.0.0', help='The address clients connect to')
+    parser.add_argument('--listen-port', type=int, default=9100, help='The port clients connect to')
+    parser.add_argument('--unix', metavar='PATH', help='Also serve clients on this Unix domain socket')
+    parser.add_argument('--multicast', metavar='GROUP', help='Also publish to this multicast group for passive observers')
+    parser.add_argument('--multicast-port', type=int, default=9001, help='The multicast port')
+    parser.add_argument('--socket-profile', default='default', choices=sorted(SOCKET_PROFILES),
+                        help='The socket profile applied to WiFi connections')
+    parser.add_argument('--history', type=int, default=2048, help='The number of recent messages kept for clients that reconnect')
+    parser.add_argument('--send-period', type=float, default=0.1,
+                        help='The time between matching the rates of each client to its link (seconds)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='The maximum number of messages of one type packed into a frame (1 disables batching)')
+    parser.add_argument('--batch-window', type=float, default=0.005,
+                        help='The time between sends to clients (seconds), which bounds how long a message waits')
+    parser.add_argument('--compression-report', type=float, metavar='SECONDS',
+                        help='The time between reports of how well the stream to each compressed client compresses')
+    args = parser.parse_args()
+
+    if args.bluetooth is not None:
+        upstreamAddress = (args.bluetooth, args.channel)
+    else:
+        upstreamAddress = (args.host, args.port)
+
+    # Start the relay, a TCP server that reads from the vehicle instead of sensors
+    tcpServer = TCPServer(wifiAddress=args.listen_address, wifiPort=args.listen_port, useBluetooth=False,
+                          backLog=16, socketProfile=args.socket_profile, multicastGroup=args.multicast,
+                          multicastPort=args.multicast_port, unixSocketPath=args.unix, historySize=args.history,
+                          upstreamAddress=upstreamAddress, upstreamBluetooth=args.bluetooth is not None,
+                          sendPeriod=args.send_period, batchSize=args.batch_size, batchWindow=args.batch_window,
+                          compressionReportPeriod=args.compression_report)
+    tcpServer.start()
+
+    # Keep alive
+    while keepRunning:
+        time.sleep(1)
+
+    tcpServer.shutdownEvent.set()
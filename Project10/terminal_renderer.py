@@ -0,0 +1,134 @@
+# Python Modules
+import sys
+import time
+
+class TerminalRenderer(object):
+    """
+    Draws a screen of text lines on a terminal at a capped frame rate. Each frame only
+    rewrites the part of each line that changed since the previous frame, using cursor
+    addressing, and the whole frame is written to the terminal at once.
+    """
+
+    def __init__(self, layout, maxFps=20, stream=None):
+        """
+        Constructor
+
+        @param layout: Callback returning the current screen as a list of lines
+        @param maxFps: The maximum number of frames drawn per second
+        @param stream: The terminal stream, or None for standard output
+
+        @return None
+        """
+
+        self._layout = layout
+        self._frameInterval = 1.0 / maxFps
+        self._stream = stream or sys.stdout
+
+        # Lines currently on the terminal
+        self._screenLines = []
+
+        self._invalid = False
+        self._lastDrawTime = None
+
+    def clear(self):
+        """
+        Clears the terminal and hides the cursor
+
+        @param None
+
+        @return None
+        """
+
+        self._stream.write('\033[2J\033[?25l')
+        self._stream.flush()
+
+        self._screenLines = []
+
+    def invalidate(self):
+        """
+        Marks the screen as changed, so the next frame redraws it
+
+        @param None
+
+        @return None
+        """
+
+        self._invalid = True
+
+    def getTimeout(self):
+        """
+        Retrieves the time until a pending frame may be drawn
+
+        @param None
+
+        @return The time until the frame is due (seconds), or None if nothing changed
+        """
+
+        if not self._invalid:
+            return None
+
+        if self._lastDrawTime is None:
+            return 0
+
+        return max(self._lastDrawTime + self._frameInterval - time.monotonic(), 0)
+
+    def draw(self, force=False):
+        """
+        Draws a frame if the screen changed and the previous frame is at least one frame interval old
+
+        @param force: Flag denoting whether to draw the frame now regardless of the frame rate
+
+        @return True if a frame was drawn, otherwise False
+        """
+
+        if not force and self.getTimeout() != 0:
+            return False
+
+        self._invalid = False
+        self._lastDrawTime = time.monotonic()
+
+        lines = self._layout()
+        output = []
+
+        for row, line in enumerate(lines):
+            oldLine = self._screenLines[row] if row < len(self._screenLines) else ''
+
+            if line == oldLine:
+                continue
+
+            # Skip the unchanged start of the line
+            column = 0
+            maxColumn = min(len(line), len(oldLine))
+
+            while column < maxColumn and line[column] == oldLine[column]:
+                column += 1
+
+            # Move the cursor (1 based), write the rest of the line and clear anything left over from the old line
+            output.append('\033[%d;%dH%s' % (row + 1, column + 1, line[column:]))
+
+            if len(line) < len(oldLine):
+                output.append('\033[K')
+
+        # Clear lines the new screen no longer has
+        for row in range(len(lines), len(self._screenLines)):
+            output.append('\033[%d;1H\033[K' % (row + 1))
+
+        self._screenLines = list(lines)
+
+        if output:
+            self._stream.write(''.join(output))
+            self._stream.flush()
+
+        return True
+
+    def close(self):
+        """
+        Moves the cursor below the screen and shows it again
+
+        @param None
+
+        @return None
+        """
+
+        self._stream.write('\033[%d;1H\033[?25h' % (len(self._screenLines) + 1))
+        self._stream.flush()
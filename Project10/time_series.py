@@ -0,0 +1,211 @@
+# Python Modules
+import collections
+import time
+
+# Project Modules
+from batch_decoder import SampleBatch
+from message_handler import MessageType
+from telemetry_client import GPSSample, RPYSample
+
+# Optional Modules (only imported when a rolling series is created)
+numpy = None
+
+# Statistics of a channel over a window. Values are NaN when the window holds too few samples.
+SeriesStats = collections.namedtuple('SeriesStats', ('count', 'mean', 'variance', 'min', 'max', 'rate'))
+
+class RollingSeries(object):
+    """
+    Fixed size history of a group of channels sampled together (e.g. the fields of a GPS sample),
+    kept in preallocated NumPy arrays. Appending overwrites the oldest sample in place, and the
+    statistics of every channel are computed together with vectorized operations.
+    """
+
+    def __init__(self, channels, capacity=4096):
+        """
+        Constructor
+
+        @param channels: The channel names
+        @param capacity: The number of samples kept
+
+        @return None
+        """
+
+        global numpy
+
+        import numpy
+
+        self.channels = tuple(channels)
+
+        self._capacity = capacity
+
+        # Sample times and values, one row per sample (unknown values are NaN)
+        self._times = numpy.full(capacity, numpy.nan)
+        self._values = numpy.full((capacity, len(self.channels)), numpy.nan)
+
+        self._index = 0
+
+    def append(self, sampleTime, values):
+        """
+        Adds a sample, replacing the oldest one once the series is full
+
+        @param sampleTime: The time of the sample (seconds)
+        @param values:     The channel values (sequence in channel order, None for unknown values)
+
+        @return None
+        """
+
+        index = self._index
+
+        # Values are converted in place (None becomes NaN)
+        self._times[index] = sampleTime
+        self._values[index] = values
+
+        self._index = (index + 1) % self._capacity
+
+    def extend(self, times, samples):
+        """
+        Adds several samples at once, replacing the oldest ones once the series is full
+
+        @param times:   The times of the samples (array, seconds)
+        @param samples: Structured array with a field for every channel, one element per sample
+
+        @return None
+        """
+
+        # Only the most recent samples fit
+        times = times[-self._capacity:]
+        samples = samples[-self._capacity:]
+
+        index = self._index
+        count = len(times)
+
+        # Samples past the end of the arrays wrap around to the start
+        first = min(count, self._capacity - index)
+        rest = count - first
+
+        self._times[index:index + first] = times[:first]
+        self._times[:rest] = times[first:]
+
+        for column, channel in enumerate(self.channels):
+            self._values[index:index + first, column] = samples[channel][:first]
+            self._values[:rest, column] = samples[channel][first:]
+
+        self._index = (index + count) % self._capacity
+
+    def getStats(self, window, now=None):
+        """
+        Computes the statistics of every channel over the most recent samples
+
+        @param window: The length of the window (seconds)
+        @param now:    The end of the window (seconds), or None for the current monotonic time
+
+        @return Dictionary of channel name to SeriesStats
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        # Samples not yet written have a NaN time, which is never inside the window
+        inWindow = self._times >= now - window
+
+        times = self._times[inWindow][:, numpy.newaxis]
+        values = self._values[inWindow]
+
+        valid = ~numpy.isnan(values)
+        counts = valid.sum(axis=0)
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = numpy.where(valid, values, 0).sum(axis=0) / counts
+            deviations = numpy.where(valid, values - mean, 0)
+            variance = (deviations ** 2).sum(axis=0) / counts
+
+            minimum = numpy.where(valid, values, numpy.inf).min(axis=0, initial=numpy.inf)
+            maximum = numpy.where(valid, values, -numpy.inf).max(axis=0, initial=-numpy.inf)
+
+            # Rate of change is the slope of the least squares line through the window
+            timeDeviations = numpy.where(valid, times - numpy.where(valid, times, 0).sum(axis=0) / counts, 0)
+            rate = (timeDeviations * deviations).sum(axis=0) / (timeDeviations ** 2).sum(axis=0)
+
+        empty = counts == 0
+
+        minimum[empty] = numpy.nan
+        maximum[empty] = numpy.nan
+
+        return dict((channel, SeriesStats(int(counts[column]), float(mean[column]), float(variance[column]),
+                                          float(minimum[column]), float(maximum[column]), float(rate[column])))
+                    for column, channel in enumerate(self.channels))
+
+class TelemetrySeries(object):
+    """
+    Rolling history and statistics of the GPS and RPY channels, fed with the records of a
+    TelemetryClient (e.g. registered with TelemetryClient.addCallback). Requires numpy.
+    """
+
+    gpsChannels = ('lat', 'lon', 'alt', 'speed', 'climb')
+    rpyChannels = ('roll', 'pitch', 'yaw')
+
+    def __init__(self, capacity=4096):
+        """
+        Constructor
+
+        @param capacity: The number of samples kept for each channel
+
+        @return None
+        """
+
+        self._gpsSeries = RollingSeries(TelemetrySeries.gpsChannels, capacity)
+        self._rpySeries = RollingSeries(TelemetrySeries.rpyChannels, capacity)
+
+    def addRecord(self, record):
+        """
+        Adds the channel values of a record, stamped with the time it is added
+
+        @param record: The record (records other than GPS and RPY samples and batches are ignored)
+
+        @return None
+        """
+
+        if isinstance(record, SampleBatch):
+            self.__addBatch(record)
+        elif isinstance(record, GPSSample):
+            self._gpsSeries.append(time.monotonic(), (record.lat, record.lon, record.alt, record.speed, record.climb))
+        elif isinstance(record, RPYSample):
+            self._rpySeries.append(time.monotonic(), (record.roll, record.pitch, record.yaw))
+
+    def __addBatch(self, batch):
+        """
+        Adds the samples of a batch. The newest sample is stamped with the time it is added and the
+        others keep their spacing from the sensor sample times.
+
+        @param batch: The sample batch
+
+        @return None
+        """
+
+        if batch.msgType == MessageType.GPS_MESSAGE:
+            series = self._gpsSeries
+        elif batch.msgType == MessageType.RPY_MESSAGE:
+            series = self._rpySeries
+        else:
+            return
+
+        sampleTimes = batch.samples['sampleTime']
+        times = time.monotonic() - (sampleTimes[-1] - sampleTimes)
+
+        series.extend(times, batch.samples)
+
+    def getStats(self, window):
+        """
+        Computes the statistics of every channel over the most recent samples
+
+        @param window: The length of the window (seconds)
+
+        @return Dictionary of channel name to SeriesStats
+        """
+
+        now = time.monotonic()
+
+        stats = self._gpsSeries.getStats(window, now)
+        stats.update(self._rpySeries.getStats(window, now))
+
+        return stats
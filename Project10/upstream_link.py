@@ -0,0 +1,134 @@
+# Python Modules
+import json
+import threading
+
+# Project Modules
+from message_handler import MessageType
+from telemetry_client import RawMessage, ResumeReport, TelemetryClient, VehicleInfo
+
+class UpstreamLink(threading.Thread):
+    """
+    Relays the telemetry of a vehicle, received over a single client connection, onto a ring
+    buffer. Takes the place of the sensors when the server runs as a relay, so the vehicle sends
+    each message once however many clients the relay serves.
+
+    Messages are forwarded as received, without decoding them. Connections that drop are
+    resumed, so the vehicle replays whatever the relay missed.
+    """
+
+    # Time between checks for room in a full ring buffer (seconds)
+    _drainWait = 0.01
+
+    def __init__(self, ringBuffer, address, useBluetooth=False, socketProfile='default', identityCallback=None,
+                 selectTimeout=1):
+        """
+        Constructor
+
+        @param ringBuffer:       The ring buffer to place the vehicle's messages on
+        @param address:          The vehicle address, (host, port) for WiFi, (MAC address, channel)
+                                 for Bluetooth, or the socket path of a local Unix domain socket
+        @param useBluetooth:     Flag denoting whether to connect over Bluetooth
+        @param socketProfile:    The name of the socket profile applied to WiFi connections (see SOCKET_PROFILES)
+        @param identityCallback: Callback called with the vehicle identity (dictionary) when the vehicle
+                                 reports it, or None
+        @param selectTimeout:    The maximum time to wait for data (seconds)
+
+        @return None
+        """
+
+        threading.Thread.__init__(self)
+
+        self.shutdownEvent = threading.Event()
+
+        self._ringBuffer = ringBuffer
+        self._address = address
+        self._identityCallback = identityCallback
+        self._selectTimeout = selectTimeout
+
+        self._client = TelemetryClient(address, useBluetooth=useBluetooth, socketProfile=socketProfile,
+                                       connectNow=False, decodeRecords=False)
+
+        # Latest status of each sensor, taken from the status messages of the vehicle
+        self._sensorStatuses = {}
+
+    def getSensorStatuses(self):
+        """
+        Retrieves the status of every sensor on the vehicle
+
+        @param None
+
+        @return List of sensor statuses (dictionaries)
+        """
+
+        return list(self._sensorStatuses.values())
+
+    def run(self):
+        """
+        Overriden method called when the thread is started
+
+        @param None
+
+        @return None
+        """
+
+        while not self.shutdownEvent.is_set():
+            if not self._client.connected:
+                if not self._client.reconnect(self.shutdownEvent):
+                    break
+
+                print('Connected to vehicle %s' % (self._address,))
+
+            records = self._client.poll(self._selectTimeout)
+
+            if records is None:
+                print('Lost connection to vehicle %s. Reconnecting.' % (self._address,))
+
+                continue
+
+            for record in records:
+                self.__processRecord(record)
+
+        # Cleanup
+        self.__shutdown()
+
+    def __processRecord(self, record):
+        """
+        Forwards a record received from the vehicle
+
+        @param record: The record
+
+        @return None
+        """
+
+        if isinstance(record, RawMessage):
+            if record.msgType == MessageType.STATUS_MESSAGE:
+                sensorStatus = json.loads(record.msg)
+
+                self._sensorStatuses[sensorStatus['sensor']] = sensorStatus
+
+            # Wait for the sender to drain a full ring buffer rather than drop messages. The vehicle
+            # connection is not read meanwhile, so TCP flow control slows the vehicle down.
+            while self._ringBuffer.isFull() and not self.shutdownEvent.is_set():
+                self.shutdownEvent.wait(UpstreamLink._drainWait)
+
+            self._ringBuffer.put(record.msg, record.msgType)
+        # Clients of the relay see the identity of the vehicle rather than the relay's own
+        elif isinstance(record, VehicleInfo):
+            if self._identityCallback is not None:
+                self._identityCallback(dict(record._asdict()))
+        elif isinstance(record, ResumeReport) and record.lost:
+            print('Vehicle %s no longer held %d messages missed while disconnected' % (self._address, record.lost))
+
+    def __shutdown(self):
+        """
+        Performs shutdown procedures for the thread
+
+        @param None
+
+        @return None
+        """
+
+        self._client.close()
+
+        if self._ringBuffer.numDropped:
+            print('Upstream ring buffer dropped %d messages' % self._ringBuffer.numDropped)
@@ -0,0 +1,605 @@
+import datetime
+import struct
+import time
+import zlib
+
+class MessageType(object):
+    """
+    Enum class that holds the different message types
+    """
+
+    GPS_MESSAGE = 1
+    RPY_MESSAGE = 2
+    NMEA_MESSAGE = 3
+    STATUS_MESSAGE = 4
+
+    # Sent by clients to choose the message types they receive
+    SUBSCRIBE_MESSAGE = 5
+
+    # Sent by clients to receive sequence numbers and the messages missed while disconnected,
+    # answered by the server with a summary of what it is about to replay
+    RESUME_MESSAGE = 6
+
+    # Sent by the server in answer to the resume request, identifies the vehicle (id, source id,
+    # software version and the messages each sensor produces)
+    HELLO_MESSAGE = 7
+
+    # Set in the type of a frame that carries a sequence number
+    SEQUENCED_FLAG = 0x80000000
+
+    # Set in the type of a frame that carries the source id of the vehicle that produced it
+    SOURCE_FLAG = 0x40000000
+
+    # Set in the type of a frame whose payload is the binary encoding of the message (see BinaryPayload)
+    BINARY_FLAG = 0x20000000
+
+    # Set in the type of a frame that packs several messages of the type (see MessageHandler.encodeBatch)
+    BATCH_FLAG = 0x10000000
+
+    # Type of a frame whose payload is compressed frames (see FrameCompressor)
+    COMPRESSED_FLAG = 0x08000000
+
+class BinaryPayload(object):
+    """
+    Fixed layout binary encodings of telemetry messages, sent instead of JSON to clients that
+    ask for them. Every field is a little endian double, starting with the time the sample was
+    taken (seconds since the epoch), and unknown values are NaN. A GPS fix time is sent as seconds
+    since the epoch and a sensor status as its index in statuses.
+    """
+
+    fields = {
+        MessageType.GPS_MESSAGE: ('sampleTime', 'time', 'lat', 'lon', 'alt', 'speed', 'climb', 'epx', 'epy', 'epv'),
+        MessageType.RPY_MESSAGE: ('sampleTime', 'roll', 'pitch', 'yaw', 'status'),
+    }
+
+    statuses = ('ok', 'down')
+
+    formats = dict((msgType, struct.Struct('<%dd' % len(names))) for msgType, names in fields.items())
+
+    @staticmethod
+    def encode(msgType, data, sampleTime):
+        """
+        Encodes a message
+
+        @param msgType:    The type of message
+        @param data:       The message data (dictionary)
+        @param sampleTime: The time the sample was taken (seconds since the epoch)
+
+        @return The encoded payload (bytes), or None if the message type has no binary encoding
+        """
+
+        names = BinaryPayload.fields.get(msgType)
+
+        if names is None:
+            return None
+
+        values = [sampleTime]
+
+        for name in names[1:]:
+            if name == 'status':
+                # As when decoding JSON, a missing status means the sensor works
+                status = data.get(name, 'ok')
+                value = BinaryPayload.statuses.index(status) if status in BinaryPayload.statuses else None
+            elif name == 'time':
+                value = BinaryPayload.parseTime(data.get(name))
+            else:
+                value = data.get(name)
+
+            values.append(float('nan') if value is None else value)
+
+        return BinaryPayload.formats[msgType].pack(*values)
+
+    @staticmethod
+    def parseTime(value):
+        """
+        Converts a GPS time (ISO 8601, e.g. 2020-06-01T12:00:00.000Z) to seconds since the epoch
+
+        @param value: The GPS time, or None if it is not known
+
+        @return The time (seconds), or NaN if it is not known
+        """
+
+        try:
+            return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except (AttributeError, ValueError):
+            return float('nan')
+
+    @staticmethod
+    def formatTime(value):
+        """
+        Converts seconds since the epoch to a GPS time (ISO 8601, e.g. 2020-06-01T12:00:00.000Z)
+
+        @param value: The time (seconds), or NaN if it is not known
+
+        @return The GPS time, or None if it is not known
+        """
+
+        # NaN is the only value not equal to itself
+        if value != value:
+            return None
+
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).isoformat(
+            timespec='milliseconds').replace('+00:00', 'Z')
+
+    @staticmethod
+    def statusName(code):
+        """
+        Retrieves the sensor status sent as a code
+
+        @param code: The status code (float)
+
+        @return The status, or 'unknown' if the code is not known
+        """
+
+        # NaN fails every comparison
+        if not 0 <= code < len(BinaryPayload.statuses) or int(code) != code:
+            return 'unknown'
+
+        return BinaryPayload.statuses[int(code)]
+
+    @staticmethod
+    def decode(msgType, payload):
+        """
+        Decodes a message
+
+        @param msgType: The type of message
+        @param payload: The encoded payload (bytes)
+
+        @return Dictionary of field name to value
+        """
+
+        return dict(zip(BinaryPayload.fields[msgType], BinaryPayload.formats[msgType].unpack(payload)))
+
+class FrameDecoder(object):
+    """
+    Incrementally decodes frames from a byte stream, so messages can be read
+    off of a non-blocking socket as data arrives
+    """
+
+    _headerFormat = struct.Struct('!II')
+    _seqFormat = struct.Struct('!Q')
+    _sourceFormat = struct.Struct('!H')
+    _lengthFormat = struct.Struct('!I')
+
+    def __init__(self):
+        """
+        Constructor
+
+        @param None
+
+        @return None
+        """
+
+        self._buf = bytearray()
+
+        # Created when the first compressed frame arrives, the stream is compressed as a whole
+        self._decompressor = None
+
+    def feed(self, data):
+        """
+        Adds received data and decodes every frame it completes
+
+        @param data: The received data (bytes)
+
+        @return List of (msgType, msg, seq, sourceId) tuples, oldest first (seq and
+                sourceId are None for frames that do not carry them, msg is bytes
+                for binary payloads)
+        """
+
+        self._buf += data
+
+        msgs = []
+        offset = 0
+
+        while True:
+            frame = self._decodeFrame(offset)
+
+            if frame is None:
+                break
+
+            frameMsgs, offset = frame
+            msgs.extend(frameMsgs)
+
+        # Keep the start of the next frame
+        del self._buf[:offset]
+
+        return msgs
+
+    def _decodeFrame(self, offset):
+        """
+        Decodes the frame at the specified offset of the buffer
+
+        @param offset: The offset of the frame
+
+        @return Tuple (list of (msgType, msg, seq, sourceId) tuples, offset of the next frame), or None
+                if the frame is not complete yet (batch frames hold several messages, others one)
+        """
+
+        if len(self._buf) - offset < FrameDecoder._headerFormat.size:
+            return None
+
+        msgSize, msgType = FrameDecoder._headerFormat.unpack_from(self._buf, offset)
+
+        headerSize = FrameDecoder._headerFormat.size
+
+        # Each message of a batch carries its own sequence number
+        if msgType & MessageType.SEQUENCED_FLAG and not msgType & MessageType.BATCH_FLAG:
+            headerSize += FrameDecoder._seqFormat.size
+
+        if msgType & MessageType.SOURCE_FLAG:
+            headerSize += FrameDecoder._sourceFormat.size
+
+        if len(self._buf) - offset - headerSize < msgSize:
+            return None
+
+        seq = None
+        sourceId = None
+        fieldOffset = offset + FrameDecoder._headerFormat.size
+
+        if msgType & MessageType.SEQUENCED_FLAG and not msgType & MessageType.BATCH_FLAG:
+            seq, = FrameDecoder._seqFormat.unpack_from(self._buf, fieldOffset)
+            fieldOffset += FrameDecoder._seqFormat.size
+
+        if msgType & MessageType.SOURCE_FLAG:
+            sourceId, = FrameDecoder._sourceFormat.unpack_from(self._buf, fieldOffset)
+
+        start = offset + headerSize
+
+        # The frames the compressed data holds replace it, and are decoded next
+        if msgType & MessageType.COMPRESSED_FLAG:
+            if self._decompressor is None:
+                self._decompressor = zlib.decompressobj()
+
+            self._buf[offset:start + msgSize] = self._decompressor.decompress(self._buf[start:start + msgSize])
+
+            return [], offset
+
+        if msgType & MessageType.BATCH_FLAG:
+            return self.__decodeBatch(msgType, sourceId, start, msgSize), start + msgSize
+
+        msg = self._buf[start:start + msgSize]
+        msg = bytes(msg) if msgType & MessageType.BINARY_FLAG else msg.decode()
+
+        msgType &= ~(MessageType.SEQUENCED_FLAG | MessageType.SOURCE_FLAG | MessageType.BINARY_FLAG)
+
+        return [(msgType, msg, seq, sourceId)], start + msgSize
+
+    def __decodeBatch(self, typeWord, sourceId, start, size):
+        """
+        Decodes the messages packed into a batch frame
+
+        @param typeWord: The message type and flags of the frame
+        @param sourceId: The source id of the frame, or None
+        @param start:    The offset of the first message in the buffer
+        @param size:     The size of the messages (bytes)
+
+        @return List of (msgType, msg, seq, sourceId) tuples
+        """
+
+        msgType = typeWord & ~(MessageType.SEQUENCED_FLAG | MessageType.SOURCE_FLAG | MessageType.BINARY_FLAG |
+                               MessageType.BATCH_FLAG)
+        binary = typeWord & MessageType.BINARY_FLAG
+
+        msgs = []
+        offset = start
+
+        while offset < start + size:
+            seq = None
+
+            if typeWord & MessageType.SEQUENCED_FLAG:
+                seq, = FrameDecoder._seqFormat.unpack_from(self._buf, offset)
+                offset += FrameDecoder._seqFormat.size
+
+            # Binary payloads have a fixed length, others are preceded by theirs
+            if binary:
+                msgSize = BinaryPayload.formats[msgType].size
+            else:
+                msgSize, = FrameDecoder._lengthFormat.unpack_from(self._buf, offset)
+                offset += FrameDecoder._lengthFormat.size
+
+            msg = self._buf[offset:offset + msgSize]
+            msgs.append((msgType, bytes(msg) if binary else msg.decode(), seq, sourceId))
+
+            offset += msgSize
+
+        return msgs
+
+class FrameCompressor(object):
+    """
+    Compresses the frames sent on a connection with a single zlib stream, so the repeated keys and
+    near identical values of consecutive messages compress against each other. Every call flushes
+    the stream, so the receiver can decode the frames as soon as they arrive.
+    """
+
+    def __init__(self, level=6):
+        """
+        Constructor
+
+        @param level: The zlib compression level (1 is fastest, 9 compresses most)
+
+        @return None
+        """
+
+        self._compressor = zlib.compressobj(level)
+
+        self.numRawBytes = 0
+        self.numCompressedBytes = 0
+
+        # CPU time spent compressing (seconds)
+        self.cpuTime = 0
+
+    def compress(self, frames):
+        """
+        Compresses frames into a single compressed frame
+
+        @param frames: List of encoded frames (bytes)
+
+        @return The compressed frame (bytes)
+        """
+
+        startTime = time.thread_time()
+
+        data = b''.join(frames)
+        compressedData = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        self.cpuTime += time.thread_time() - startTime
+
+        self.numRawBytes += len(data)
+        self.numCompressedBytes += len(compressedData)
+
+        return struct.pack('!II', len(compressedData), MessageType.COMPRESSED_FLAG) + compressedData
+
+    def getRatio(self):
+        """
+        Retrieves the compression ratio so far
+
+        @param None
+
+        @return The number of raw bytes per compressed byte, or None if nothing was compressed
+        """
+
+        if not self.numCompressedBytes:
+            return None
+
+        return self.numRawBytes / self.numCompressedBytes
+
+class MessageHandler():
+    """
+    Class used to send and receive messages over a socket
+    """
+
+    _msgTimeout = 10
+
+    # Maximum number of buffers passed to a single sendmsg call (below the usual IOV_MAX of 1024)
+    _maxSendBuffers = 512
+
+    @staticmethod
+    def sendMsg(sock, msg, msgType):
+        """
+        Sends a message on the specified socket
+
+        @param sock:    The socket to send the message on
+        @param msg:     The message (string)
+        @param msgType: The type of message being sent
+
+        @return None
+        """
+
+        sock.sendall(MessageHandler.encodeMsg(msg, msgType))
+
+    @staticmethod
+    def sendFrames(sock, frames):
+        """
+        Sends several encoded frames on the specified socket, using a single
+        scatter-gather sendmsg call where the socket supports it
+
+        @param sock:   The socket to send the frames on
+        @param frames: List of encoded frames (bytes)
+
+        @return None
+        """
+
+        # Bluetooth sockets do not support sendmsg
+        if not hasattr(sock, 'sendmsg'):
+            sock.sendall(b''.join(frames))
+
+            return
+
+        buffers = [memoryview(frame) for frame in frames]
+
+        while buffers:
+            numBytesSent = sock.sendmsg(buffers[:MessageHandler._maxSendBuffers])
+
+            # Drop whatever was sent and retry with the remainder
+            while buffers and numBytesSent >= len(buffers[0]):
+                numBytesSent -= len(buffers[0])
+                buffers.pop(0)
+
+            if buffers and numBytesSent:
+                buffers[0] = buffers[0][numBytesSent:]
+
+    @staticmethod
+    def encodeMsg(msg, msgType, seq=None, sourceId=None):
+        """
+        Encodes a message into a frame so it can be sent to any number of sockets
+
+        @param msg:      The message (string, or bytes for a binary payload)
+        @param msgType:  The type of message being encoded
+        @param seq:      The sequence number carried after the header, or None for a plain frame
+        @param sourceId: The source id (0-65535) carried after the header (and sequence number), or None
+
+        @return The encoded frame (bytes)
+        """
+
+        if isinstance(msg, bytes):
+            encodedMsg = msg
+            msgType |= MessageType.BINARY_FLAG
+        else:
+            encodedMsg = msg.encode()
+
+        if seq is not None or sourceId is not None:
+            headerFormat = '!II'
+            fields = []
+
+            if seq is not None:
+                headerFormat += 'Q'
+                msgType |= MessageType.SEQUENCED_FLAG
+                fields.append(seq)
+
+            if sourceId is not None:
+                headerFormat += 'H'
+                msgType |= MessageType.SOURCE_FLAG
+                fields.append(sourceId)
+
+            return struct.pack(headerFormat, len(encodedMsg), msgType, *fields) + encodedMsg
+
+        msgSize = struct.pack('!I', len(encodedMsg))
+        packedMsgType = struct.pack('!I', msgType)
+
+        return msgSize + packedMsgType + encodedMsg
+	
+    @staticmethod
+    def encodeBatch(msgs, msgType, seqs=None, sourceId=None):
+        """
+        Encodes several messages of one type into a single batch frame. The frame has one header
+        (and source id), and each message is only preceded by its sequence number and, unless
+        the payloads are binary, its length.
+
+        @param msgs:     List of messages (strings, or bytes for binary payloads, not mixed)
+        @param msgType:  The type of the messages
+        @param seqs:     List of the sequence numbers of the messages, or None
+        @param sourceId: The source id (0-65535) carried after the header, or None
+
+        @return The encoded frame (bytes)
+        """
+
+        binary = isinstance(msgs[0], bytes)
+        parts = []
+
+        for index, msg in enumerate(msgs):
+            if seqs is not None:
+                parts.append(struct.pack('!Q', seqs[index]))
+
+            if not binary:
+                msg = msg.encode()
+                parts.append(struct.pack('!I', len(msg)))
+
+            parts.append(msg)
+
+        encodedMsgs = b''.join(parts)
+
+        msgType |= MessageType.BATCH_FLAG
+
+        if binary:
+            msgType |= MessageType.BINARY_FLAG
+
+        if seqs is not None:
+            msgType |= MessageType.SEQUENCED_FLAG
+
+        if sourceId is not None:
+            return struct.pack('!IIH', len(encodedMsgs), msgType | MessageType.SOURCE_FLAG, sourceId) + encodedMsgs
+
+        return struct.pack('!II', len(encodedMsgs), msgType) + encodedMsgs
+
+    @staticmethod
+    def encodeDatagram(msg, msgType, seq):
+        """
+        Encodes a message into a datagram that carries a sequence number
+
+        @param msg:     The message (string)
+        @param msgType: The type of message being encoded
+        @param seq:     The sequence number of the message within its type
+
+        @return The encoded datagram (bytes)
+        """
+
+        encodedMsg = msg.encode()
+
+        return struct.pack('!III', len(encodedMsg), msgType, seq & 0xFFFFFFFF) + encodedMsg
+
+    @staticmethod
+    def decodeDatagram(data):
+        """
+        Decodes a datagram encoded with encodeDatagram
+
+        @param data: The datagram (bytes)
+
+        @return Returns a tuple (msgType, seq, msg) if a valid datagram
+                was received, otherwise returns None
+        """
+
+        if len(data) < 12:
+            return None
+
+        msgSize, msgType, seq = struct.unpack_from('!III', data)
+
+        if len(data) - 12 != msgSize:
+            return None
+
+        return (msgType, seq, data[12:].decode())
+
+    @staticmethod
+    def recvMsg(sock):
+        """
+        Receives a message on the specified socket
+
+        @param sock: The socket to receive the message on
+
+        @return Returns a tuple (msgType, msg) if a valid message
+                was received, otherwise returns None
+        """
+		
+        # Attempt to read the message size
+        data = MessageHandler.recvAll(sock, 4)
+
+        if data is not None:
+            msgSize, = struct.unpack('!I', data)
+
+            # Attempt to read the message type
+            data = MessageHandler.recvAll(sock, 4)
+
+            if data is not None:
+                msgType, = struct.unpack('!I', data)
+
+                # Attempt to read the message contents
+                data = MessageHandler.recvAll(sock, msgSize)
+
+                if data is not None:
+                    return (msgType, data.decode())
+
+        return None
+
+    @staticmethod
+    def recvAll(sock, numBytesToRead):
+        """
+        Attempts to read the specified number of
+        bytes off of the specified socket
+
+        @param sock:           The socket to receive the message on
+        @param numBytesToRead: The number of bytes that must be read
+
+        @return buf: The buffer containing the data
+        """
+
+        buf = b''
+
+        startTime = time.time()
+
+        while numBytesToRead:
+            # Check to see if a timeout has occurred
+            if time.time() - startTime > MessageHandler._msgTimeout:
+                return None
+
+            try:
+                data = sock.recv(numBytesToRead)
+
+                # Check to see if there is no data to read
+                if not data:
+                    return None
+
+                buf += data
+                numBytesToRead -= len(data)
+            except:
+                pass
+
+        return buf